@@ -1,6 +1,12 @@
 import OA
 import TS
 from gym_tsxoa.envs import PcgrlEnv
+import numpy as np
+import argparse
+import multiprocessing
+import random
+import traceback
+import zlib
 import sys
 import os
 
@@ -43,79 +49,142 @@ for algo in algorithms:
                 "rep": rep
             })
 
-index = int(sys.argv[1])
-size = int(sys.argv[2])
-exp = experiments[index % len(experiments)]
-print(exp)
-algoIndex = algorithms.index(exp["algo"])
-algo = exp["algo"]
-prob = exp["prob"]
-rep = exp["rep"]
-index = int(index / len(experiments))
-
-folder = "output/{}_{}_{}_{}".format(algo, prob, rep, index)
-if not os.path.exists(folder):
-    os.mkdir(folder)
-output = open(os.path.join(folder, "output.csv"), "w")
-if algoIndex < oa_start:
-    output.write("Index, ResultFound, time, score, ResultDepth, MaxDepth, Iterations\n")
-else:
-    output.write("Index, ResultFound, time, score, Generations\n")
-output.close()
-fitness1Folder = "{}/fitness1".format(folder)
-if not os.path.exists(fitness1Folder):
-    os.mkdir(fitness1Folder)
-fitnessLess1Folder = "{}/fitnessLess1".format(folder)
-if not os.path.exists(fitnessLess1Folder):
-    os.mkdir(fitnessLess1Folder)
-
-for i in range(size):
-    if algoIndex < oa_start:
-        env = PcgrlEnv(prob, rep)
-        runner = algorithms_dict[algo](env)
-        if algo == "MCTS":
-            runner.run(env, 60, c_value[prob], roll_value[prob])
-        else:
-            runner.run(env, 60)
-
-        total_time = int(runner.time_out * 1000)
-        output = open(os.path.join(folder, "output.csv"), "a")
-        output.write("{}, {}, {}, {}, {}, {}, {}\n".format(i, runner.best_node.win, total_time, runner.best_node.heuristic, runner.best_node.depth, runner.deep_node.depth, runner.checked_nodes))
-        output.close()
-        if runner.best_node.win:
-            env.set_observation(runner.best_node.obs)
-            image = env._prob.render(env._rep._map)
-            image.save("{}/fitness1/{}.png".format(folder, i), "PNG")
-            f = open("{}/fitness1/{}.txt".format(folder, i), "w")
-            f.write(str(runner.best_node))
-            f.close()
-        else:
-            env.set_observation(runner.best_node.obs)
-            image = env._prob.render(env._rep._map)
-            image.save("{}/fitnessLess1/{}.png".format(folder, i), "PNG")
-            f = open("{}/fitnessLess1/{}.txt".format(folder, i), "w")
-            f.write(str(runner.best_node))
-            f.close()
+ts_header = "Index, ResultFound, time, score, ResultDepth, MaxDepth, Iterations, NodesPerSec, NodesPerGB\n"
+oa_header = "Index, ResultFound, time, score, Generations\n"
+
+# HC comes before oa_start in the grid but it reports its results like the other optimization algorithms
+def is_search(algo):
+    return issubclass(algorithms_dict[algo], TS.TS)
+
+def get_folder(exp, batch):
+    return "output/{}_{}_{}_{}".format(exp["algo"], exp["prob"], exp["rep"], batch)
+
+# every run has its own fixed seed so a run gives the same level no matter which worker runs it or when
+def get_seed(exp, batch, i):
+    return zlib.crc32("{}_{}_{}_{}_{}".format(exp["algo"], exp["prob"], exp["rep"], batch, i).encode())
+
+# the finished runs of a cell with their times (in ms) from the output.csv of the cell
+def read_results(folder):
+    results = {}
+    path = os.path.join(folder, "output.csv")
+    if not os.path.exists(path):
+        return results
+    with open(path) as f:
+        for line in f.readlines()[1:]:
+            values = [v.strip() for v in line.split(",")]
+            if len(values) >= 3 and values[0].isdigit():
+                results[int(values[0])] = int(values[2])
+    return results
+
+def prepare_folder(exp, batch):
+    folder = get_folder(exp, batch)
+    for path in [folder, os.path.join(folder, "fitness1"), os.path.join(folder, "fitnessLess1")]:
+        if not os.path.exists(path):
+            os.makedirs(path)
+    path = os.path.join(folder, "output.csv")
+    header = ts_header if is_search(exp["algo"]) else oa_header
+    if not os.path.exists(path):
+        with open(path, "w") as output:
+            output.write(header)
     else:
+        upgrade_results(path, header)
+    return folder
+
+# an output.csv from before the last columns were added gets the new header and NA in the missing
+# columns of its old rows so the new rows that are added to it have the same columns
+def upgrade_results(path, header):
+    with open(path) as f:
+        lines = f.readlines()
+    columns = [c.strip() for c in header.split(",")]
+    old_columns = [c.strip() for c in lines[0].split(",")] if len(lines) > 0 else []
+    if len(old_columns) >= len(columns) or columns[:len(old_columns)] != old_columns:
+        return
+    rows = [header]
+    for line in lines[1:]:
+        values = [v.strip() for v in line.split(",")]
+        if len(line.strip()) > 0:
+            rows.append(", ".join(values + ["NA"] * (len(columns) - len(values))) + "\n")
+    with open(path, "w") as output:
+        output.writelines(rows)
+
+def save_level(env, folder, i, win, obs, level):
+    env.set_observation(obs)
+    image = env._prob.render(env._rep._map)
+    subfolder = "fitness1" if win else "fitnessLess1"
+    image.save("{}/{}/{}.png".format(folder, subfolder, i), "PNG")
+    f = open("{}/{}/{}.txt".format(folder, subfolder, i), "w")
+    f.write(level)
+    f.close()
+
+# runs a single repetition of a cell inside a worker and returns the row of its output.csv
+def run_experiment(job):
+    exp, batch, i, maxTime = job
+    algo, prob, rep = exp["algo"], exp["prob"], exp["rep"]
+    folder = get_folder(exp, batch)
+    try:
+        seed = get_seed(exp, batch, i)
+        random.seed(seed)
+        np.random.seed(seed)
         env = PcgrlEnv(prob, rep)
+        env.seed(seed)
         runner = algorithms_dict[algo](env)
-        runner.run(env)
-
-        total_time = int(runner.time_out * 1000)
-        output = open(os.path.join(folder, "output.csv"), "a")
-        output.write("{}, {}, {}, {}, {}\n".format(i, runner.get_best().win, total_time, runner.get_best().fitness, runner.gen))
-        output.close()
-        if runner.get_best().win:
-            env.set_observation(runner.get_best().obs)
-            image = env._prob.render(env._rep._map)
-            image.save("{}/fitness1/{}.png".format(folder, i), "PNG")
-            f = open("{}/fitness1/{}.txt".format(folder, i), "w")
-            f.write(str(runner.get_best()))
-            f.close()
+        if is_search(algo):
+            if algo == "MCTS":
+                runner.run(env, maxTime, c_value[prob], roll_value[prob])
+            else:
+                runner.run(env, maxTime)
+            total_time = int(runner.time_out * 1000)
+            nodes_per_sec, nodes_per_gb = runner.get_performance()
+            row = "{}, {}, {}, {}, {}, {}, {}, {}, {}\n".format(i, runner.best_node.win, total_time, runner.best_node.heuristic, runner.best_node.depth, runner.deep_node.depth, runner.checked_nodes, int(nodes_per_sec), int(nodes_per_gb))
+            save_level(env, folder, i, runner.best_node.win, runner.best_node.get_obs(env, True), runner.best_node.to_string(env))
         else:
-            env.set_observation(runner.get_best().obs)
-            image = env._prob.render(env._rep._map)
-            image.save("{}/fitnessLess1/{}.png".format(folder, i), "PNG")
-            f = open("{}/fitnessLess1/{}.txt".format(folder, i), "w")
-            f.write(str(runner.get_best()))
-            f.close()
+            runner.run(env, maxTime)
+            total_time = int(runner.time_out * 1000)
+            best = runner.get_best()
+            row = "{}, {}, {}, {}, {}\n".format(i, best.win, total_time, best.fitness, runner.gen)
+            save_level(env, folder, i, best.win, best.obs, str(best))
+        return folder, row, None
+    except Exception:
+        return folder, None, traceback.format_exc()
+
+# every missing run of the selected cells, the cells that usually take longer go first so the short
+# runs fill the gaps at the end instead of one long run finishing alone
+def get_jobs(cells, size, batch, maxTime):
+    jobs = []
+    for exp in cells:
+        results = read_results(prepare_folder(exp, batch))
+        # runs stop early when they find a solution so the finished runs estimate the rest
+        estimate = np.mean(list(results.values())) if len(results) > 0 else maxTime * 1000
+        for i in range(size):
+            if i not in results:
+                jobs.append((estimate, (exp, batch, i, maxTime)))
+    jobs.sort(key=lambda job: -job[0])
+    return [job for _, job in jobs]
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the experiments grid on a process pool")
+    parser.add_argument("size", type=int, help="the number of runs of every cell")
+    parser.add_argument("--cells", type=int, nargs="*", help="the indices of the cells to run (all of them by default)")
+    parser.add_argument("--batch", type=int, default=0, help="the index at the end of the output folders")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="the number of processes")
+    parser.add_argument("--time", type=float, default=60, help="the time budget of every run in seconds")
+    args = parser.parse_args()
+
+    cells = experiments
+    if args.cells:
+        cells = [experiments[c % len(experiments)] for c in args.cells]
+    jobs = get_jobs(cells, args.size, args.batch, args.time)
+    print("{} runs left in {} cells using {} workers".format(len(jobs), len(cells), args.workers))
+    # a fresh process for every run so a large search tree doesn't stay in the memory of a worker
+    with multiprocessing.Pool(max(1, args.workers), maxtasksperchild=1) as pool:
+        for done, (folder, row, error) in enumerate(pool.imap_unordered(run_experiment, jobs, chunksize=1)):
+            if error is not None:
+                print("{} failed:\n{}".format(folder, error), file=sys.stderr)
+                continue
+            # only this process writes the results so the rows of different runs never mix
+            with open(os.path.join(folder, "output.csv"), "a") as output:
+                output.write(row)
+            print("[{}/{}] {}: {}".format(done + 1, len(jobs), folder, row.strip()))
+
+if __name__ == "__main__":
+    main()
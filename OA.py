@@ -1,5 +1,6 @@
 import math
 import time
+import numpy as np
 
 class Chromosome:
     def __init__(self):
@@ -13,54 +14,31 @@ class Chromosome:
         self.fitness = fitness
         self.win = game_done
 
-    def copy(self):
-        clone = Chromosome()
-        clone.fitness = self.fitness
-        clone.win = self.win
-        clone.obs = {}
-        for k in self.obs:
-            clone.obs[k] = self.obs[k]
-            if hasattr(self.obs[k], 'copy'):
-                clone.obs[k] = clone.obs[k].copy()
-        return clone
-
-    def get_all_neighbors(self, env):
-        neighbors = []
-        actions = env.get_number_action()
-        for a in range(actions):
-            env.set_observation(self.obs)
-            obs, fitness, game_done, done, info = env.step(a, False)
-            c = Chromosome()
-            c.fitness = fitness
-            c.win = game_done
-            c.obs = obs
-            neighbors.append(c)
-        return neighbors
-
-    def get_neighbor(self, env):
-        actions = env.get_number_action()
+    def get_best_neighbor(self, env):
         env.set_observation(self.obs)
-        obs, fitness, game_done, done, info = env.step(env._rep._random.integers(actions), False)
+        fitnesses, wins, dones, _ = env.evaluate_all_actions(False)
+        best, best_fitness = -1, self.get_fitness()
+        for a in range(len(fitnesses)):
+            if fitnesses[a] > best_fitness or (fitnesses[a] == best_fitness and env._rep._random.random() < 0.5):
+                best, best_fitness = a, fitnesses[a]
+        if best < 0:
+            return self
+        obs, fitness, game_done, done, info = env.apply(best, False)
         c = Chromosome()
         c.fitness = fitness
         c.win = game_done
-        c.obs = obs
+        c.obs = env.get_observation(True)
+        env.revert()
         return c
 
-    def crossover(self, env, other):
-        c = self.copy()
-        sx = env._rep._random.integers(self.obs['map'].shape[1])
-        sy = env._rep._random.integers(self.obs['map'].shape[0])
-        ex = max(1, env._rep._random.integers(sx + 1, self.obs['map'].shape[1] + 1))
-        ey = max(1, env._rep._random.integers(sy + 1, self.obs['map'].shape[0] + 1))
-        for y in range(sy, ey):
-            for x in range(sx, ex):
-                c.obs['map'][y][x] = other.obs['map'][y][x]
+    def get_neighbor(self, env):
+        actions = env.get_number_action()
         env.set_observation(self.obs)
-        obs, fitness, game_done, done, info = env.calculate_step()
-        c.obs = obs
+        obs, fitness, game_done, done, info = env.step(env._rep._random.integers(actions), False)
+        c = Chromosome()
         c.fitness = fitness
         c.win = game_done
+        c.obs = obs
         return c
 
     def get_fitness(self):
@@ -74,6 +52,105 @@ class Chromosome:
             result += "\n"
         return result[:-1]
 
+# a population where all the maps are a single (size, height, width) array so the genetic operators
+# work on all the individuals at once and all the new maps of a generation are evaluated together,
+# every individual keeps the cursor of the representation so it is mutated the same way as stepping
+# the environment, point_mutation changes a random tile of every map instead
+class Population:
+    def __init__(self, env, size, point_mutation=False):
+        self.maps = None
+        self.fitness = np.zeros(size)
+        self.wins = np.zeros(size, dtype=bool)
+        self.stats = []
+        self.cursors = []
+        self._num_tiles = len(env._prob.get_tile_types())
+        self._point_mutation = point_mutation
+        self._template = None
+        for i in range(size):
+            obs, fitness, game_done, done, info = env.reset()
+            if self.maps is None:
+                self.maps = np.zeros((size,) + obs['map'].shape, dtype=obs['map'].dtype)
+                self._template = env.get_observation(True)
+            self.maps[i] = obs['map']
+            self.fitness[i] = fitness
+            self.wins[i] = game_done
+            self.stats.append(obs['rep_stats'])
+            self.cursors.append(env._rep.get_cursor())
+
+    def __len__(self):
+        return len(self.fitness)
+
+    # the indices of the best individuals without sorting the whole population
+    def get_best(self, number):
+        if number >= len(self):
+            return np.argsort(-self.fitness, kind='stable')
+        best = np.argpartition(-self.fitness, number - 1)[:number]
+        return best[np.argsort(-self.fitness[best], kind='stable')]
+
+    # pick individuals where the chance of every individual grows linearly with its rank similar to the
+    # old rank selection where the best individual has the highest chance
+    def rank_select(self, env, number):
+        order = np.argsort(-self.fitness, kind='stable')
+        weights = np.arange(len(self), 0, -1, dtype=np.float64)
+        return order[env._rep._random.choice(len(self), size=number, p=weights / weights.sum())]
+
+    # apply a random action of the representation to every map in place starting from its cursor
+    # without calculating any stats as all the maps are evaluated together when they replace others
+    def mutate(self, env, maps, cursors):
+        random = env._rep._random
+        cursors = list(cursors)
+        if self._point_mutation:
+            number, height, width = maps.shape
+            rows = np.arange(number)
+            maps[rows, random.integers(height, size=number), random.integers(width, size=number)] = random.integers(self._num_tiles, size=number)
+            return maps, cursors
+        actions = env.get_number_action()
+        obs = dict(self._template)
+        obs.pop('hash', None)
+        for i in range(len(maps)):
+            obs['map'] = maps[i]
+            env.set_observation(obs, False)
+            env._rep.set_cursor(cursors[i])
+            env.step(random.integers(actions), False, True)
+            cursors[i] = env._rep.get_cursor()
+        return maps, cursors
+
+    # copy a random rectangle from the second parent into the first parent for every pair
+    def crossover(self, env, first, second):
+        random = env._rep._random
+        number, height, width = first.shape
+        sx = random.integers(width, size=number)
+        sy = random.integers(height, size=number)
+        ex = random.integers(sx + 1, width + 1)
+        ey = random.integers(sy + 1, height + 1)
+        xs = np.arange(width)[None, None, :]
+        ys = np.arange(height)[None, :, None]
+        inside = (xs >= sx[:, None, None]) & (xs < ex[:, None, None]) & (ys >= sy[:, None, None]) & (ys < ey[:, None, None])
+        return np.where(inside, second, first)
+
+    # replace some individuals with new maps after evaluating all the new maps together
+    def replace(self, env, indices, maps, cursors):
+        fitness, wins, stats = env.evaluate_maps(maps)
+        self.maps[indices] = maps
+        self.fitness[indices] = fitness
+        self.wins[indices] = wins
+        for i, index in enumerate(indices):
+            self.stats[index] = stats[i]
+            self.cursors[index] = cursors[i]
+
+    def get_chromosome(self, env, index):
+        obs = dict(self._template)
+        obs.pop('hash', None)
+        obs['map'] = self.maps[index].copy()
+        obs['rep_stats'] = self.stats[index]
+        env.set_observation(obs, False)
+        env._rep.set_cursor(self.cursors[index])
+        c = Chromosome()
+        c.obs = env.get_observation(True)
+        c.fitness = self.fitness[index]
+        c.win = self.wins[index]
+        return c
+
 class OA:
     def __init__(self, env):
         pass
@@ -101,14 +178,7 @@ class HC(OA):
     def advance(self, env):
         super().__init__(env)
 
-        neighbors = self._current.get_all_neighbors(env)
-        best = self._current
-        for n in neighbors:
-            if n.get_fitness() > best.get_fitness():
-                best = n
-            elif n.get_fitness() == best.get_fitness() and env._rep._random.random() < 0.5:
-                best = n
-        self._current = best
+        self._current = self._current.get_best_neighbor(env)
 
     def get_best(self):
         return self._current
@@ -137,69 +207,67 @@ class SA(OA):
         return self._current
 
 class ES(OA):
-    def __init__(self, env):
+    def __init__(self, env, point_mutation=False):
         super().__init__(env)
 
         self._mu=10
         self._lambda = 20
-        self._pop = []
-        for i in range(self._mu + self._lambda):
-            self._pop.append(Chromosome())
-            self._pop[-1].random_init(env)
-        self._pop = sorted(self._pop, key=lambda x: x.get_fitness(), reverse=True)
+        self._env = env
+        self._pop = Population(env, self._mu + self._lambda, point_mutation)
+        self._best = None
 
+    # every one of the best mu individuals replaces two of the others with its mutations
     def advance(self, env):
         super().__init__(env)
 
-        for i in range(self._mu):
-            self._pop[self._mu + 2*i] = self._pop[i].get_neighbor(env)
-            self._pop[self._mu + 2*i + 1] = self._pop[i].get_neighbor(env)
-        self._pop = sorted(self._pop, key=lambda x: x.get_fitness(), reverse=True)
+        parents = self._pop.get_best(self._mu)
+        others = np.setdiff1d(np.arange(len(self._pop)), parents)
+        parents = np.repeat(parents, self._lambda // self._mu)
+        children, cursors = self._pop.mutate(env, self._pop.maps[parents], [self._pop.cursors[p] for p in parents])
+        self._pop.replace(env, others, children, cursors)
+        self._best = None
 
     def get_best(self):
-        return self._pop[0]
+        if self._best is None:
+            self._best = self._pop.get_chromosome(self._env, self._pop.get_best(1)[0])
+        return self._best
 
 class GA(OA):
-    def __init__(self, env):
+    def __init__(self, env, point_mutation=False):
         super().__init__(env)
 
         self._size=30
         self._crossover = 0.8
         self._elitism = 1
         self._mutation = 0.05
-        self._pop = []
-        for i in range(self._size):
-            self._pop.append(Chromosome())
-            self._pop[-1].random_init(env)
-        self._pop = sorted(self._pop, key=lambda x: x.get_fitness(), reverse=True)
-
-    def rank_select(self, env):
-        indeces = list(range(1, self._size+1))
-        indeces.reverse()
-        for i in range(1,self._size):
-            indeces[i] = indeces[i] + indeces[i-1]
-        random = env._rep._random.random()
-        for i in range(self._size):
-            if random < indeces[i] / indeces[-1]:
-                return i
-        return self._size - 1
+        self._env = env
+        self._pop = Population(env, self._size, point_mutation)
+        self._best = None
 
     def advance(self, env):
-        new_pop = []
-        for i in range(self._elitism):
-            new_pop.append(self._pop[i].copy())
-        while len(new_pop) < self._size:
-            if env._rep._random.random() < self._crossover:
-                parent1 = self._pop[self.rank_select(env)]
-                parent2 = self._pop[self.rank_select(env)]
-                child = parent1.crossover(env, parent2)
-                if env._rep._random.random() < self._mutation:
-                    child = child.get_neighbor(env)
-                new_pop.append(child)
-            else:
-                parent = self._pop[self.rank_select(env)]
-                new_pop.append(parent.get_neighbor(env))
-        self._pop = sorted(new_pop, key=lambda x: x.get_fitness(), reverse=True)
+        super().__init__(env)
+
+        random = env._rep._random
+        number = self._size - self._elitism
+        elites = self._pop.get_best(self._elitism)
+        parents = self._pop.rank_select(env, number)
+        children = self._pop.maps[parents]
+        # the children of a crossover keep the cursor of the first parent
+        cursors = [self._pop.cursors[p] for p in parents]
+        crossover = random.random(number) < self._crossover
+        if crossover.any():
+            others = self._pop.maps[self._pop.rank_select(env, int(crossover.sum()))]
+            children[crossover] = self._pop.crossover(env, children[crossover], others)
+        mutation = np.flatnonzero(~crossover | (random.random(number) < self._mutation))
+        if len(mutation) > 0:
+            children[mutation], mutated = self._pop.mutate(env, children[mutation], [cursors[i] for i in mutation])
+            for i, cursor in zip(mutation, mutated):
+                cursors[i] = cursor
+        others = np.setdiff1d(np.arange(self._size), elites)
+        self._pop.replace(env, others, children, cursors)
+        self._best = None
 
     def get_best(self):
-        return self._pop[0]
+        if self._best is None:
+            self._best = self._pop.get_chromosome(self._env, self._pop.get_best(1)[0])
+        return self._best
@@ -1,277 +1,394 @@
 import numpy as np
 import random
-from queue import PriorityQueue
 import time
 import math
-
-class Node:
-    def __init__(self, parent):
+import sys
+import multiprocessing
+from collections import OrderedDict
+from gym_tsxoa.envs.frontier import create_frontier
+from gym_tsxoa.envs.rollout import create_policy, simulate, simulate_batch
+
+# every node at a depth that is a multiple of the interval keeps a full observation
+SNAPSHOT_INTERVAL = 8
+
+def _get_map_string(map):
+    result = ""
+    for y in range(map.shape[0]):
+        for x in range(map.shape[1]):
+            result += str(map[y][x])
+        result += "\n"
+    return result[:-1]
+
+class BaseNode:
+    __slots__ = ('parent', 'action', 'depth', 'heuristic', 'leaf', 'win', 'key', 'obs')
+
+    def __init__(self, parent, action=None):
         self.parent = parent
+        self.action = action
         self.depth = 0
         if parent is not None:
             self.depth = self.parent.depth + 1
         self.heuristic = 0
         self.leaf = False
         self.win = False
+        self.key = None
         self.obs = None
 
     def random_init(self, env):
-        obs, heuristic, game_done, done, info = env.reset()
+        self._set_result(*env.reset())
+
+    # start from the current state of the environment instead of a random map
+    def current_init(self, env):
+        self._set_result(*env.calculate_step())
+
+    def _set_result(self, obs, heuristic, game_done, done, info):
         self.obs = obs
+        self.key = obs['key']
         self.heuristic = heuristic
         self.leaf = done
         self.win = game_done
 
-    def expand_children(self, env):
-        if self.leaf:
-            return []
-        number = env.get_number_action()
+    # only nodes that have a snapshot keep their observation, the others replay
+    # their actions starting from the nearest ancestor that has a snapshot
+    def restore(self, env):
+        actions = []
+        current = self
+        while current.obs is None:
+            actions.append(current.action)
+            current = current.parent
+        actions.reverse()
+        env.replay(current.obs, actions)
+
+    def get_actions(self):
+        actions = []
+        current = self
+        while current.parent is not None:
+            actions.append(current.action)
+            current = current.parent
+        actions.reverse()
+        return actions
+
+    def get_obs(self, env, keep=False):
+        if self.obs is not None:
+            return self.obs
+        self.restore(env)
+        obs = env.get_observation(True)
+        if keep:
+            self.obs = obs
+        return obs
+
+    def get_size(self):
+        size = sys.getsizeof(self) + sys.getsizeof(self.key)
+        if self.obs is not None:
+            size += sys.getsizeof(self.obs) + self.obs['map'].nbytes + sys.getsizeof(self.obs['rep_stats'])
+        return size
+
+    def _create_children(self, env, visited, snapshot_interval):
+        self.restore(env)
+        actions, keys = env.prune_actions(visited)
+        if visited is not None:
+            visited.update(keys)
+        snapshot = (self.depth + 1) % snapshot_interval == 0
+        heuristics, wins, dones, observations = env.evaluate_all_actions(True, snapshot, actions)
         children = []
-        for i in range(number):
-            n = Node(self)
-            env.set_observation(self.obs)
-            obs, heuristic, game_done, done, info = env.step(i)
-            n.heuristic = heuristic
-            n.win = game_done
-            n.leaf = done
-            n.obs = obs
-            children.append(n)
+        for i in range(len(actions)):
+            child = self.__class__(self, actions[i])
+            child.key = keys[i]
+            child.heuristic = heuristics[i]
+            child.win = wins[i]
+            child.leaf = dones[i]
+            if snapshot:
+                child.obs = observations[i]
+            children.append(child)
         return children
 
-    def get_key(self,env):
-        env.set_observation(self.obs, False)
-        return env.get_state_key()
-
-    def get_heuristic(self):
-        return self.heuristic
-
-    def __str__(self):
-        result = ""
-        for y in range(self.obs['map'].shape[0]):
-            for x in range(self.obs['map'].shape[1]):
-                result += str(self.obs['map'][y][x])
-            result += "\n"
-        return result[:-1]
-
-    def __lt__(self, other):
-        return self.get_heuristic() > other.get_heuristic()
-
-class MCTSNode:
-    def __init__(self, parent):
-        self.parent = parent
-        self.win = False
-        self.leaf = False
-        self.children = []
-        self.possible_children = None
-        self.depth = 0
-        if parent is not None:
-            self.depth = self.parent.depth + 1
-        self.total_value = 0
-        self.total_visits = 0
-        self.heuristic = 0
-        self.obs = None
-
-    def expand_possible_children(self, env, visited):
-        self.possible_children = []
-        actions = env.get_number_action()
-        for a in range(actions):
-            child = MCTSNode(self)
-            env.set_observation(self.obs)
-            obs, heuristic, game_done, done, info = env.step(a)
-            child.obs = obs
-            child.heuristic = heuristic
-            child.win = game_done
-            child.leaf = done
-            key = child.get_key(env)
-            if key not in visited:
-                visited.add(key)
-                self.possible_children.append(child)
-
-    def random_init(self, env):
-        obs, heuristic, game_done, done, info = env.reset()
-        self.obs = obs
-        self.heuristic = heuristic
-        self.leaf = done
-        self.game_done = game_done
+    # the state has to be restored before creating a single child
+    def _create_child(self, env, action, key, snapshot_interval):
+        snapshot = (self.depth + 1) % snapshot_interval == 0
+        heuristics, wins, dones, observations = env.evaluate_all_actions(True, snapshot, [action])
+        child = self.__class__(self, action)
+        child.key = key
+        child.heuristic = heuristics[0]
+        child.win = wins[0]
+        child.leaf = dones[0]
+        if snapshot:
+            child.obs = observations[0]
+        return child
 
-    def get_ucb(self, c=1):
-        return self.total_value / self.total_visits + c * math.sqrt((2*math.log(self.parent.total_visits))/self.total_visits)
+    def get_key(self, env):
+        return self.key
 
     def get_heuristic(self):
         return self.heuristic
 
-    def select(self, c=1):
-        current = self
-        while current.fully_expanded() and not current.terminal():
-            max_ucb = -1
-            max_child = None
-            for child in current.children:
-                current_ucb = child.get_ucb(c)
-                if max_ucb == -1 or max_ucb < current_ucb:
-                    max_ucb = current_ucb
-                    max_child = child
-            current = max_child
-        return current
-
-    def expand(self):
-        if len(self.possible_children) > 0:
-            child = self.possible_children.pop(np.random.randint(len(self.possible_children)))
-            self.children.append(child)
-            return child
-        return self
-
-    def fully_expanded(self):
-        return self.possible_children is not None and len(self.possible_children) == 0
-
-    def terminal(self):
-        return self.leaf or (self.fully_expanded() and len(self.children) == 0)
-
-    def simulate(self, env, length):
-        env.set_observation(self.obs)
-        actions = env.get_number_action()
-        heuristic = 0
-        for i in range(length):
-            quick = i < length - 1
-            obs, heuristic, game_done, done, info = env.step(env._rep._random.integers(actions), True, quick)
-            if done:
-                break
-        return heuristic
-
-    def backpropagate(self, value):
-        self.total_value += value
-        self.total_visits += 1
-        if self.parent is not None:
-            self.parent.backpropagate(value)
-
-    def get_key(self, env):
-        env.set_observation(self.obs, False)
-        return env.get_state_key()
+    # the map of the node as rows of tile values, the nodes without a snapshot are replayed in env
+    def to_string(self, env):
+        return _get_map_string(self.get_obs(env)['map'])
 
+    # only the nodes with a snapshot have their map, use to_string for the rest
     def __str__(self):
-        result = ""
-        for y in range(self.obs['map'].shape[0]):
-            for x in range(self.obs['map'].shape[1]):
-                result += str(self.obs['map'][y][x])
-            result += "\n"
-        return result[:-1]
-
-class SpecialMCTSNode:
-    def __init__(self, parent):
-        self.parent = parent
-        self.win = False
-        self.leaf = False
-        self.children = []
-        self.possible_children = None
-        self.depth = 0
-        if parent is not None:
-            self.depth = self.parent.depth + 1
-        self.total_value = 0
-        self.total_visits = 0
-        self.min_value = -1
-        self.max_value = -1
-        self.heuristic = 0
-        self.obs = None
+        if self.obs is None:
+            return "<{} at depth {} without a snapshot>".format(self.__class__.__name__, self.depth)
+        return _get_map_string(self.obs['map'])
 
-    def expand_possible_children(self, env, visited):
-        self.possible_children = []
-        actions = env.get_number_action()
-        for a in range(actions):
-            child = SpecialMCTSNode(self)
-            env.set_observation(self.obs)
-            obs, heuristic, game_done, done, info = env.step(a)
-            child.obs = obs
-            child.heuristic = heuristic
-            child.win = game_done
-            child.leaf = done
-            key = child.get_key(env)
-            if key not in visited:
-                visited.add(key)
-                self.possible_children.append(child)
-
-    def random_init(self, env):
-        obs, heuristic, game_done, done, info = env.reset()
-        self.obs = obs
-        self.heuristic = heuristic
-        self.leaf = done
-        self.game_done = game_done
+class Node(BaseNode):
+    __slots__ = ()
 
-    def get_ucb(self, addedConst=0, weightConst = 1):
-        c = addedConst + weightConst * (self.parent.max_value - self.parent.min_value + 1e-6)
-        return self.total_value / self.total_visits + c * math.sqrt((2*math.log(self.parent.total_visits))/self.total_visits)
-
-    def get_heuristic(self):
-        return self.heuristic
-
-    def select(self, addedConst=0, weightConst = 1):
-        current = self
-        while current.fully_expanded() and not current.terminal():
-            max_ucb = -1
-            max_child = None
-            for c in current.children:
-                current_ucb = c.get_ucb(addedConst, weightConst)
-                if max_ucb == -1 or max_ucb < current_ucb:
-                    max_ucb = current_ucb
-                    max_child = c
-            current = max_child
-        return current
-
-    def expand(self):
-        if len(self.possible_children) > 0:
-            child = self.possible_children.pop(np.random.randint(len(self.possible_children)))
-            self.children.append(child)
-            return child
-        return self
-
-    def fully_expanded(self):
-        return self.possible_children is not None and len(self.possible_children) == 0
-
-    def terminal(self):
-        return self.leaf or (self.fully_expanded() and len(self.children) == 0)
-
-    def simulate(self, env, length):
-        env.set_observation(self.obs)
-        actions = env.get_number_action()
-        heuristic = 0
-        for i in range(length):
-            quick = i < length - 1
-            obs, heuristic, game_done, done, info = env.step(env._rep._random.integers(actions), True, quick)
-            if done:
-                break
-        return heuristic
-
-    def backpropagate(self, value, new_value):
-        self.total_value += value
-        self.total_visits += 1
-        if self.fully_expanded():
-            if self.min_value == -1 or self.min_value > new_value:
-                self.min_value = new_value
-            if self.max_value == -1 or self.max_value < new_value:
-                self.max_value = new_value
-        if self.parent is not None:
-            self.parent.backpropagate(value, self.total_value / self.total_visits)
+    def expand_children(self, env, visited=None, snapshot_interval=1):
+        if self.leaf:
+            return []
+        return self._create_children(env, visited, snapshot_interval)
 
-    def get_key(self, env):
-        env.set_observation(self.obs, False)
-        return env.get_state_key()
+    def __lt__(self, other):
+        return self.get_heuristic() > other.get_heuristic()
 
-    def __str__(self):
-        result = ""
-        for y in range(self.obs['map'].shape[0]):
-            for x in range(self.obs['map'].shape[1]):
-                result += str(self.obs['map'][y][x])
-            result += "\n"
-        return result[:-1]
+class MCTSNode(BaseNode):
+    __slots__ = ('index',)
+
+    def __init__(self, parent, action=None):
+        super().__init__(parent, action)
+        self.index = 0
+
+    def get_size(self):
+        return super().get_size() + MCTSTree.node_size
+
+    # a batch bigger than 1 plays that many rollouts from the node and returns their average
+    def simulate(self, env, length, policy=None, batch=1):
+        self.restore(env)
+        if batch > 1:
+            return simulate_batch(env, length, policy, batch)
+        return simulate(env, length, policy)
+
+# the statistics of the tree are kept in arrays indexed by the node index so the children of a node
+# can be scored together. The children are created one at a time when they are needed and with
+# progressive widening a node only gets a new child when max(1, widening * visits^widening_power)
+# is more than the number of its children. With a transposition table the same state reached from
+# different parents is a single node, the values are shared by all the parents while every edge
+# keeps its own visits for the exploration, and the table forgets the least recently used states
+# when it has more than table_size states.
+class MCTSTree:
+    fields = [('visits', np.float64, 0), ('values', np.float64, 0), ('averages', np.float64, 0),
+        ('explore', np.float64, 0), ('parents', np.int64, -1), ('child_count', np.int64, 0),
+        ('untried', np.int64, -1), ('seeds', np.int64, 0), ('leaf', np.bool_, False), ('min_values', np.float64, np.inf),
+        ('max_values', np.float64, -np.inf)]
+    node_size = sum(np.dtype(dtype).itemsize for _, dtype, _ in fields)
+
+    def __init__(self, root, widening=None, widening_power=0.5, table_size=None, capacity=1024):
+        self.nodes = []
+        self.children = []
+        self.edge_ids = []
+        self.edge_visits = np.zeros(capacity)
+        self.edge_count = 0
+        self.table = None
+        self.table_size = table_size
+        if table_size is not None:
+            self.table = OrderedDict()
+        self.number_actions = 0
+        self.widening = widening
+        self.widening_power = widening_power
+        self.capacity = capacity
+        for name, dtype, default in self.fields:
+            setattr(self, name, np.full(capacity, default, dtype=dtype))
+        self._add(root, -1)
+        self._remember(root.key, 0)
+
+    def _grow(self, size):
+        capacity = self.capacity
+        while capacity < size:
+            capacity *= 2
+        if capacity == self.capacity:
+            return
+        for name, dtype, default in self.fields:
+            array = np.full(capacity, default, dtype=dtype)
+            array[:self.capacity] = getattr(self, name)
+            setattr(self, name, array)
+        self.capacity = capacity
+
+    def _add(self, node, parent):
+        index = len(self.nodes)
+        self._grow(index + 1)
+        node.index = index
+        self.leaf[index] = node.leaf
+        self.parents[index] = parent
+        self.nodes.append(node)
+        self.children.append(None)
+        self.edge_ids.append(None)
+        return index
+
+    def _remember(self, key, index):
+        if self.table is None:
+            return
+        self.table[key] = index
+        self.table.move_to_end(key)
+        if len(self.table) > self.table_size:
+            self.table.popitem(last=False)
+
+    # the index of the node of a state from the transposition table, None if it is not in the table
+    def find(self, key):
+        if self.table is None or key not in self.table:
+            return None
+        self.table.move_to_end(key)
+        return self.table[key]
+
+    def has_child(self, index, child):
+        return bool(np.any(self.children[index] == child))
+
+    def generate(self, index, number):
+        self.number_actions = number
+        self.untried[index] = number
+        self.seeds[index] = np.random.randint(2**31)
+        self.children[index] = np.zeros(0, dtype=np.int64)
+        if self.table is not None:
+            self.edge_ids[index] = np.zeros(0, dtype=np.int64)
+
+    # every node tries the actions in the order of a random permutation that is created again from its
+    # seed so the untried actions don't use memory, the actions are marked as tried once they are returned
+    def untried_actions(self, index):
+        number = self.number_actions
+        permutation = np.random.default_rng(self.seeds[index]).permutation(number)
+        while self.untried[index] > 0:
+            self.untried[index] -= 1
+            yield int(permutation[number - self.untried[index] - 1])
+
+    def add_child(self, index, child, visits=0):
+        child_index = self._add(child, index)
+        self._remember(child.key, child_index)
+        self.link(index, child_index, visits)
+        return child_index
+
+    # add an edge from a node to a child that is already in the tree, the edges only keep their visits
+    # when there is a transposition table
+    def link(self, index, child, visits=0):
+        self.children[index] = np.append(self.children[index], child)
+        self.child_count[index] += 1
+        if self.table is not None:
+            if self.edge_count == len(self.edge_visits):
+                self.edge_visits = np.concatenate((self.edge_visits, np.zeros(len(self.edge_visits))))
+            self.edge_visits[self.edge_count] = visits
+            self.edge_ids[index] = np.append(self.edge_ids[index], self.edge_count)
+            self.edge_count += 1
+
+    def get_last_edge(self, index):
+        return int(self.edge_ids[index][-1])
+
+    def get_limit(self, visits):
+        if self.widening is None:
+            return np.inf
+        return max(1, int(self.widening * visits ** self.widening_power))
+
+    def generated(self, index):
+        return self.untried[index] >= 0
+
+    def can_expand(self, index):
+        return self.untried[index] > 0 and self.child_count[index] < self.get_limit(self.visits[index])
+
+    def terminal(self, index):
+        return self.leaf[index] or (self.untried[index] == 0 and self.child_count[index] == 0)
+
+    # c is used as it is when weight_c is None, otherwise it is added to weight_c times the range of the
+    # children values similar to SpecialMCTS. Returns the indices of the nodes on the path and the edges
+    # between them when there is a transposition table.
+    def select(self, c=1, weight_c=None):
+        path = [0]
+        edges = []
+        index = 0
+        while self.generated(index) and not self.can_expand(index) and not self.terminal(index):
+            children = self.children[index]
+            current_c = c
+            if weight_c is not None:
+                spread = self.max_values[index] - self.min_values[index]
+                current_c = c + weight_c * (max(spread, 0) + 1e-6)
+            # the averages and the inverse square roots of the visits are kept updated by backpropagate
+            if self.table is None:
+                explore = self.explore[children]
+            else:
+                edge_ids = self.edge_ids[index]
+                explore = 1 / np.sqrt(self.edge_visits[edge_ids])
+            ucb = self.averages[children] + current_c * math.sqrt(2 * math.log(self.visits[index])) * explore
+            position = int(ucb.argmax())
+            index = int(children[position])
+            path.append(index)
+            if self.table is not None:
+                edges.append(edge_ids[position])
+                # a state that is already on the path ends the selection so it doesn't go around in circles
+                if index in path[:-1]:
+                    break
+        return path, edges
+
+    def _update(self, path, visits, value):
+        visits = self.visits[path] + visits
+        averages = (self.values[path] + value) / visits
+        self.visits[path] = visits
+        self.values[path] += value
+        self.averages[path] = averages
+        self.explore[path] = 1 / np.sqrt(visits)
+        return visits, averages
+
+    # count a rollout that didn't finish yet as a visit with the virtual loss as its value so the next
+    # selections try other paths
+    def add_virtual_loss(self, path, virtual_loss=0, edges=[]):
+        self._update(np.array(path), 1, virtual_loss)
+        self.edge_visits[edges] += 1
+
+    # add the visits and the total value of the same node from another tree
+    def add_statistics(self, index, visits, value):
+        self._update(np.array([index]), visits, value)
+
+    # every node on the path that can't get new children keeps the range of the new averages of its
+    # children and the last node uses its own new average. The virtual loss of the path is replaced
+    # with the value if it is not None.
+    def backpropagate(self, path, value, keep_range=False, virtual_loss=None, edges=[]):
+        if virtual_loss is None:
+            self.edge_visits[edges] += 1
+        path = np.array(path)
+        if virtual_loss is None:
+            visits, averages = self._update(path, 1, value)
+        else:
+            visits, averages = self._update(path, 0, value - virtual_loss)
+        if keep_range:
+            averages = np.concatenate((averages[1:], averages[-1:]))
+            closed = self.untried[path] == 0
+            if self.widening is not None:
+                limits = np.maximum(1, (self.widening * visits ** self.widening_power).astype(np.int64))
+                closed |= self.child_count[path] >= limits
+            path, averages = path[closed], averages[closed]
+            self.min_values[path] = np.minimum(self.min_values[path], averages)
+            self.max_values[path] = np.maximum(self.max_values[path], averages)
 
 class TS:
-    def __init__(self, env):
-        self.root = Node(None)
-        self.root.random_init(env)
+    node_class = Node
+
+    def __init__(self, env, snapshot_interval=SNAPSHOT_INTERVAL, reset=True):
+        self.root = self.node_class(None)
+        if reset:
+            self.root.random_init(env)
+        else:
+            self.root.current_init(env)
         self.best_node = self.root
         self.deep_node = self.root
+        self.snapshot_interval = snapshot_interval
+        self.time_out = 0
+        self.checked_nodes = 0
+        self.generated_nodes = 0
+        self.nodes_memory = self.root.get_size()
 
     def run(self, env, maxTime=60):
         self.checked_nodes = 0
         self.time_out = maxTime
+        self.generated_nodes = 0
+        self.nodes_memory = self.root.get_size()
+
+    def add_nodes(self, nodes):
+        self.generated_nodes += len(nodes)
+        for n in nodes:
+            self.nodes_memory += n.get_size()
+        return nodes
+
+    # the generated nodes per second and per gigabyte of node memory (the snapshots included)
+    def get_performance(self):
+        nodes_per_sec = self.generated_nodes / max(self.time_out, 1e-6)
+        nodes_per_gb = self.generated_nodes / (self.nodes_memory / 2**30)
+        return nodes_per_sec, nodes_per_gb
 
     def get_best(self):
         return self.best_node
@@ -280,151 +397,299 @@ class TS:
         return self.deep_node
 
 class BFS(TS):
-    def __init__(self, env):
-        super().__init__(env)
+    def __init__(self, env, snapshot_interval=SNAPSHOT_INTERVAL):
+        super().__init__(env, snapshot_interval)
 
     def run(self, env, maxTime=60):
         super().run(env, maxTime)
-        visited = set()
+        visited = set([self.root.get_key(env)])
 
         queue = [self.root]
         start_time = time.time()
         while time.time() - start_time < maxTime and len(queue) > 0:
             current = queue.pop(0)
             self.checked_nodes += 1
-            if current.get_key(env) not in visited:
-                if current.get_heuristic() > self.best_node.get_heuristic():
-                    self.best_node = current
-                elif current.get_heuristic() == self.best_node.get_heuristic() and np.random.random() < 0.5:
-                    self.best_node = current
-                if current.depth > self.deep_node.depth:
-                    self.deep_node = current
-                if current.win:
-                    self.best_node = current
-                    self.time_out = time.time() - start_time
-                    return
-                visited.add(current.get_key(env))
-                queue.extend(current.expand_children(env))
+            if current.get_heuristic() > self.best_node.get_heuristic():
+                self.best_node = current
+            elif current.get_heuristic() == self.best_node.get_heuristic() and np.random.random() < 0.5:
+                self.best_node = current
+            if current.depth > self.deep_node.depth:
+                self.deep_node = current
+            if current.win:
+                self.best_node = current
+                self.time_out = time.time() - start_time
+                return
+            # the children are added to visited when they are generated so they are never repeated
+            queue.extend(self.add_nodes(current.expand_children(env, visited, self.snapshot_interval)))
 
 class DFS(TS):
-    def __init__(self, env):
-        super().__init__(env)
+    def __init__(self, env, snapshot_interval=SNAPSHOT_INTERVAL):
+        super().__init__(env, snapshot_interval)
 
     def run(self, env, maxTime=60):
         super().run(env, maxTime)
-        visited = set()
+        visited = set([self.root.get_key(env)])
 
         queue = [self.root]
         start_time = time.time()
         while time.time() - start_time < maxTime and len(queue) > 0:
             current = queue.pop()
             self.checked_nodes += 1
-            if current.get_key(env) not in visited:
-                if current.get_heuristic() > self.best_node.get_heuristic():
-                    self.best_node = current
-                elif current.get_heuristic() == self.best_node.get_heuristic() and np.random.random() < 0.5:
-                    self.best_node = current
-                if current.depth > self.deep_node.depth:
-                    self.deep_node = current
-                if current.win:
-                    self.best_node = current
-                    self.time_out = time.time() - start_time
-                    return
-                visited.add(current.get_key(env))
-                queue.extend(current.expand_children(env))
+            if current.get_heuristic() > self.best_node.get_heuristic():
+                self.best_node = current
+            elif current.get_heuristic() == self.best_node.get_heuristic() and np.random.random() < 0.5:
+                self.best_node = current
+            if current.depth > self.deep_node.depth:
+                self.deep_node = current
+            if current.win:
+                self.best_node = current
+                self.time_out = time.time() - start_time
+                return
+            # the children are added to visited when they are generated so they are never repeated
+            queue.extend(self.add_nodes(current.expand_children(env, visited, self.snapshot_interval)))
 
 class BestFS(TS):
-    def __init__(self, env):
-        super().__init__(env)
+    def __init__(self, env, snapshot_interval=SNAPSHOT_INTERVAL, frontier="heap", beam_size=None):
+        super().__init__(env, snapshot_interval)
+        self.frontier = frontier
+        self.beam_size = beam_size
 
     def run(self, env, maxTime=60):
         super().run(env, maxTime)
-        visited = set()
+        visited = set([self.root.get_key(env)])
 
-        queue = PriorityQueue()
-        queue.put(self.root)
+        queue = create_frontier(self.frontier, self.beam_size)
+        queue.push(-self.root.get_heuristic(), self.root)
         start_time = time.time()
-        while time.time() - start_time < maxTime and queue.qsize() > 0:
-            current = queue.get()
+        while time.time() - start_time < maxTime and len(queue) > 0:
+            current = queue.pop()
             self.checked_nodes += 1
-            if current.get_key(env) not in visited:
-                if current.get_heuristic() > self.best_node.get_heuristic():
-                    self.best_node = current
-                elif current.get_heuristic() == self.best_node.get_heuristic() and np.random.random() < 0.5:
-                    self.best_node = current
-                if current.depth > self.deep_node.depth:
-                    self.deep_node = current
-                if current.win:
-                    self.best_node = current
-                    self.time_out = time.time() - start_time
-                    return
-                visited.add(current.get_key(env))
-                children = current.expand_children(env)
-                for c in children:
-                    queue.put(c)
-
-class SpecialMCTS:
-    def __init__(self, env):
-        self.root = SpecialMCTSNode(None)
-        self.root.random_init(env)
-        self.best_node = self.root
-        self.deep_node = self.root
-        self.time_out = 0
-        self.checked_nodes = 0
-
-    def run(self, env, maxTime=60, rollout=10, addedC=0, multC=1):
-        visited = set()
-        if self.root.win:
-            return
-        self.time_out = maxTime
-        start_time = time.time()
-        while time.time() - start_time < maxTime:
-            current = self.root.select(addedC, multC)
-            if not current.terminal():
-                if current.possible_children == None:
-                    self.checked_nodes += 1
-                    current.expand_possible_children(env, visited)
-                current = current.expand()
             if current.get_heuristic() > self.best_node.get_heuristic():
                 self.best_node = current
+            elif current.get_heuristic() == self.best_node.get_heuristic() and np.random.random() < 0.5:
+                self.best_node = current
             if current.depth > self.deep_node.depth:
                 self.deep_node = current
             if current.win:
                 self.best_node = current
                 self.time_out = time.time() - start_time
                 return
-            value = current.simulate(env, rollout)
-            current.backpropagate(value, (current.total_value+value) / (current.total_visits+1))
-
-class MCTS:
-    def __init__(self, env):
-        self.root = MCTSNode(None)
-        self.root.random_init(env)
-        self.best_node = self.root
-        self.deep_node = self.root
-        self.time_out = 0
-        self.checked_nodes = 0
+            children = self.add_nodes(current.expand_children(env, visited, self.snapshot_interval))
+            for c in children:
+                queue.push(-c.get_heuristic(), c)
+
+# run a whole tree from the current state of a copy of the environment in a worker process for the root parallelization
+def _root_worker(env, seed, maxTime, rollout, c, weight_c, snapshot_interval, widening, widening_power, table_size,
+        rollout_policy, rollout_batch):
+    np.random.seed(seed)
+    env.seed(seed)
+    runner = MCTS(env, snapshot_interval, widening, widening_power, table_size=table_size,
+        rollout_policy=rollout_policy, rollout_batch=rollout_batch, reset=False)
+    runner._search(env, maxTime, rollout, c, weight_c)
+    return runner._get_summary()
+
+_leaf_env = None
+
+def _leaf_worker_init(env):
+    global _leaf_env
+    _leaf_env = env
+
+# run the rollouts of a single node in a worker process for the leaf parallelization
+def _leaf_worker(obs, length, seed, policy, batch):
+    _leaf_env.seed(seed)
+    _leaf_env.set_observation(obs)
+    if batch > 1:
+        return simulate_batch(_leaf_env, length, policy, batch)
+    return simulate(_leaf_env, length, policy)
+
+# parallel can be "root" to run an independent tree in every worker process and merge their root statistics
+# or "leaf" to keep one tree and run a batch of rollouts (one per worker) at the same time using virtual loss.
+# table_size is the maximum number of states in the transposition table, None to keep a tree that drops
+# the children that reach visited states. rollout_policy is a policy name from gym_tsxoa.envs.rollout or a
+# policy object and rollout_batch is the number of rollouts that are averaged for every selected node.
+class MCTS(TS):
+    node_class = MCTSNode
+
+    def __init__(self, env, snapshot_interval=SNAPSHOT_INTERVAL, widening=None, widening_power=0.5,
+            workers=1, parallel="root", virtual_loss=0, table_size=None, rollout_policy="uniform", rollout_batch=1,
+            reset=True):
+        super().__init__(env, snapshot_interval, reset)
+        self.tree = MCTSTree(self.root, widening, widening_power, table_size)
+        self.rollout_policy = create_policy(rollout_policy)
+        self.rollout_batch = rollout_batch
+        self.workers = workers
+        self.parallel = parallel
+        self.virtual_loss = virtual_loss
+        self.iterations = 0
 
     def run(self, env, maxTime=60, c=1, rollout=10):
-        visited = set()
+        self._search(env, maxTime, rollout, c)
+
+    def _search(self, env, maxTime, rollout, c, weight_c=None):
+        visited = set([self.root.get_key(env)])
         if self.root.win:
             return
-        self.time_out = maxTime
+        super().run(env, maxTime)
+        self.iterations = 0
+        if self.workers > 1 and self.parallel == "root":
+            self._search_root(env, maxTime, rollout, c, weight_c)
+            return
         start_time = time.time()
+        if self.workers > 1 and self.parallel == "leaf":
+            self._search_leaf(env, maxTime, rollout, c, weight_c, visited, start_time)
+            return
         while time.time() - start_time < maxTime:
-            current = self.root.select(c)
-            if not current.terminal():
-                if current.possible_children == None:
-                    self.checked_nodes += 1
-                    current.expand_possible_children(env, visited)
-                current = current.expand()
-            if current.get_heuristic() > self.best_node.get_heuristic():
-                self.best_node = current
-            if current.depth > self.deep_node.depth:
-                self.deep_node = current
-            if current.win:
-                self.best_node = current
+            selected = self._select(env, c, weight_c, visited)
+            if selected is None:
                 self.time_out = time.time() - start_time
                 return
-            value = current.simulate(env, rollout)
-            current.backpropagate(value)
+            path, edges = selected
+            value = self.tree.nodes[path[-1]].simulate(env, rollout, self.rollout_policy, self.rollout_batch)
+            self.tree.backpropagate(path, value, weight_c is not None, None, edges)
+
+    # select a node and expand it, returns the path to the node that needs a rollout and the edges between
+    # the nodes of the path or None if it is a win
+    def _select(self, env, c, weight_c, visited):
+        self.iterations += 1
+        tree = self.tree
+        path, edges = tree.select(c, weight_c)
+        index = path[-1]
+        if not tree.terminal(index):
+            if not tree.generated(index):
+                self.checked_nodes += 1
+                tree.generate(index, env.get_number_action())
+            child = self._expand(env, index, visited)
+            if child is not None:
+                path.append(child)
+                if tree.table is not None:
+                    edges.append(tree.get_last_edge(index))
+        current = tree.nodes[path[-1]]
+        if current.get_heuristic() > self.best_node.get_heuristic():
+            self.best_node = current
+        if current.depth > self.deep_node.depth:
+            self.deep_node = current
+        if current.win:
+            self.best_node = current
+            return None
+        return path, edges
+
+    # try the untried actions one at a time until one of them leads to a new state or to a state in the
+    # transposition table that is not a child yet, returns the index of the child or None if there are none
+    def _expand(self, env, index, visited):
+        tree = self.tree
+        node = tree.nodes[index]
+        restored = False
+        for action in tree.untried_actions(index):
+            if not restored:
+                node.restore(env)
+                restored = True
+            key = env.get_action_key(action)
+            if tree.table is not None:
+                existing = tree.find(key)
+                if existing is not None:
+                    if existing == index or tree.has_child(index, existing):
+                        continue
+                    tree.link(index, existing)
+                    return existing
+            elif key in visited:
+                continue
+            else:
+                visited.add(key)
+            child = node._create_child(env, action, key, self.snapshot_interval)
+            self.add_nodes([child])
+            return tree.add_child(index, child)
+        return None
+
+    def _search_leaf(self, env, maxTime, rollout, c, weight_c, visited, start_time):
+        tree = self.tree
+        # every worker gets a copy of the environment with the same representation and start stats
+        with multiprocessing.Pool(self.workers, _leaf_worker_init, (env,)) as pool:
+            while time.time() - start_time < maxTime:
+                selections, jobs = [], []
+                for i in range(self.workers):
+                    selected = self._select(env, c, weight_c, visited)
+                    if selected is None:
+                        self.time_out = time.time() - start_time
+                        return
+                    path, edges = selected
+                    tree.add_virtual_loss(path, self.virtual_loss, edges)
+                    selections.append(selected)
+                    jobs.append((tree.nodes[path[-1]].get_obs(env), rollout, np.random.randint(2**31),
+                        self.rollout_policy, self.rollout_batch))
+                values = pool.starmap(_leaf_worker, jobs)
+                for (path, edges), value in zip(selections, values):
+                    tree.backpropagate(path, value, weight_c is not None, self.virtual_loss, edges)
+
+    def _search_root(self, env, maxTime, rollout, c, weight_c):
+        env.set_observation(self.root.obs)
+        jobs = []
+        for i in range(self.workers):
+            jobs.append((env, np.random.randint(2**31), maxTime, rollout, c, weight_c, self.snapshot_interval,
+                self.tree.widening, self.tree.widening_power, self.tree.table_size, self.rollout_policy, self.rollout_batch))
+        with multiprocessing.Pool(self.workers) as pool:
+            summaries = pool.starmap(_root_worker, jobs)
+        self._merge(env, summaries)
+
+    # the statistics of the root and its children and the best and deepest nodes of the tree
+    def _get_summary(self):
+        tree = self.tree
+        children = []
+        if tree.children[0] is not None:
+            for i, index in enumerate(tree.children[0]):
+                n = tree.nodes[index]
+                visits, value = tree.visits[index], tree.values[index]
+                # the values of a shared node come from all its parents so only the visits of the edge are counted
+                if tree.table is not None:
+                    visits = tree.edge_visits[tree.edge_ids[0][i]]
+                    value = tree.averages[index] * visits
+                children.append((n.action, n.key, n.heuristic, n.win, n.leaf, visits, value))
+        nodes = []
+        for n in [self.best_node, self.deep_node]:
+            nodes.append((n.get_actions(), n.heuristic, n.win, n.leaf))
+        counters = (self.iterations, self.checked_nodes, self.generated_nodes, self.nodes_memory)
+        return {"root": (tree.visits[0], tree.values[0]), "children": children, "best": nodes[0], "deep": nodes[1], "counters": counters}
+
+    # create the nodes along a path of actions from the root of another tree
+    def _create_path(self, path):
+        actions, heuristic, win, leaf = path
+        node = self.root
+        for a in actions:
+            node = self.node_class(node, a)
+        if node is not self.root:
+            node.heuristic, node.win, node.leaf = heuristic, win, leaf
+        return node
+
+    # add the root statistics of the trees from the workers together and keep their best and deepest nodes
+    def _merge(self, env, summaries):
+        tree = self.tree
+        merged = {}
+        for summary in summaries:
+            tree.add_statistics(0, *summary["root"])
+            for action, key, heuristic, win, leaf, visits, value in summary["children"]:
+                if action not in merged:
+                    child = self.node_class(self.root, action)
+                    child.key, child.heuristic, child.win, child.leaf = key, heuristic, win, leaf
+                    merged[action] = [child, 0, 0]
+                merged[action][1] += visits
+                merged[action][2] += value
+            iterations, checked_nodes, generated_nodes, nodes_memory = summary["counters"]
+            self.iterations += iterations
+            self.checked_nodes += checked_nodes
+            self.generated_nodes += generated_nodes
+            self.nodes_memory += nodes_memory
+        tree.generate(0, env.get_number_action())
+        tree.untried[0] = 0
+        for child, visits, value in merged.values():
+            self.nodes_memory += child.get_size()
+            tree.add_statistics(tree.add_child(0, child, visits), visits, value)
+        best = max(summaries, key=lambda s: (s["best"][2], s["best"][1]))["best"]
+        if best[2] or best[1] > self.best_node.get_heuristic():
+            self.best_node = self._create_path(best)
+        deep = max(summaries, key=lambda s: len(s["deep"][0]))["deep"]
+        if len(deep[0]) > self.deep_node.depth:
+            self.deep_node = self._create_path(deep)
+
+# the exploration constant is scaled by the range of the children averages
+class SpecialMCTS(MCTS):
+    def run(self, env, maxTime=60, rollout=10, addedC=0, multC=1):
+        self._search(env, maxTime, rollout, addedC, multC)
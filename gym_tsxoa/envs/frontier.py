@@ -0,0 +1,170 @@
+"""
+A module that has the frontiers (open lists) used by the best first searches where the
+item with the smallest priority is always removed first and equal priorities are removed
+in the same order they were added
+"""
+import heapq
+from collections import deque
+
+"""
+The base class of all the frontiers
+"""
+class Frontier:
+    """
+    Add an item to the frontier
+
+    Parameters:
+        priority (number): the priority of the item, smaller priorities are removed first
+        item (any): the item that is added
+    """
+    def push(self, priority, item):
+        raise NotImplementedError('push is not implemented')
+
+    """
+    Remove the item with the smallest priority from the frontier
+
+    Returns:
+        any: the removed item
+    """
+    def pop(self):
+        raise NotImplementedError('pop is not implemented')
+
+    """
+    Get the number of items in the frontier
+
+    Returns:
+        int: the number of items in the frontier
+    """
+    def __len__(self):
+        raise NotImplementedError('__len__ is not implemented')
+
+"""
+A binary heap frontier where every entry is a (priority, counter, item) tuple so the
+comparisons never reach the items and the counter keeps the equal priorities in order
+"""
+class HeapFrontier(Frontier):
+    def __init__(self):
+        self._heap = []
+        self._counter = 0
+
+    def push(self, priority, item):
+        heapq.heappush(self._heap, (priority, self._counter, item))
+        self._counter += 1
+
+    def pop(self):
+        return heapq.heappop(self._heap)[2]
+
+    def __len__(self):
+        return len(self._heap)
+
+"""
+A bucket frontier that keeps a queue for every priority value and a heap of the used
+priority values. Adding and removing items cost almost the same no matter the size of the
+frontier when the number of different priorities is small (such as integer heuristics).
+"""
+class BucketFrontier(Frontier):
+    def __init__(self):
+        self._buckets = {}
+        self._priorities = []
+        self._size = 0
+
+    def push(self, priority, item):
+        bucket = self._buckets.get(priority)
+        if bucket is None:
+            bucket = deque()
+            self._buckets[priority] = bucket
+            heapq.heappush(self._priorities, priority)
+        bucket.append(item)
+        self._size += 1
+
+    def pop(self):
+        priority = self._priorities[0]
+        bucket = self._buckets[priority]
+        item = bucket.popleft()
+        if len(bucket) == 0:
+            del self._buckets[priority]
+            heapq.heappop(self._priorities)
+        self._size -= 1
+        return item
+
+    def __len__(self):
+        return self._size
+
+"""
+A beam frontier that only keeps a certain number of the items with the smallest priorities,
+adding an item to a full frontier removes the item with the largest priority
+"""
+class BeamFrontier(Frontier):
+    """
+    Initialize the beam frontier
+
+    Parameters:
+        size (int): the maximum number of items in the frontier
+    """
+    def __init__(self, size):
+        self._size = size
+        # a min heap of (priority, counter, item) to remove the best item and a max heap of
+        # (-priority, -counter, counter) to drop the worst one, the counters of the entries that
+        # left one heap are kept in _removed until they reach the top of the other heap
+        self._best = []
+        self._worst = []
+        self._removed = set()
+        self._length = 0
+        self._counter = 0
+
+    def push(self, priority, item):
+        heapq.heappush(self._best, (priority, self._counter, item))
+        heapq.heappush(self._worst, (-priority, -self._counter, self._counter))
+        self._counter += 1
+        self._length += 1
+        if self._length > self._size:
+            self._skip_removed(self._worst, 2)
+            self._remove(heapq.heappop(self._worst)[2])
+
+    def pop(self):
+        self._skip_removed(self._best, 1)
+        entry = heapq.heappop(self._best)
+        self._remove(entry[1])
+        return entry[2]
+
+    def __len__(self):
+        return self._length
+
+    def _skip_removed(self, heap, index):
+        while heap[0][index] in self._removed:
+            self._removed.discard(heapq.heappop(heap)[index])
+
+    # rebuild both heaps when the removed entries are more than the kept ones so the
+    # memory stays proportional to the size of the beam
+    def _remove(self, counter):
+        self._removed.add(counter)
+        self._length -= 1
+        if len(self._removed) > max(self._length, 16):
+            self._best = [e for e in self._best if e[1] not in self._removed]
+            self._worst = [e for e in self._worst if e[2] not in self._removed]
+            heapq.heapify(self._best)
+            heapq.heapify(self._worst)
+            self._removed = set()
+
+FRONTIERS = {
+    "heap": HeapFrontier,
+    "bucket": BucketFrontier,
+    "beam": BeamFrontier
+}
+
+"""
+Create a new empty frontier
+
+Parameters:
+    name (string): the type of the frontier ("heap", "bucket" or "beam")
+    size (int): the maximum number of items for the beam frontier, it is required for the beam frontier
+
+Returns:
+    Frontier: the new frontier
+"""
+def create_frontier(name="heap", size=None):
+    if name == "beam":
+        if size is None or size < 1:
+            raise ValueError('the beam frontier needs a size of at least 1, got {}'.format(size))
+        return BeamFrontier(size)
+    return FRONTIERS[name]()
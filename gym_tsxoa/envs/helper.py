@@ -2,6 +2,8 @@
 A helper module that can be used by all problems
 """
 import numpy as np
+from gym_tsxoa.envs.regions import label_regions, label_regions_batch
+from gym_tsxoa.envs.paths import calc_distances, calc_diameters, split_regions, calc_distances_batch, calc_diameters_batch
 
 """
 Public function to get a dictionary of all location of all tiles
@@ -14,34 +16,13 @@ Returns:
     Dict(string,(int,int)[]): positions for every certain tile_value
 """
 def get_tile_locations(map, tile_values):
+    map = np.asarray(map)
     tiles = {}
     for t in tile_values:
-        tiles[t] = []
-    for y in range(len(map)):
-        for x in range(len(map[y])):
-            tiles[map[y][x]].append((x,y))
+        ys, xs = np.nonzero(map == t)
+        tiles[t] = list(zip(xs.tolist(), ys.tolist()))
     return tiles
 
-"""
-Get the vertical distance to certain type of tiles
-
-Parameters:
-    map (any[][]): the actual map
-    x (int): the x position of the start location
-    y (int): the y position of the start location
-    types (any[]): an array of types of tiles
-
-Returns:
-    int: the distance to certain types underneath a certain location
-"""
-def _calc_dist_floor(map, x, y, types):
-    for dy in range(len(map)):
-        if y+dy >= len(map):
-            break
-        if map[y+dy][x] in types:
-            return dy-1
-    return len(map) - 1
-
 """
 Public function to calculate the distance of a certain tiles to the floor tiles
 
@@ -54,35 +35,14 @@ Returns:
     int: a value of how far each tile from the floor where 0 means on top of floor and positive otherwise
 """
 def get_floor_dist(map, fromTypes, floorTypes):
-    result = 0
-    for y in range(len(map)):
-        for x in range(len(map[y])):
-            if map[y][x] in fromTypes:
-                result += _calc_dist_floor(map, x, y, floorTypes)
-    return result
-
-"""
-Get number of tiles that have certain value arround certain position
-
-Parameters:
-    map (any[][]): the current map
-    x (int): the x position of the start location
-    y (int): the y position of the start location
-    types (any[]): an array of types of tiles
-    relLocs ((int,int)[]): a tuple array of all the relative positions
-
-Returns:
-    int: the number of similar tiles around a certain location
-"""
-def _calc_group_value(map, x, y, types, relLocs):
-    result = 0
-    for l in relLocs:
-        nx, ny = x+l[0], y+l[1]
-        if nx < 0 or ny < 0 or nx >= len(map[0]) or ny >= len(map):
-            continue
-        if map[ny][nx] in types:
-            result += 1
-    return result
+    map = np.asarray(map)
+    height = map.shape[0]
+    rows = np.arange(height).reshape(-1, 1)
+    # the row of the first floor tile at or below every tile, height if there is none
+    floor_rows = np.where(np.isin(map, floorTypes), rows, height)
+    floor_rows = np.minimum.accumulate(floor_rows[::-1], axis=0)[::-1]
+    dist = np.where(floor_rows < height, floor_rows - rows - 1, height - 1)
+    return int(dist[np.isin(map, fromTypes)].sum())
 
 """
 Get the number of tiles that is a group of certain size
@@ -98,14 +58,16 @@ Returns:
     int: the number of tiles that have surrounding between min and max
 """
 def get_type_grouping(map, types, relLocs, min, max):
-    result = 0
-    for y in range(len(map)):
-        for x in range(len(map[y])):
-            if map[y][x] in types:
-                value = _calc_group_value(map, x, y, types, relLocs)
-                if value >= min and value <= max:
-                    result += 1
-    return result
+    mask = np.isin(np.asarray(map), types)
+    height, width = mask.shape
+    values = np.zeros((height, width), dtype=int)
+    for (dx,dy) in relLocs:
+        if abs(dx) >= width or abs(dy) >= height:
+            continue
+        # every tile (x,y) counts the tile at (x+dx,y+dy) if it is inside the map
+        values[np.maximum(0,-dy):height-np.maximum(0,dy), np.maximum(0,-dx):width-np.maximum(0,dx)] +=\
+            mask[np.maximum(0,dy):height-np.maximum(0,-dy), np.maximum(0,dx):width-np.maximum(0,-dx)]
+    return int(np.count_nonzero(mask & (values >= min) & (values <= max)))
 
 """
 Get the number of changes of tiles in either vertical or horizontal direction
@@ -118,23 +80,10 @@ Returns:
     int: number of different tiles either in vertical or horizontal direction
 """
 def get_changes(map, vertical=False):
-    start_y = 0
-    start_x = 0
+    map = np.asarray(map)
     if vertical:
-        start_y = 1
-    else:
-        start_x = 1
-    value = 0
-    for y in range(start_y, len(map)):
-        for x in range(start_x, len(map[y])):
-            same = False
-            if vertical:
-                same = map[y][x] == map[y-1][x]
-            else:
-                same = map[y][x] == map[y][x-1]
-            if not same:
-                value += 1
-    return value
+        return int(np.count_nonzero(map[1:,:] != map[:-1,:]))
+    return int(np.count_nonzero(map[:,1:] != map[:,:-1]))
 
 """
 Private function to get a list of all tile locations on the map that have any of
@@ -154,58 +103,157 @@ def _get_certain_tiles(map_locations, tile_values):
     return tiles
 
 """
-Private function that runs flood fill algorithm on the current color map
+Calculates the number of regions in the current map with passable_values
 
 Parameters:
-    x (int): the starting x position of the flood fill algorithm
-    y (int): the starting y position of the flood fill algorithm
-    color_map (int[][]): the color map that is being colored
-    map (any[][]): the current tile map to check
-    color_index (int): the color used to color in the color map
-    passable_values (any[]): the current values that can be colored over
+    map (any[][]): the current map being tested
+    map_locations(Dict(string,(int,int)[])): the histogram of locations of the current map
+    passable_values (any[]): an array of all the passable tile values
 
 Returns:
-    int: the number of tiles that has been colored
-"""
-def _flood_fill(x, y, color_map, map, color_index, passable_values):
-    num_tiles = 0
-    queue = [(x, y)]
-    while len(queue) > 0:
-        (cx, cy) = queue.pop(0)
-        if color_map[cy][cx] != -1 or map[cy][cx] not in passable_values:
-            continue
-        num_tiles += 1
-        color_map[cy][cx] = color_index
-        for (dx,dy) in [(-1, 0), (1, 0), (0, -1), (0, 1)]:
-            nx,ny=cx+dx,cy+dy
-            if nx < 0 or ny < 0 or nx >= len(map[0]) or ny >= len(map):
-                continue
-            queue.append((nx, ny))
-    return num_tiles
+    int: number of regions in the map
+"""
+def calc_num_regions(map, map_locations, passable_values):
+    num_regions, _, _ = label_regions(map, passable_values)
+    return num_regions
+
 
 """
-Calculates the number of regions in the current map with passable_values
+Calculates the number of regions in every map of a group of same sized maps
 
 Parameters:
-    map (any[][]): the current map being tested
-    map_locations(Dict(string,(int,int)[])): the histogram of locations of the current map
+    maps (any[][][]): the maps being tested
     passable_values (any[]): an array of all the passable tile values
 
 Returns:
-    int: number of regions in the map
+    int[]: number of regions in every map
 """
-def calc_num_regions(map, map_locations, passable_values):
-    empty_tiles = _get_certain_tiles(map_locations, passable_values)
-    region_index=0
-    color_map = np.full((len(map), len(map[0])), -1)
-    for (x,y) in empty_tiles:
-        num_tiles = _flood_fill(x, y, color_map, map, region_index + 1, passable_values)
-        if num_tiles > 0:
-            region_index += 1
+def calc_num_regions_batch(maps, passable_values):
+    counts, _ = label_regions_batch(maps, passable_values)
+    return counts
+
+"""
+Private function to check if all the passable orthogonal neighbors of a certain location
+are connected to each other through the 8 tiles surrounding that location without
+passing through the location itself
+
+Parameters:
+    map (any[][]): the current map
+    x (int): the x position of the center location
+    y (int): the y position of the center location
+    passable_values (any[]): the current values that can be passed
+
+Returns:
+    int: the number of passable orthogonal neighbors
+    boolean: True if all of these neighbors are locally connected, False otherwise
+"""
+def _check_local_connection(map, x, y, passable_values):
+    # the 8 surrounding tiles in circular order starting from the top one
+    ring = [(0,-1), (1,-1), (1,0), (1,1), (0,1), (-1,1), (-1,0), (-1,-1)]
+    passable = []
+    for (dx,dy) in ring:
+        nx,ny=x+dx,y+dy
+        if nx < 0 or ny < 0 or nx >= len(map[0]) or ny >= len(map):
+            passable.append(False)
         else:
+            passable.append(map[ny][nx] in passable_values)
+    neighbors = [i for i in range(0, 8, 2) if passable[i]]
+    if len(neighbors) <= 1:
+        return len(neighbors), True
+    groups = 0
+    for i in neighbors:
+        # start a new group for every neighbor that is not connected to the previous one
+        prev = (i - 2) % 8
+        if not passable[prev] or not passable[(i - 1) % 8]:
+            groups += 1
+    return len(neighbors), groups <= 1
+
+"""
+Calculate the region information of a map that is used to update the number of regions
+and the longest path after any single tile change of that map
+
+Parameters:
+    map (any[][]): the current map before any change
+    passable_values (any[]): an array of all the passable tile values
+    diameters (boolean): also keep the double sweep diameter of every region
+
+Returns:
+    dict(string,any): the region information of the map
+"""
+def get_regions_cache(map, passable_values, diameters=False):
+    if diameters:
+        num_regions, labels, values = calc_diameters(map, passable_values)
+    else:
+        num_regions, labels, _ = label_regions(map, passable_values)
+    cache = {
+        "labels": labels.reshape(-1).tolist(),
+        "width": labels.shape[1]
+    }
+    if diameters:
+        # a change touches at most 4 regions so the 5 longest regions are enough
+        cache["longest"] = sorted([(d, l) for l, d in enumerate(values) if l > 0], reverse=True)[:5]
+    return cache
+
+"""
+Private function to get the positions of the passable orthogonal neighbors of a tile
+
+Parameters:
+    map (any[][]): the current map
+    x (int): the x position of the tile
+    y (int): the y position of the tile
+    passable_values (any[]): an array of all the passable tile values
+
+Returns:
+    (int,int)[]: the x,y positions of the passable neighbors
+"""
+def _get_passable_neighbors(map, x, y, passable_values):
+    neighbors = []
+    for (dx,dy) in [(-1, 0), (1, 0), (0, -1), (0, 1)]:
+        nx,ny=x+dx,y+dy
+        if nx < 0 or ny < 0 or nx >= len(map[0]) or ny >= len(map):
             continue
-    return region_index
+        if map[ny][nx] in passable_values:
+            neighbors.append((nx, ny))
+    return neighbors
+
+"""
+Calculates the number of regions after a single tile change using the number of
+regions before the change. Without the regions cache, the calculation only checks the
+tiles around the changed location so it can't tell if two regions were connected or
+separated far away from it.
+
+Parameters:
+    map (any[][]): the current map after the change
+    num_regions (int): the number of regions before the change
+    x (int): the x position of the changed tile
+    y (int): the y position of the changed tile
+    old (any): the tile value before the change
+    new (any): the tile value after the change
+    passable_values (any[]): an array of all the passable tile values
+    cache (dict(string,any)): the regions cache of the map before the change from get_regions_cache
 
+Returns:
+    int: number of regions in the map or None if it can't be calculated without the cache
+"""
+def calc_num_regions_delta(map, num_regions, x, y, old, new, passable_values, cache=None):
+    was_passable = old in passable_values
+    is_passable = new in passable_values
+    if was_passable == is_passable:
+        return num_regions
+    num_neighbors, connected = _check_local_connection(map, x, y, passable_values)
+    if num_neighbors == 0:
+        return num_regions + [-1,1][is_passable]
+    if connected:
+        return num_regions
+    if cache is None:
+        return None
+    neighbors = _get_passable_neighbors(map, x, y, passable_values)
+    if is_passable:
+        # the new tile joins all the different regions around it
+        joined = set([cache["labels"][ny * cache["width"] + nx] for (nx,ny) in neighbors])
+        return num_regions + 1 - len(joined)
+    # the removed tile splits its region into the parts that its neighbors are in
+    return num_regions - 1 + len(split_regions(map, neighbors, passable_values))
 
 """
 Public function that runs dikjstra algorithm and return the map
@@ -220,22 +268,28 @@ Returns:
     int[][]: returns the dikjstra map after running the dijkstra algorithm
 """
 def run_dikjstra(x, y, map, passable_values):
-    dikjstra_map = np.full((len(map), len(map[0])),-1)
-    visited_map = np.zeros((len(map), len(map[0])))
-    queue = [(x, y, 0)]
-    while len(queue) > 0:
-        (cx,cy,cd) = queue.pop(0)
-        if map[cy][cx] not in passable_values or (dikjstra_map[cy][cx] >= 0 and dikjstra_map[cy][cx] <= cd):
-            continue
-        visited_map[cy][cx] = 1
-        dikjstra_map[cy][cx] = cd
-        for (dx,dy) in [(-1, 0), (1, 0), (0, -1), (0, 1)]:
-            nx,ny=cx+dx,cy+dy
-            if nx < 0 or ny < 0 or nx >= len(map[0]) or ny >= len(map):
-                continue
-            queue.append((nx, ny, cd + 1))
+    dikjstra_map = calc_distances(map, x, y, passable_values)
+    visited_map = (dikjstra_map >= 0).astype(float)
     return dikjstra_map, visited_map
 
+"""
+Public function that runs dikjstra algorithm on a group of same sized maps together
+
+Parameters:
+    xs (int[]): the starting x position in every map
+    ys (int[]): the starting y position in every map
+    maps (any[][][]): the maps being tested
+    passable_values (any[]): an array of all the passable tile values
+
+Returns:
+    int[][][]: returns the dikjstra map of every map
+    float[][][]: 1 for the tiles that are visited in every map and 0 otherwise
+"""
+def run_dikjstra_batch(xs, ys, maps, passable_values):
+    dikjstra_maps = calc_distances_batch(maps, xs, ys, passable_values)
+    visited_maps = (dikjstra_maps >= 0).astype(float)
+    return dikjstra_maps, visited_maps
+
 """
 Calculate the longest path on the map
 
@@ -243,25 +297,69 @@ Parameters:
     map (any[][]): the current map being tested
     map_locations (Dict(string,(int,int)[])): the histogram of locations of the current map
     passable_values (any[]): an array of all passable tiles in the map
+    exact (boolean): use the exact region diameters instead of the double sweep approximation
 
 Returns:
     int: the longest path in tiles in the current map
 """
-def calc_longest_path(map, map_locations, passable_values):
-    empty_tiles = _get_certain_tiles(map_locations, passable_values)
-    final_visited_map = np.zeros((len(map), len(map[0])))
-    final_value = 0
-    for (x,y) in empty_tiles:
-        if final_visited_map[y][x] > 0:
-            continue
-        dikjstra_map, visited_map = run_dikjstra(x, y, map, passable_values)
-        final_visited_map += visited_map
-        (my,mx) = np.unravel_index(np.argmax(dikjstra_map, axis=None), dikjstra_map.shape)
-        dikjstra_map, _ = run_dikjstra(mx, my, map, passable_values)
-        max_value = np.max(dikjstra_map)
-        if max_value > final_value:
-            final_value = max_value
-    return final_value
+def calc_longest_path(map, map_locations, passable_values, exact=False):
+    _, _, diameters = calc_diameters(map, passable_values, exact)
+    return max(diameters)
+
+"""
+Calculate the longest path on every map of a group of same sized maps
+
+Parameters:
+    maps (any[][][]): the maps being tested
+    passable_values (any[]): an array of all passable tiles in the maps
+    exact (boolean): use the exact region diameters instead of the double sweep approximation
+
+Returns:
+    int[]: the longest path in tiles in every map
+"""
+def calc_longest_path_batch(maps, passable_values, exact=False):
+    _, longest = calc_diameters_batch(maps, passable_values, exact)
+    return longest
+
+"""
+Calculate the longest path on the map after a single tile change using the regions cache of
+the map before the change. Only the regions that touch the changed tile are measured again.
+
+Parameters:
+    map (any[][]): the current map after the change
+    longest (int): the longest path before the change
+    x (int): the x position of the changed tile
+    y (int): the y position of the changed tile
+    old (any): the tile value before the change
+    new (any): the tile value after the change
+    passable_values (any[]): an array of all passable tiles in the map
+    cache (dict(string,any)): the regions cache of the map before the change from get_regions_cache
+    with the diameters of the regions
+
+Returns:
+    int: the longest path in tiles in the current map
+"""
+def calc_longest_path_delta(map, longest, x, y, old, new, passable_values, cache):
+    was_passable = old in passable_values
+    is_passable = new in passable_values
+    if was_passable == is_passable:
+        return longest
+    labels, width = cache["labels"], cache["width"]
+    neighbors = _get_passable_neighbors(map, x, y, passable_values)
+    touched = set([labels[ny * width + nx] for (nx,ny) in neighbors])
+    if was_passable:
+        touched.add(labels[y * width + x])
+        seeds = neighbors
+    else:
+        seeds = [(x, y)]
+    value = 0
+    for (d, l) in cache["longest"]:
+        if l not in touched:
+            value = d
+            break
+    for _, d in split_regions(map, seeds, passable_values, True):
+        value = max(value, d)
+    return value
 
 """
 Calculate the number of tiles that have certain values in the map
@@ -270,7 +368,36 @@ Returns:
     int: get number of tiles in the map that have certain tile values
 """
 def calc_certain_tile(map_locations, tile_values):
-    return len(_get_certain_tiles(map_locations, tile_values))
+    return sum([len(map_locations[v]) for v in tile_values])
+
+"""
+Calculate the number of tiles that have certain values in every map of a group of maps
+
+Parameters:
+    maps (any[][][]): the maps being tested
+    tile_values (any[]): the tile values that are counted
+
+Returns:
+    int[]: the number of tiles in every map that have certain tile values
+"""
+def calc_certain_tile_batch(maps, tile_values):
+    maps = np.asarray(maps)
+    return np.isin(maps, tile_values).reshape(len(maps), -1).sum(axis=1)
+
+"""
+Calculate the number of tiles that have certain values after a single tile change
+
+Parameters:
+    count (int): the number of tiles with certain values before the change
+    tile_values (any[]): an array of all the tile values that are counted
+    old (any): the tile value before the change
+    new (any): the tile value after the change
+
+Returns:
+    int: get number of tiles in the map that have certain tile values after the change
+"""
+def calc_certain_tile_delta(count, tile_values, old, new):
+    return count - [0,1][old in tile_values] + [0,1][new in tile_values]
 
 """
 Calculate the number of reachable tiles of a certain values from a certain starting value
@@ -374,3 +501,33 @@ def get_range_reward(new_value, old_value, low, high):
         return high - new_value + old_value - low
     if new_value < low and old_value > high:
         return high - old_value + new_value - low
+
+"""
+Get the reward of get_range_reward for arrays of values, all the parameters are broadcast together
+so every value can have its own old value and bounds
+
+Parameters:
+    new_values (float[]): the new values to be checked
+    old_value (float or float[]): the old value to be checked
+    low (float or float[]): low bound for the optimal region
+    high (float or float[]): high bound for the optimal region
+
+Returns:
+    float[]: the reward value for the change between every new value and old_value
+"""
+def get_range_reward_batch(new_values, old_value, low, high):
+    new_values = np.asarray(new_values, dtype=np.float64)
+    with np.errstate(invalid='ignore'):
+        return np.select([
+            (new_values >= low) & (new_values <= high) & (old_value >= low) & (old_value <= high),
+            (old_value <= high) & (new_values <= high),
+            (old_value >= low) & (new_values >= low),
+            (new_values > high) & (old_value < low),
+            (new_values < low) & (old_value > high)
+        ], [
+            0.0,
+            np.minimum(new_values, low) - np.minimum(old_value, low),
+            np.maximum(old_value, high) - np.maximum(new_values, high),
+            high - new_values + old_value - low,
+            high - old_value + new_values - low
+        ], 0.0)
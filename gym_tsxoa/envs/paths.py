@@ -0,0 +1,411 @@
+"""
+A module that calculates the path metrics (distances and diameters) of the passable regions in a map
+"""
+import numpy as np
+from gym_tsxoa.envs.regions import label_regions, stack_maps, get_region_owners
+
+"""
+A path metric engine that runs breadth first search over the flat tile indices of
+the map. The engine keeps the neighbor tables and the distance buffers for every
+map shape so running it on the same sized maps doesn't allocate them again.
+"""
+class PathMetrics:
+    """
+    Initialize the engine with empty tables and buffers
+    """
+    def __init__(self):
+        self._neighbors = {}
+        self._buffers = {}
+
+    """
+    Private function to get the neighbor table for a certain map shape
+
+    Parameters:
+        shape ((int,int)): the height and width of the map
+
+    Returns:
+        int[][]: the flat indices of the orthogonal neighbors of every flat tile index
+    """
+    def _get_neighbors(self, shape):
+        if shape not in self._neighbors:
+            height, width = shape
+            neighbors = []
+            for y in range(height):
+                for x in range(width):
+                    neighbors.append([])
+                    for (dx,dy) in [(-1, 0), (1, 0), (0, -1), (0, 1)]:
+                        nx,ny=x+dx,y+dy
+                        if nx < 0 or ny < 0 or nx >= width or ny >= height:
+                            continue
+                        neighbors[-1].append(ny * width + nx)
+            self._neighbors[shape] = neighbors
+        return self._neighbors[shape]
+
+    """
+    Private function to get three distance buffers filled with -1 for a certain map shape
+
+    Parameters:
+        shape ((int,int)): the height and width of the map
+
+    Returns:
+        int[]: the first distance buffer
+        int[]: the second distance buffer
+        int[]: the third distance buffer
+    """
+    def _get_buffers(self, shape):
+        if shape not in self._buffers:
+            size = shape[0] * shape[1]
+            self._buffers[shape] = ([-1] * size, [-1] * size, [-1] * size, [-1] * size)
+        first, second, third, empty = self._buffers[shape]
+        first[:] = empty
+        second[:] = empty
+        third[:] = empty
+        return first, second, third
+
+    """
+    Private function that runs breadth first search from a flat tile index
+
+    Parameters:
+        start (int): the flat index of the start tile
+        passable (boolean[]): if every flat tile index is passable or not
+        neighbors (int[][]): the neighbor table of the map
+        dist (int[]): the distance buffer that has -1 for all the tiles that can be reached
+
+    Returns:
+        int[]: the flat indices of the visited tiles in the order of their distance
+    """
+    def _bfs(self, start, passable, neighbors, dist):
+        if not passable[start]:
+            return []
+        dist[start] = 0
+        queue = [start]
+        for current in queue:
+            next_dist = dist[current] + 1
+            for n in neighbors[current]:
+                if dist[n] < 0 and passable[n]:
+                    dist[n] = next_dist
+                    queue.append(n)
+        return queue
+
+    """
+    Calculate the distance from a certain tile to all the reachable tiles
+
+    Parameters:
+        map (any[][]): the current map
+        x (int): the starting x position
+        y (int): the starting y position
+        passable_values (any[]): an array of all the passable tile values
+
+    Returns:
+        int[][]: the distance to every tile, -1 for the tiles that can't be reached
+    """
+    def distances(self, map, x, y, passable_values):
+        map = np.asarray(map)
+        passable = np.isin(map, passable_values).reshape(-1).tolist()
+        dist, _, _ = self._get_buffers(map.shape)
+        self._bfs(y * map.shape[1] + x, passable, self._get_neighbors(map.shape), dist)
+        return np.array(dist).reshape(map.shape)
+
+    """
+    Calculate the distance from one tile of every map in a group of same sized maps to all the
+    reachable tiles of that map. The search grows all the maps together one level at a time.
+
+    Parameters:
+        maps (any[][][]): the current maps
+        xs (int[]): the starting x position in every map
+        ys (int[]): the starting y position in every map
+        passable_values (any[]): an array of all the passable tile values
+
+    Returns:
+        int[][][]: the distance to every tile, -1 for the tiles that can't be reached
+    """
+    def distances_batch(self, maps, xs, ys, passable_values):
+        maps = np.asarray(maps)
+        passable = np.isin(maps, passable_values)
+        dist = np.full(maps.shape, -1, dtype=np.int64)
+        rows = np.arange(len(maps))
+        frontier = np.zeros(maps.shape, dtype=bool)
+        frontier[rows, ys, xs] = passable[rows, ys, xs]
+        grown = np.empty_like(frontier)
+        level = 0
+        while frontier.any():
+            dist[frontier] = level
+            np.copyto(grown, frontier)
+            grown[:,:-1] |= frontier[:,1:]
+            grown[:,1:] |= frontier[:,:-1]
+            grown[:,:,:-1] |= frontier[:,:,1:]
+            grown[:,:,1:] |= frontier[:,:,:-1]
+            np.logical_and(grown, passable, out=frontier)
+            frontier &= dist < 0
+            level += 1
+        return dist
+
+    """
+    Find the connected regions that contain certain tiles and calculate their double sweep
+    diameters, each region is only returned once even if it contains multiple tiles
+
+    Parameters:
+        map (any[][]): the current map
+        seeds ((int,int)[]): the x,y positions of the tiles
+        passable_values (any[]): an array of all the passable tile values
+        diameters (boolean): calculate the diameter of every region
+
+    Returns:
+        (int[],int)[]: the flat tile indices of every region and its diameter (None if it is not calculated)
+    """
+    def split_regions(self, map, seeds, passable_values, diameters=False):
+        map = np.asarray(map)
+        width = map.shape[1]
+        flat_map = map.reshape(-1).tolist()
+        passable = np.isin(map, passable_values).reshape(-1).tolist()
+        neighbors = self._get_neighbors(map.shape)
+        found, first, second = self._get_buffers(map.shape)
+        rank = dict((v, i) for i, v in enumerate(passable_values))
+        regions = []
+        for (x, y) in seeds:
+            start = y * width + x
+            if found[start] >= 0 or not passable[start]:
+                continue
+            cells = self._bfs(start, passable, neighbors, found)
+            diameter = None
+            if diameters:
+                start = min(cells, key=lambda i: (rank[flat_map[i]], i))
+                diameter = self._sweep(start, passable, neighbors, first, second)
+            regions.append((cells, diameter))
+        return regions
+
+    """
+    Calculate the diameter of every connected region in one pass over the map.
+    The approximate mode runs two breadth first searches per region, the first one from
+    the first tile of the region and the second one from the farthest tile found. The exact
+    mode runs breadth first search from all the passable tiles together where every tile is
+    a bit in a set of 64 bit words, then the diameter is the largest eccentricity in the region.
+
+    Parameters:
+        map (any[][]): the current map
+        passable_values (any[]): an array of all the passable tile values
+        exact (boolean): calculate the exact diameter instead of the double sweep approximation
+
+    Returns:
+        int: number of regions in the map
+        int[][]: the region label of every tile, 0 for not passable tiles
+        int[]: the diameter of every region indexed by the label where index 0 is always 0
+    """
+    def diameters(self, map, passable_values, exact=False):
+        map = np.asarray(map)
+        num_regions, labels, _ = label_regions(map, passable_values)
+        if num_regions == 0:
+            return num_regions, labels, [0]
+        if exact:
+            return num_regions, labels, self._exact_diameters(labels, num_regions)
+        return num_regions, labels, self._approximate_diameters(map, labels, num_regions, passable_values)
+
+    """
+    Calculate the number of regions and the longest region diameter of a group of same sized maps.
+    The double sweep runs once over the stacked maps, while the exact diameters are calculated
+    map by map as the memory of the bit parallel search grows with the square of the tiles.
+
+    Parameters:
+        maps (any[][][]): the current maps
+        passable_values (any[]): an array of all the passable tile values
+        exact (boolean): calculate the exact diameter instead of the double sweep approximation
+
+    Returns:
+        int[]: number of regions in every map
+        int[]: the longest diameter in every map, 0 for the maps without regions
+    """
+    def diameters_batch(self, maps, passable_values, exact=False):
+        maps = np.asarray(maps)
+        number = len(maps)
+        if exact:
+            counts = np.zeros(number, dtype=np.int64)
+            longest = np.zeros(number, dtype=np.int64)
+            for i in range(number):
+                counts[i], _, diameters = self.diameters(maps[i], passable_values, True)
+                longest[i] = max(diameters)
+            return counts, longest
+        num_regions, labels, diameters = self.diameters(stack_maps(maps, passable_values), passable_values)
+        owners = get_region_owners(labels, num_regions, number)[1:]
+        longest = np.zeros(number, dtype=np.int64)
+        np.maximum.at(longest, owners, np.asarray(diameters[1:], dtype=np.int64))
+        return np.bincount(owners, minlength=number), longest
+
+    """
+    Private function that calculates the double sweep diameter of every region
+
+    Parameters:
+        map (numpy.ndarray): the current map
+        labels (int[][]): the region label of every tile
+        num_regions (int): number of regions in the map
+        passable_values (any[]): an array of all the passable tile values
+
+    Returns:
+        int[]: the diameter of every region indexed by the label
+    """
+    def _approximate_diameters(self, map, labels, num_regions, passable_values):
+        size = map.size
+        flat_labels = labels.reshape(-1)
+        # every region starts from its first tile ordered by the passable values then row by row
+        rank = np.zeros(size, dtype=np.int64)
+        flat_map = map.reshape(-1)
+        for i, v in enumerate(passable_values):
+            rank[flat_map == v] = i
+        order = rank * size + np.arange(size)
+        starts = np.full(num_regions + 1, rank.max() * size + size)
+        np.minimum.at(starts, flat_labels, order)
+        starts = (starts[1:] % size).tolist()
+
+        passable = (flat_labels > 0).tolist()
+        neighbors = self._get_neighbors(map.shape)
+        first, second, _ = self._get_buffers(map.shape)
+        diameters = [0]
+        for start in starts:
+            diameters.append(self._sweep(start, passable, neighbors, first, second))
+        return diameters
+
+    """
+    Private function that runs the double sweep from the first tile of a region. Different
+    regions can share the same buffers as the searches never leave their region.
+
+    Parameters:
+        start (int): the flat index of the first tile of the region
+        passable (boolean[]): if every flat tile index is passable or not
+        neighbors (int[][]): the neighbor table of the map
+        first (int[]): the distance buffer of the first search
+        second (int[]): the distance buffer of the second search
+
+    Returns:
+        int: the double sweep diameter of the region
+    """
+    def _sweep(self, start, passable, neighbors, first, second):
+        queue = self._bfs(start, passable, neighbors, first)
+        # the farthest tile is the first one row by row similar to numpy argmax
+        far_dist = first[queue[-1]]
+        far = queue[-1]
+        for i in range(len(queue) - 1, -1, -1):
+            if first[queue[i]] != far_dist:
+                break
+            far = min(far, queue[i])
+        queue = self._bfs(far, passable, neighbors, second)
+        return second[queue[-1]]
+
+    """
+    Private function that calculates the exact diameter of every region using bit parallel
+    breadth first search from all the passable tiles at the same time
+
+    Parameters:
+        labels (int[][]): the region label of every tile
+        num_regions (int): number of regions in the map
+
+    Returns:
+        int[]: the diameter of every region indexed by the label
+    """
+    def _exact_diameters(self, labels, num_regions):
+        height, width = labels.shape
+        sources = np.flatnonzero(labels.reshape(-1))
+        num_words = (len(sources) + 63) // 64
+        reach = np.zeros((height * width, num_words), dtype=np.uint64)
+        bits = np.arange(len(sources))
+        reach[sources, bits // 64] = np.left_shift(np.uint64(1), (bits % 64).astype(np.uint64))
+        reach = reach.reshape(height, width, num_words)
+        mask = np.where(labels > 0, ~np.uint64(0), np.uint64(0)).astype(np.uint64)[:,:,None]
+        new = np.empty_like(reach)
+        grown = np.empty_like(reach)
+        eccentricity = np.zeros(len(sources), dtype=np.int64)
+        level = 0
+        while True:
+            np.copyto(new, reach)
+            new[:-1] |= reach[1:]
+            new[1:] |= reach[:-1]
+            new[:,:-1] |= reach[:,1:]
+            new[:,1:] |= reach[:,:-1]
+            new &= mask
+            np.bitwise_xor(new, reach, out=grown)
+            words = np.bitwise_or.reduce(grown.reshape(-1, num_words), axis=0)
+            if not words.any():
+                break
+            level += 1
+            growing = np.unpackbits(words.view(np.uint8), bitorder='little')[:len(sources)]
+            eccentricity[growing > 0] = level
+            reach, new = new, reach
+        diameters = np.zeros(num_regions + 1, dtype=np.int64)
+        np.maximum.at(diameters, labels.reshape(-1)[sources], eccentricity)
+        return diameters.tolist()
+
+_metrics = PathMetrics()
+
+"""
+Calculate the distance from a certain tile to all the reachable tiles using a shared path engine
+
+Parameters:
+    map (any[][]): the current map
+    x (int): the starting x position
+    y (int): the starting y position
+    passable_values (any[]): an array of all the passable tile values
+
+Returns:
+    int[][]: the distance to every tile, -1 for the tiles that can't be reached
+"""
+def calc_distances(map, x, y, passable_values):
+    return _metrics.distances(map, x, y, passable_values)
+
+"""
+Find the connected regions that contain certain tiles using a shared path engine
+
+Parameters:
+    map (any[][]): the current map
+    seeds ((int,int)[]): the x,y positions of the tiles
+    passable_values (any[]): an array of all the passable tile values
+    diameters (boolean): calculate the double sweep diameter of every region
+
+Returns:
+    (int[],int)[]: the flat tile indices of every region and its diameter (None if it is not calculated)
+"""
+def split_regions(map, seeds, passable_values, diameters=False):
+    return _metrics.split_regions(map, seeds, passable_values, diameters)
+
+"""
+Calculate the diameter of every connected region using a shared path engine
+
+Parameters:
+    map (any[][]): the current map
+    passable_values (any[]): an array of all the passable tile values
+    exact (boolean): calculate the exact diameter instead of the double sweep approximation
+
+Returns:
+    int: number of regions in the map
+    int[][]: the region label of every tile, 0 for not passable tiles
+    int[]: the diameter of every region indexed by the label where index 0 is always 0
+"""
+def calc_diameters(map, passable_values, exact=False):
+    return _metrics.diameters(map, passable_values, exact)
+
+"""
+Calculate the distance from one tile of every map to all the reachable tiles using a shared path engine
+
+Parameters:
+    maps (any[][][]): the current maps
+    xs (int[]): the starting x position in every map
+    ys (int[]): the starting y position in every map
+    passable_values (any[]): an array of all the passable tile values
+
+Returns:
+    int[][][]: the distance to every tile, -1 for the tiles that can't be reached
+"""
+def calc_distances_batch(maps, xs, ys, passable_values):
+    return _metrics.distances_batch(maps, xs, ys, passable_values)
+
+"""
+Calculate the number of regions and the longest region diameter of every map using a shared path engine
+
+Parameters:
+    maps (any[][][]): the current maps
+    passable_values (any[]): an array of all the passable tile values
+    exact (boolean): calculate the exact diameter instead of the double sweep approximation
+
+Returns:
+    int[]: number of regions in every map
+    int[]: the longest diameter in every map
+"""
+def calc_diameters_batch(maps, passable_values, exact=False):
+    return _metrics.diameters_batch(maps, passable_values, exact)
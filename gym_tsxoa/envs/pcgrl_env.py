@@ -1,8 +1,63 @@
 from gym_tsxoa.envs.probs import PROBLEMS
 from gym_tsxoa.envs.reps import REPRESENTATIONS
+from collections.abc import MutableMapping
 import numpy as np
 import PIL
 
+"""
+The debug information of a step that is only built the first time it is read, so the search
+loops that ignore it don't pay for the debug dictionary of the problem on every step
+"""
+class StepInfo(MutableMapping):
+    __slots__ = ["_prob", "_stats", "_start_stats", "_counters", "_info"]
+
+    """
+    Initialize the information with everything that is needed to build it later
+
+    Parameters:
+        prob (Problem): the problem that builds the debug information
+        stats (dict(string,any)): the stats of the map after the step
+        start_stats (dict(string,any)): the stats of the start map
+        counters ((int,int,int,int)): the iterations, changes, max iterations and max changes
+    """
+    def __init__(self, prob, stats, start_stats, counters):
+        self._prob = prob
+        self._stats = stats
+        self._start_stats = start_stats
+        self._counters = counters
+        self._info = None
+
+    """
+    Private function to build the debug information the first time it is needed
+
+    Returns:
+        dict(any,any): the debug information of the problem with the step counters
+    """
+    def _get_info(self):
+        if self._info is None:
+            self._info = self._prob.get_debug_info(self._stats, self._start_stats)
+            self._info["iterations"], self._info["changes"], self._info["max_iterations"], self._info["max_changes"] = self._counters
+            self._prob, self._stats, self._start_stats = None, None, None
+        return self._info
+
+    def __getitem__(self, key):
+        return self._get_info()[key]
+
+    def __setitem__(self, key, value):
+        self._get_info()[key] = value
+
+    def __delitem__(self, key):
+        del self._get_info()[key]
+
+    def __iter__(self):
+        return iter(self._get_info())
+
+    def __len__(self):
+        return len(self._get_info())
+
+    def __repr__(self):
+        return repr(self._get_info())
+
 """
 The PCGRL GYM Environment
 """
@@ -16,11 +71,18 @@ class PcgrlEnv:
         constant in gym_tsxoa.envs.probs.__init__.py file
         rep (string): the current representation. This name has to be defined in REPRESENTATIONS
         constant in gym_tsxoa.envs.reps.__init__.py
+        max_percentage (float): the maximum percentage of the map that can be changed
+        exact_keys (boolean): add the raw map bytes to the state keys so different maps never
+        share a key even if their zobrist hashes collide
     """
-    def __init__(self, prob="binary", rep="narrow", max_percentage=1.0):
+    def __init__(self, prob="binary", rep="narrow", max_percentage=1.0, exact_keys=False):
         self._prob = PROBLEMS[prob]()
         self._rep = REPRESENTATIONS[rep]()
+        self._rep._exact_keys = exact_keys
         self._rep_stats = None
+        self._stale_stats = False
+        self._last_change = None
+        self._undo = []
         self._start_stats = None
         self._iteration = 0
         self._changes = 0
@@ -48,40 +110,80 @@ class PcgrlEnv:
     def reset(self):
         self._changes = 0
         self._iteration = 0
+        self._undo = []
         self._rep.reset(self._prob._width, self._prob._height, self._prob._prob)
         if self._start_stats == None:
             self._start_stats = self._prob.get_stats(self._rep._map)
         self._rep_stats = self._prob.get_stats(self._rep._map)
+        self._stale_stats = False
 
         obs = self.get_observation()
         heuristic = self._prob.get_heuristic(self._rep_stats, self._start_stats)
         game_done = self._prob.get_episode_over(self._rep_stats,self._start_stats)
         done = game_done or self._changes >= self._max_changes or self._iteration >= self._max_iterations
-        info = self._prob.get_debug_info(self._rep_stats,self._start_stats)
-        info["iterations"] = self._iteration
-        info["changes"] = self._changes
-        info["max_iterations"] = self._max_iterations
-        info["max_changes"] = self._max_changes
+        info = self._get_info()
         return obs, heuristic, game_done, done, info
 
+    """
+    Private function to get the debug information of the current state that is built when it is read
+
+    Returns:
+        StepInfo: the debug information of the problem with the step counters
+    """
+    def _get_info(self):
+        return StepInfo(self._prob, self._rep_stats, self._start_stats, (self._iteration, self._changes, self._max_iterations, self._max_changes))
+
     def get_number_action(self):
         return self._rep.get_number_action(self._prob._width, self._prob._height, len(self._prob.get_tile_types()))
 
+    def get_action_tiles(self):
+        return self._rep.get_action_tiles(self._prob._width, self._prob._height, len(self._prob.get_tile_types()))
+
     def get_state_key(self):
         return self._rep.get_state_key()
 
-    def get_observation(self):
+    """
+    Get the current observation of the environment
+
+    Parameters:
+        copy (boolean): copy the map so the observation doesn't change with the environment
+
+    Returns:
+        Observation: the current observation that can be used with set_observation
+    """
+    def get_observation(self, copy=False):
+        if self._stale_stats:
+            self._rep_stats = self._prob.get_stats(self._rep._map)
+            self._stale_stats = False
         obs = self._rep.get_observation()
+        if copy:
+            obs['map'] = obs['map'].copy()
         obs['changes'] = self._changes
         obs['iteration'] = self._iteration
         obs['rep_stats'] = self._rep_stats
         return obs
 
     def set_observation(self, obs, copy=True):
+        self._undo = []
         self._rep.set_observation(obs, copy)
         self._changes = obs['changes']
         self._iteration = obs['iteration']
         self._rep_stats = obs['rep_stats']
+        self._stale_stats = False
+
+    """
+    Set the environment to a certain observation then advance it using a sequence of actions.
+    The stats are only calculated when they are needed after the replay.
+
+    Parameters:
+        obs (Observation): the observation to start from
+        actions (int[]): the actions to replay in order
+        earlyTermination (boolean): count the actions towards the iterations and changes limits
+    """
+    def replay(self, obs, actions, earlyTermination=True):
+        self.set_observation(obs)
+        for a in actions:
+            self.step(a, earlyTermination, True)
 
     """
     Advance the environment using a specific action
@@ -99,41 +201,191 @@ class PcgrlEnv:
         if earlyTermination:
             self._iteration += 1
         # update the current state to the new state based on the taken action
-        change, x, y = self._rep.update(action)
-        if change > 0:
-            if earlyTermination:
-                self._changes += change
-            earlyDone = self._changes >= self._max_changes or self._iteration >= self._max_iterations
-            if quick and not earlyDone:
-                return None, 0, False, False, {}
-            self._rep_stats = self._prob.get_stats(self._rep._map)
+        change, x, y, old, new = self._rep.update(action)
+        self._last_change = (x, y, old)
+        if change > 0 and earlyTermination:
+            self._changes += change
         earlyDone = self._changes >= self._max_changes or self._iteration >= self._max_iterations
         if quick and not earlyDone:
+            if change > 0:
+                self._stale_stats = True
             return None, 0, False, False, {}
+        # skipped quick steps leave the stats behind the map so they can't be updated locally
+        if self._stale_stats:
+            self._rep_stats = self._prob.get_stats(self._rep._map)
+        elif change > 0:
+            self._rep_stats = self._prob.get_stats_delta(self._rep._map, self._rep_stats, x, y, old, new)
+        self._stale_stats = False
         # calculate the values
         obs = self.get_observation()
         heuristic = self._prob.get_heuristic(self._rep_stats, self._start_stats)
         game_done = self._prob.get_episode_over(self._rep_stats,self._start_stats)
         done = game_done or self._changes >= self._max_changes or self._iteration >= self._max_iterations
-        info = self._prob.get_debug_info(self._rep_stats,self._start_stats)
-        info["iterations"] = self._iteration
-        info["changes"] = self._changes
-        info["max_iterations"] = self._max_iterations
-        info["max_changes"] = self._max_changes
+        info = self._get_info()
         #return the values
         return obs, heuristic, game_done, done, info
 
+    """
+    Advance the environment using a specific action similar to step but remember everything
+    that changed so it can be undone using revert. Applying then reverting all the actions
+    from a certain state doesn't copy the map at all.
+
+    Parameters:
+        action: an action that is used to advance the environment (same as action space)
+        earlyTermination (boolean): count the action towards the iterations and changes limits
+        quick (boolean): skip calculating the stats similar to step
+
+    Returns:
+        the same values as step where the observation shares the map with the environment,
+        use get_observation(True) before reverting to keep a copy of that state
+    """
+    def apply(self, action, earlyTermination=True, quick=False):
+        saved = (self._rep.get_cursor(), self._changes, self._iteration, self._rep_stats, self._stale_stats)
+        result = self.step(action, earlyTermination, quick)
+        self._undo.append(saved + self._last_change)
+        return result
+
+    """
+    Undo the last action that was applied using apply
+    """
+    def revert(self):
+        cursor, self._changes, self._iteration, self._rep_stats, self._stale_stats, x, y, old = self._undo.pop()
+        self._rep._set_tile(x, y, old)
+        self._rep.set_cursor(cursor)
+
+    """
+    Get the state key after an action without changing the state or calculating any stats
+
+    Parameters:
+        action: an action that is used to advance the environment (same as action space)
+
+    Returns:
+        any: the state key after the action, the same as the current key if the action doesn't change the state
+    """
+    def get_action_key(self, action):
+        cursor = self._rep.get_cursor()
+        change, x, y, old, new = self._rep.update(action)
+        key = self._rep.get_state_key()
+        if change > 0:
+            self._rep._set_tile(x, y, old)
+        self._rep.set_cursor(cursor)
+        return key
+
+    """
+    Find the actions that lead to new states using only the representation update and the
+    state keys without calculating any stats. An action is dropped if it doesn't change the
+    state (writing the same tile value or moving into the border), if it leads to a state
+    that is already visited, or if an earlier action leads to the same state.
+
+    Parameters:
+        visited (set): the keys of the visited states, None to only drop the repeated states
+
+    Returns:
+        int[]: the actions that lead to new states
+        any[]: the state key after every one of these actions
+    """
+    def prune_actions(self, visited=None):
+        seen = set([self._rep.get_state_key()])
+        actions, keys = [], []
+        for a in range(self.get_number_action()):
+            key = self.get_action_key(a)
+            if key in seen or (visited is not None and key in visited):
+                continue
+            seen.add(key)
+            actions.append(a)
+            keys.append(key)
+        return actions, keys
+
+    """
+    Evaluate actions from the current state without changing the state. Actions that
+    don't change the map reuse the current stats and all the other actions share the stats
+    cache of the current map so only the parts affected by every change are calculated.
+
+    Parameters:
+        earlyTermination (boolean): count the actions towards the iterations and changes limits
+        observations (boolean): also return a copy of the observation after every action
+        actions (int[]): the actions to evaluate (such as the result of prune_actions), None for all the actions
+
+    Returns:
+        float[]: the heuristic value after every action
+        boolean[]: if the problem ended (episode is over) after every action
+        boolean[]: if the episode is done after every action
+        Observation[]: the observation after every action if observations is True, None otherwise
+    """
+    def evaluate_all_actions(self, earlyTermination=True, observations=False, actions=None):
+        if self._stale_stats:
+            self._rep_stats = self._prob.get_stats(self._rep._map)
+            self._stale_stats = False
+        if actions is None:
+            actions = range(self.get_number_action())
+        number = len(actions)
+        heuristics = np.zeros(number)
+        wins = np.zeros(number, dtype=bool)
+        dones = np.zeros(number, dtype=bool)
+        obs_list = None
+        if observations:
+            obs_list = []
+
+        if number == 0:
+            return heuristics, wins, dones, obs_list
+
+        base_stats = self._rep_stats
+        base_heuristic = self._prob.get_heuristic(base_stats, self._start_stats)
+        base_win = self._prob.get_episode_over(base_stats, self._start_stats)
+        base_changes, base_iteration = self._changes, self._iteration
+        cursor = self._rep.get_cursor()
+        cache = self._prob.get_stats_cache(self._rep._map)
+        if earlyTermination:
+            self._iteration += 1
+        for i, a in enumerate(actions):
+            change, x, y, old, new = self._rep.update(a)
+            if change > 0:
+                if earlyTermination:
+                    self._changes = base_changes + change
+                self._rep_stats = self._prob.get_stats_delta(self._rep._map, base_stats, x, y, old, new, cache)
+                heuristics[i] = self._prob.get_heuristic(self._rep_stats, self._start_stats)
+                wins[i] = self._prob.get_episode_over(self._rep_stats, self._start_stats)
+            else:
+                heuristics[i] = base_heuristic
+                wins[i] = base_win
+            dones[i] = wins[i] or self._changes >= self._max_changes or self._iteration >= self._max_iterations
+            if observations:
+                obs_list.append(self.get_observation(True))
+            self._rep._set_tile(x, y, old)
+            self._rep.set_cursor(cursor)
+            self._changes = base_changes
+            self._rep_stats = base_stats
+        self._iteration = base_iteration
+        return heuristics, wins, dones, obs_list
+
+    """
+    Evaluate maps that are not the current map of the environment using the same start stats.
+    All the maps are evaluated together using the batched stats of the problem.
+
+    Parameters:
+        maps (numpy.int[][][]): the maps that are evaluated
+
+    Returns:
+        float[]: the heuristic value of every map
+        boolean[]: if the problem ended (episode is over) for every map
+        dict(string,any)[]: the stats of every map
+    """
+    def evaluate_maps(self, maps):
+        if len(maps) == 0:
+            return np.zeros(0), np.zeros(0, dtype=bool), []
+        stats = self._prob.get_stats_batch(np.asarray(maps))
+        heuristics = self._prob.get_heuristic_batch(stats, self._start_stats)
+        wins = self._prob.get_episode_over_batch(stats, self._start_stats)
+        return heuristics, wins, self._prob.get_stats_list(stats)
+
     def calculate_step(self):
         self._rep_stats = self._prob.get_stats(self._rep._map)
+        self._stale_stats = False
         obs = self.get_observation()
         heuristic = self._prob.get_heuristic(self._rep_stats, self._start_stats)
         game_done = self._prob.get_episode_over(self._rep_stats,self._start_stats)
         done = game_done or self._changes >= self._max_changes or self._iteration >= self._max_iterations
-        info = self._prob.get_debug_info(self._rep_stats,self._start_stats)
-        info["iterations"] = self._iteration
-        info["changes"] = self._changes
-        info["max_iterations"] = self._max_iterations
-        info["max_changes"] = self._max_changes
+        info = self._get_info()
         #return the values
         return obs, heuristic, game_done, done, info
 
@@ -151,3 +403,9 @@ class PcgrlEnv:
         img = self._prob.render(self._rep._map)
         img = self._rep.render(img, self._prob._tile_size, self._prob._border_size).convert("RGB")
         return img
+
+    """
+    Release anything the problem keeps running between evaluations like the solver workers
+    """
+    def close(self):
+        self._prob.close()
@@ -2,7 +2,7 @@ import os
 import numpy as np
 from PIL import Image
 from gym_tsxoa.envs.probs.problem import Problem
-from gym_tsxoa.envs.helper import get_range_reward, get_tile_locations, calc_num_regions, calc_longest_path
+from gym_tsxoa.envs.helper import get_tile_locations, calc_num_regions, calc_num_regions_delta, calc_num_regions_batch, calc_longest_path, calc_longest_path_delta, calc_longest_path_batch, get_regions_cache
 
 """
 Generate a fully connected top down layout where the longest path is greater than a certain threshold
@@ -19,6 +19,7 @@ class BinaryProblem(Problem):
         self._border_tile = 1
 
         self._target_path = 20
+        self._exact_path = False
 
         self._rewards = {
             "regions": 5,
@@ -45,28 +46,80 @@ class BinaryProblem(Problem):
         map_locations = get_tile_locations(map, self.get_tile_types())
         return {
             "regions": calc_num_regions(map, map_locations, [0]),
-            "path-length": calc_longest_path(map, map_locations, [0])
+            "path-length": calc_longest_path(map, map_locations, [0], self._exact_path)
         }
 
     """
-    Get the current game reward between two stats
+    Get the stats of a group of same sized maps together where the regions are labeled
+    and measured for all the maps in one pass
 
     Parameters:
-        new_stats (dict(string,any)): the new stats after taking an action
-        start_stats (dict(string,any)): the old stats before taking an action
+        maps (any[][][]): the maps that are evaluated
 
     Returns:
-        float: the current reward due to the change between the old map stats and the new map stats
+        dict(string,numpy.ndarray): the "regions" and "path-length" of every map
     """
-    def get_heuristic(self, new_stats, start_stats):
-        #longer path is rewarded and less number of regions is rewarded
-        rewards = {
-            "regions": get_range_reward(new_stats["regions"], start_stats["regions"], 1, 1),
-            "path-length": get_range_reward(new_stats["path-length"],start_stats["path-length"], np.inf, np.inf)
+    def get_stats_batch(self, maps):
+        return {
+            "regions": calc_num_regions_batch(maps, [0]),
+            "path-length": calc_longest_path_batch(maps, [0], self._exact_path)
         }
-        #calculate the total reward
-        return rewards["regions"] * self._rewards["regions"] +\
-            rewards["path-length"] * self._rewards["path-length"]
+
+    """
+    Get the regions cache of a map that is shared between all single tile changes of that map
+
+    Parameters:
+        map (any[][]): the current game map before any change
+
+    Returns:
+        dict(string,any): the regions cache of the map
+    """
+    def get_stats_cache(self, map):
+        return get_regions_cache(map, [0], not self._exact_path)
+
+    """
+    Get the current stats of the map after changing a single tile. The number of regions
+    is updated locally when possible while the longest path is recalculated unless the
+    regions cache is available where only the regions that touch the change are measured again.
+
+    Parameters:
+        map (any[][]): the current game map after the change
+        old_stats (dict(string,any)): the stats of the map before the change
+        x (int): the x position of the changed tile
+        y (int): the y position of the changed tile
+        old (any): the tile value before the change
+        new (any): the tile value after the change
+        cache (dict(string,any)): the regions cache from get_stats_cache of the map before the change
+
+    Returns:
+        dict(string,any): stats of the current map similar to get_stats
+    """
+    def get_stats_delta(self, map, old_stats, x, y, old, new, cache=None):
+        if cache is not None and not self._exact_path:
+            return {
+                "regions": calc_num_regions_delta(map, old_stats["regions"], x, y, old, new, [0], cache),
+                "path-length": calc_longest_path_delta(map, old_stats["path-length"], x, y, old, new, [0], cache)
+            }
+        regions = calc_num_regions_delta(map, old_stats["regions"], x, y, old, new, [0], cache)
+        if regions is None:
+            return self.get_stats(map)
+        map_locations = get_tile_locations(map, self.get_tile_types())
+        return {
+            "regions": regions,
+            "path-length": calc_longest_path(map, map_locations, [0], self._exact_path)
+        }
+
+    """
+    Get the terms of the heuristic where longer paths and less regions are rewarded
+
+    Returns:
+        (string,float,float,float)[]: the stat name, the optimal range and the weight of every term
+    """
+    def get_heuristic_terms(self):
+        return [
+            ("regions", 1, 1, self._rewards["regions"]),
+            ("path-length", np.inf, np.inf, self._rewards["path-length"])
+        ]
 
     """
     Uses the stats to check if the problem ended (episode_over) which means reached
@@ -82,6 +135,19 @@ class BinaryProblem(Problem):
     def get_episode_over(self, new_stats, start_stats):
         return new_stats["regions"] == 1 and new_stats["path-length"] - start_stats["path-length"] >= self._target_path
 
+    """
+    Check if the problem ended for many maps from their stats similar to get_episode_over
+
+    Parameters:
+        stats (dict(string,numpy.ndarray)): the stats of all the maps from get_stats_batch
+        start_stats (dict(string,any)): the stats of the start map
+
+    Returns:
+        boolean[]: True for the maps that reached satisfying quality and False otherwise
+    """
+    def get_episode_over_batch(self, stats, start_stats):
+        return (stats["regions"] == 1) & (stats["path-length"] - start_stats["path-length"] >= self._target_path)
+
     """
     Get any debug information need to be printed
 
@@ -1,4 +1,7 @@
 from PIL import Image
+from operator import itemgetter
+import numpy as np
+from gym_tsxoa.envs.helper import get_range_reward, get_range_reward_batch
 
 """
 The base class for all the problems that can be handled by the interface
@@ -19,6 +22,8 @@ class Problem:
         self._border_tile = tiles[0]
         self._tile_size=16
         self._graphics = None
+        self._heuristic = None
+        self._start_terms = None
 
     """
     Get a list of all the different tile names
@@ -38,6 +43,89 @@ class Problem:
     def get_stats(self, map):
         raise NotImplementedError('get_graphics is not implemented')
 
+    """
+    Get the stats of a group of same sized maps together. The stats are returned column by column
+    where every stat is an array with a value for every map (an object array for the stats that
+    are not numbers). The default implementation calls get_stats for every map.
+
+    Parameters:
+        maps (any[][][]): the maps that are evaluated
+
+    Returns:
+        dict(string,numpy.ndarray): the stats of all the maps with the same names as get_stats
+    """
+    def get_stats_batch(self, maps):
+        return self._stack_stats([self.get_stats(map) for map in maps])
+
+    """
+    Private function to join the stats of many maps into the columns of get_stats_batch
+
+    Parameters:
+        stats_list (dict(string,any)[]): the stats of every map
+
+    Returns:
+        dict(string,numpy.ndarray): the stats of all the maps
+    """
+    def _stack_stats(self, stats_list):
+        stats = {}
+        if len(stats_list) == 0:
+            return stats
+        for name in stats_list[0]:
+            values = [s[name] for s in stats_list]
+            if all(np.isscalar(v) for v in values):
+                stats[name] = np.array(values)
+            else:
+                stats[name] = np.empty(len(values), dtype=object)
+                for i, v in enumerate(values):
+                    stats[name][i] = v
+        return stats
+
+    """
+    Split the stats from get_stats_batch into the stats of every map
+
+    Parameters:
+        stats (dict(string,numpy.ndarray)): the stats of all the maps
+
+    Returns:
+        dict(string,any)[]: the stats of every map similar to get_stats
+    """
+    def get_stats_list(self, stats):
+        columns = dict((name, values.tolist()) for name, values in stats.items())
+        number = len(next(iter(columns.values()))) if len(columns) > 0 else 0
+        return [dict((name, values[i]) for name, values in columns.items()) for i in range(number)]
+
+    """
+    Get any information about a map that makes get_stats_delta faster when it is called
+    for many different single tile changes of that same map
+
+    Parameters:
+        map (any[][]): the current game map before any change
+
+    Returns:
+        any: the information that is passed to get_stats_delta, None if there is nothing to share
+    """
+    def get_stats_cache(self, map):
+        return None
+
+    """
+    Get the current stats of the map after changing a single tile. The default
+    implementation recalculates all the stats from scratch.
+
+    Parameters:
+        map (any[][]): the current game map after the change
+        old_stats (dict(string,any)): the stats of the map before the change
+        x (int): the x position of the changed tile
+        y (int): the y position of the changed tile
+        old (any): the tile value before the change
+        new (any): the tile value after the change
+        cache (any): the information from get_stats_cache of the map before the change
+
+    Returns:
+        dict(string,any): stats of the current map similar to get_stats
+    """
+    def get_stats_delta(self, map, old_stats, x, y, old, new, cache=None):
+        return self.get_stats(map)
+
     """
     Get the current game reward between two stats
 
@@ -65,6 +153,107 @@ class Problem:
     def get_episode_over(self, new_stats, old_stats):
         raise NotImplementedError('get_graphics is not implemented')
 
+    """
+    Get the terms of the heuristic, every term rewards moving a value of the stats toward its
+    optimal range using get_range_reward
+
+    Returns:
+        (string or function,float,float,float)[]: the stat name (or a function that gets the value
+        from the stats) then the low and high bounds of the optimal range and the weight of every term
+    """
+    def get_heuristic_terms(self):
+        raise NotImplementedError('get_heuristic_terms is not implemented')
+
+    """
+    Private function to get the heuristic terms compiled into value getters and bound and weight arrays.
+    The terms are compiled the first time they are used and the terms with zero weight are dropped.
+
+    Returns:
+        (function,float,float,float)[]: the value getter, the bounds and the weight of every term
+        float[][]: the low and high bounds of every term as two columns
+        float[]: the weight of every term
+    """
+    def _get_heuristic(self):
+        if self._heuristic is None:
+            terms = []
+            for value, low, high, weight in self.get_heuristic_terms():
+                if weight == 0:
+                    continue
+                if isinstance(value, str):
+                    value = itemgetter(value)
+                terms.append((value, low, high, weight))
+            bounds = np.array([[t[1], t[2]] for t in terms], dtype=np.float64).reshape(-1, 2)
+            weights = np.array([t[3] for t in terms], dtype=np.float64)
+            self._heuristic = (terms, bounds, weights)
+        return self._heuristic
+
+    """
+    Get the heuristic value of the stats compared to the start stats by adding the weighted
+    range reward of every heuristic term
+
+    Parameters:
+        new_stats (dict(string,any)): the stats of the map
+        start_stats (dict(string,any)): the stats of the start map
+
+    Returns:
+        float: the heuristic value of the map
+    """
+    def get_heuristic(self, new_stats, start_stats):
+        total = 0
+        for value, start, low, high, weight in self._get_start_terms(start_stats):
+            total += get_range_reward(value(new_stats), start, low, high) * weight
+        return total
+
+    """
+    Private function to get the compiled heuristic terms with the values of the start stats. The
+    start stats rarely change so the terms of the last start stats are remembered.
+
+    Parameters:
+        start_stats (dict(string,any)): the stats of the start map
+
+    Returns:
+        (function,any,float,float,float)[]: the value getter, the start value, the bounds and the weight of every term
+    """
+    def _get_start_terms(self, start_stats):
+        if self._start_terms is None or self._start_terms[0] is not start_stats:
+            terms, _, _ = self._get_heuristic()
+            self._start_terms = (start_stats, [(value, value(start_stats), low, high, weight) for value, low, high, weight in terms])
+        return self._start_terms[1]
+
+    """
+    Get the heuristic of many maps from their stats where the range rewards of all the terms
+    and all the maps are calculated together
+
+    Parameters:
+        stats (dict(string,numpy.ndarray)): the stats of all the maps from get_stats_batch
+        start_stats (dict(string,any)): the stats of the start map
+
+    Returns:
+        float[]: the heuristic of every map
+    """
+    def get_heuristic_batch(self, stats, start_stats):
+        terms, bounds, weights = self._get_heuristic()
+        if len(terms) == 0:
+            return np.zeros(len(next(iter(stats.values()))))
+        values = np.array([t[0](stats) for t in terms], dtype=np.float64)
+        starts = np.array([t[0](start_stats) for t in terms], dtype=np.float64)[:,None]
+        rewards = get_range_reward_batch(values, starts, bounds[:,:1], bounds[:,1:])
+        return weights @ rewards
+
+    """
+    Check if the problem ended (episode_over) for many maps from their stats. The default
+    implementation calls get_episode_over for the stats of every map.
+
+    Parameters:
+        stats (dict(string,numpy.ndarray)): the stats of all the maps from get_stats_batch
+        start_stats (dict(string,any)): the stats of the start map
+
+    Returns:
+        boolean[]: True for the maps that reached satisfying quality and False otherwise
+    """
+    def get_episode_over_batch(self, stats, start_stats):
+        return np.array([self.get_episode_over(s, start_stats) for s in self.get_stats_list(stats)], dtype=bool)
+
     """
     Get any debug information need to be printed
 
@@ -79,6 +268,12 @@ class Problem:
     def get_debug_info(self, new_stats, old_stats):
         raise NotImplementedError('get_debug_info is not implemented')
 
+    """
+    Release anything the problem keeps running between evaluations (like worker processes)
+    """
+    def close(self):
+        pass
+
     """
     Get an image on how the map will look like for a specific map
 
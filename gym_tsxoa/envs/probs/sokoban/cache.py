@@ -0,0 +1,156 @@
+"""
+A module that memoizes the sokoban solver results so the same level is never solved twice
+"""
+import os
+import sqlite3
+from collections import OrderedDict
+from gym_tsxoa.envs.probs.sokoban.engine import directions
+
+_moves = "LRUD"
+
+"""
+Encode a solver solution as a string of moves
+
+Parameters:
+    solution (dict(string,int)[]): the directions of the solution from the solver
+
+Returns:
+    string: a character from "LRUD" for every move in the solution
+"""
+def encode_solution(solution):
+    return "".join(_moves[directions.index(d)] for d in solution)
+
+"""
+Decode a string of moves back to a solver solution
+
+Parameters:
+    moves (string): a character from "LRUD" for every move in the solution
+
+Returns:
+    dict(string,int)[]: the directions of the solution similar to the solver, every direction
+    is a new dictionary so changing it doesn't change the engine directions
+"""
+def decode_solution(moves):
+    return [dict(directions[_moves.index(m)]) for m in moves]
+
+"""
+A solver result cache that keeps the most recently used results in memory and can also keep
+all the results in a sqlite file that is shared between runs and worker processes. Every process
+opens its own connection to the file when it first needs it.
+"""
+class SolverCache:
+    """
+    Initialize the cache
+
+    Parameters:
+        size (int): the maximum number of results that are kept in memory
+        path (string): the path of the sqlite file, None to only keep the results in memory
+    """
+    def __init__(self, size=100000, path=None):
+        self._size = size
+        self._path = path
+        self._entries = OrderedDict()
+        self._db = None
+        self._pid = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    """
+    Private function to get the sqlite connection of the current process
+
+    Returns:
+        sqlite3.Connection: the connection to the cache file, None if the cache is only in memory
+    """
+    def _get_db(self):
+        if self._path is None:
+            return None
+        if self._db is None or self._pid != os.getpid():
+            self._db = sqlite3.connect(self._path, timeout=60)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS results (key BLOB PRIMARY KEY, dist_win REAL, solution TEXT)")
+            self._db.commit()
+            self._pid = os.getpid()
+        return self._db
+
+    """
+    Private function to add a result to the memory part of the cache
+
+    Parameters:
+        key (bytes): the key of the level
+        value ((float,string)): the distance to win and the encoded solution
+    """
+    def _remember(self, key, value):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        if len(self._entries) > self._size:
+            self._entries.popitem(last=False)
+
+    """
+    Get the solver result of a level
+
+    Parameters:
+        key (bytes): the key of the level
+
+    Returns:
+        (float,string): the distance to win and the encoded solution, None if the level wasn't solved before
+    """
+    def get(self, key):
+        value = self._entries.get(key)
+        if value is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+        db = self._get_db()
+        if db is not None:
+            row = db.execute("SELECT dist_win, solution FROM results WHERE key=?", (key,)).fetchone()
+            if row is not None:
+                value = (row[0], row[1])
+                self._remember(key, value)
+                self.hits += 1
+                self.disk_hits += 1
+                return value
+        self.misses += 1
+        return None
+
+    """
+    Add the solver result of a level
+
+    Parameters:
+        key (bytes): the key of the level
+        value ((float,string)): the distance to win and the encoded solution
+    """
+    def put(self, key, value):
+        self._remember(key, value)
+        db = self._get_db()
+        if db is not None:
+            db.execute("INSERT OR REPLACE INTO results VALUES (?,?,?)", (key, value[0], value[1]))
+            db.commit()
+
+    """
+    Get the usage counters of the cache
+
+    Returns:
+        dict(string,int): the number of "hits" (including "disk_hits"), "misses", and the number of results in memory "size"
+    """
+    def get_counters(self):
+        return {"hits": self.hits, "disk_hits": self.disk_hits, "misses": self.misses, "size": len(self._entries)}
+
+_caches = {}
+
+"""
+Get the solver cache that is shared by all the problems that use the same file and memory size
+
+Parameters:
+    size (int): the maximum number of results that are kept in memory
+    path (string): the path of the sqlite file, None to only keep the results in memory
+
+Returns:
+    SolverCache: the shared solver cache
+"""
+def get_solver_cache(size=100000, path=None):
+    key = (path, size)
+    if key not in _caches:
+        _caches[key] = SolverCache(size, path)
+    return _caches[key]
@@ -0,0 +1,124 @@
+from collections import OrderedDict
+
+# the dead squares of the most recent layouts so boards with the same walls and targets share them
+deadSquaresCache = OrderedDict()
+deadSquaresCacheSize = 10000
+
+def _getNeighbors(width, height, index):
+    x, y = index % width, index // width
+    neighbors = []
+    for dx, dy in [(-1,0), (1,0), (0,-1), (0,1)]:
+        if x + dx < 0 or y + dy < 0 or x + dx >= width or y + dy >= height:
+            neighbors.append(-1)
+        else:
+            neighbors.append((y + dy) * width + x + dx)
+    return neighbors
+
+def _calcDeadSquares(width, height, walls, targets):
+    size = width * height
+    neighbors = [_getNeighbors(width, height, i) for i in range(size)]
+    # pull the crates backward from every target where the player has to stand behind the crate
+    live = [False] * size
+    queue = []
+    for t in targets:
+        if not live[t]:
+            live[t] = True
+            queue.append(t)
+    for n in queue:
+        for d in range(4):
+            crate = neighbors[n][d]
+            if crate < 0 or walls[crate] or live[crate]:
+                continue
+            player = neighbors[crate][d]
+            if player < 0 or walls[player]:
+                continue
+            live[crate] = True
+            queue.append(crate)
+    return [not walls[i] and not live[i] for i in range(size)]
+
+def getDeadSquares(width, height, walls, targets):
+    key = (width, tuple(walls), tuple(targets))
+    if key in deadSquaresCache:
+        deadSquaresCache.move_to_end(key)
+        return deadSquaresCache[key]
+    dead = _calcDeadSquares(width, height, walls, targets)
+    deadSquaresCache[key] = dead
+    if len(deadSquaresCache) > deadSquaresCacheSize:
+        deadSquaresCache.popitem(last=False)
+    return dead
+
+# the 2x2 squares only depend on the board size
+blockSquaresCache = {}
+
+def getBlockSquares(board):
+    # the bitmasks of the 2x2 squares around every tile, the tiles outside the board are left
+    # out as they are always blocked
+    if (board.width, board.height) in blockSquaresCache:
+        return blockSquaresCache[(board.width, board.height)]
+    squares = []
+    for index in range(board.size):
+        squares.append([])
+        for side in [(-1,0), (1,0)]:
+            for vertical in [(0,-1), (0,1)]:
+                first = board.moves[side][index]
+                second = board.moves[vertical][index]
+                third = -1
+                if first >= 0:
+                    third = board.moves[vertical][first]
+                mask = 1 << index
+                for i in [first, second, third]:
+                    if i >= 0:
+                        mask |= 1 << i
+                squares[index].append(mask)
+    blockSquaresCache[(board.width, board.height)] = squares
+    return squares
+
+def checkBlockDeadlock(board, crates, index):
+    # a 2x2 square of walls and crates around the moved crate where a crate is not on a target
+    blocked = board.wallMask | crates
+    for mask in board.squares[index]:
+        if blocked & mask == mask and crates & mask & ~board.targetMask:
+            return True
+    return False
+
+def _isAxisBlocked(board, crates, index, axis, walls, frozen):
+    first, second = board.moves[axis][index], board.moves[(-axis[0], -axis[1])][index]
+    if first < 0 or second < 0:
+        return True
+    walls |= board.wallMask
+    if (walls >> first) & 1 or (walls >> second) & 1:
+        return True
+    if board.dead[first] and board.dead[second]:
+        return True
+    # the current crate is a wall while checking its neighbors to avoid circular checks
+    walls |= 1 << index
+    for n in [first, second]:
+        if (crates >> n) & 1 and _isFrozen(board, crates, n, walls, frozen):
+            return True
+    return False
+
+def _isFrozen(board, crates, index, walls, frozen):
+    # the crates found frozen while checking a crate that turns out to move are not frozen
+    # as they were checked with that crate standing as a wall
+    start = len(frozen)
+    if _isAxisBlocked(board, crates, index, (1,0), walls, frozen) and _isAxisBlocked(board, crates, index, (0,1), walls, frozen):
+        frozen.append(index)
+        return True
+    del frozen[start:]
+    return False
+
+def checkFreezeDeadlock(board, crates, index):
+    # a crate on a target that doesn't touch other crates is fine even if it can't move
+    if (board.targetMask >> index) & 1 and not crates & board.around[index]:
+        return False
+    # the moved crate can't move on both axes and itself or one of the crates blocking it is not on a target
+    frozen = []
+    if not _isFrozen(board, crates, index, 0, frozen):
+        return False
+    for i in frozen:
+        if not (board.targetMask >> i) & 1:
+            return True
+    return False
+
+def checkDynamicDeadlock(board, crates, index):
+    return checkBlockDeadlock(board, crates, index) or checkFreezeDeadlock(board, crates, index)
@@ -1,4 +1,5 @@
-from queue import PriorityQueue
+from gym_tsxoa.envs.frontier import create_frontier
+from gym_tsxoa.envs.probs.sokoban.deadlock import getDeadSquares, getBlockSquares, checkDynamicDeadlock
 
 directions = [{"x":-1, "y":0}, {"x":1, "y":0}, {"x":0, "y":-1}, {"x":0, "y":1}]
 class Node:
@@ -10,17 +11,26 @@ class Node:
         self.depth = 0
         if self.parent != None:
             self.depth = parent.depth + 1
-
-    def getChildren(self):
+        self.heuristic = None
+
+    def getChildren(self, table=None):
+        # the transposition table keeps the children states of every expanded state so
+        # solvers that share it never generate the same children twice
+        if table is not None:
+            key = self.getKey()
+            if key in table:
+                return [Node(childState, self, d) for childState, d in table[key]]
         children = []
         for d in directions:
             childState = self.state.clone()
             crateMove = childState.update(d["x"], d["y"])
-            if childState.player["x"] == self.state.player["x"] and childState.player["y"] == self.state.player["y"]:
+            if childState.getPlayerIndex() == self.state.getPlayerIndex():
                 continue
             if crateMove and childState.checkDeadlock():
                 continue
             children.append(Node(childState, self, d))
+        if table is not None:
+            table[key] = [(c.state, c.action) for c in children]
         return children
 
     def getKey(self):
@@ -30,7 +40,9 @@ class Node:
         return self.depth
 
     def getHeuristic(self):
-        return self.state.getHeuristic()
+        if self.heuristic is None:
+            self.heuristic = self.state.getHeuristic()
+        return self.heuristic
 
     def checkWin(self):
         return self.state.checkWin()
@@ -50,11 +62,15 @@ class Node:
         return self.getHeuristic()+Node.balance*self.getCost() < other.getHeuristic()+Node.balance*other.getCost()
 
 class Agent:
+    def __init__(self):
+        # if the last search visited every reachable state without finding a win
+        self.exhausted = False
+
     def getSolution(self, state, maxIterations):
         return []
 
 class BFSAgent(Agent):
-    def getSolution(self, state, maxIterations=-1):
+    def getSolution(self, state, maxIterations=-1, table=None):
         iterations = 0
         bestNode = None
         queue = [Node(state.clone(), None, None)]
@@ -63,6 +79,7 @@ class BFSAgent(Agent):
             iterations += 1
             current = queue.pop(0)
             if current.checkWin():
+                self.exhausted = False
                 return current.getActions(), current, iterations
             if current.getKey() not in visisted:
                 if bestNode == None or current.getHeuristic() < bestNode.getHeuristic():
@@ -70,11 +87,12 @@ class BFSAgent(Agent):
                 elif current.getHeuristic() == bestNode.getHeuristic() and current.getCost() < bestNode.getCost():
                     bestNode = current
                 visisted.add(current.getKey())
-                queue.extend(current.getChildren())
+                queue.extend(current.getChildren(table))
+        self.exhausted = len(queue) == 0
         return bestNode.getActions(), bestNode, iterations
 
 class DFSAgent(Agent):
-    def getSolution(self, state, maxIterations=-1):
+    def getSolution(self, state, maxIterations=-1, table=None):
         iterations = 0
         bestNode = None
         queue = [Node(state.clone(), None, None)]
@@ -83,6 +101,7 @@ class DFSAgent(Agent):
             iterations += 1
             current = queue.pop()
             if current.checkWin():
+                self.exhausted = False
                 return current.getActions(), current, iterations
             if current.getKey() not in visisted:
                 if bestNode == None or current.getHeuristic() < bestNode.getHeuristic():
@@ -90,22 +109,24 @@ class DFSAgent(Agent):
                 elif current.getHeuristic() == bestNode.getHeuristic() and current.getCost() < bestNode.getCost():
                     bestNode = current
                 visisted.add(current.getKey())
-                queue.extend(current.getChildren())
+                queue.extend(current.getChildren(table))
+        self.exhausted = len(queue) == 0
         return bestNode.getActions(), bestNode, iterations
 
 class AStarAgent(Agent):
-    def getSolution(self, state, balance=1, maxIterations=-1):
+    def getSolution(self, state, balance=1, maxIterations=-1, frontier="heap", beamSize=None, table=None):
         iterations = 0
         bestNode = None
         Node.balance = balance
-        queue = PriorityQueue()
-        queue.put(Node(state.clone(), None, None))
+        queue = create_frontier(frontier, beamSize)
+        root = Node(state.clone(), None, None)
+        queue.push(root.getHeuristic() + balance*root.getCost(), root)
         visisted = set()
-        while (iterations < maxIterations or maxIterations <= 0) and queue.qsize() > 0:
+        while (iterations < maxIterations or maxIterations <= 0) and len(queue) > 0:
             iterations += 1
-            # queue = sorted(queue, key=lambda node: balance*node.getCost() + node.getHeuristic())
-            current = queue.get()
+            current = queue.pop()
             if current.checkWin():
+                self.exhausted = False
                 return current.getActions(), current, iterations
             if current.getKey() not in visisted:
                 if bestNode == None or current.getHeuristic() < bestNode.getHeuristic():
@@ -113,9 +134,167 @@ class AStarAgent(Agent):
                 elif current.getHeuristic() == bestNode.getHeuristic() and current.getCost() < bestNode.getCost():
                     bestNode = current
                 visisted.add(current.getKey())
-                children = current.getChildren()
+                children = current.getChildren(table)
                 for c in children:
-                    queue.put(c)
+                    queue.push(c.getHeuristic() + balance*c.getCost(), c)
+        self.exhausted = len(queue) == 0
+        return bestNode.getActions(), bestNode, iterations
+
+class SolverPortfolio:
+    def __init__(self, strategies=None):
+        # every strategy is a name, an agent and the extra parameters of its getSolution
+        self.strategies = strategies
+        if self.strategies is None:
+            self.strategies = [
+                ("bfs", BFSAgent(), {}),
+                ("astar1", AStarAgent(), {"balance": 1}),
+                ("astar0.5", AStarAgent(), {"balance": 0.5}),
+                ("astar0", AStarAgent(), {"balance": 0})
+            ]
+        self.iterations = {}
+        self.table = {}
+
+    def getSolution(self, state, maxIterations=-1):
+        self.iterations = {}
+        self.table = {}
+        totalIterations = 0
+        for name, agent, parameters in self.strategies:
+            # the strategies keep their own visited sets so every one can reach all the
+            # states, while the children of every state are only generated once
+            sol, node, iterations = agent.getSolution(state, maxIterations=maxIterations, table=self.table, **parameters)
+            self.iterations[name] = iterations
+            totalIterations += iterations
+            # exhausting all the reachable states proves that the other strategies can't win either
+            if node.checkWin() or agent.exhausted:
+                break
+        return sol, node, totalIterations
+
+    def getIterations(self):
+        return self.iterations
+
+class PushNode:
+    def __init__(self, state, parent, start, direction, cost):
+        self.state = state
+        self.parent = parent
+        # the tile the player walked to before pushing and the push direction
+        self.start = start
+        self.direction = direction
+        self.cost = cost
+        self.depth = 0
+        if self.parent != None:
+            self.depth = parent.depth + 1
+
+    def getCost(self):
+        return self.cost
+
+    def getHeuristic(self):
+        return self.state.getHeuristic()
+
+    def checkWin(self):
+        return self.state.checkWin()
+
+    def getActions(self):
+        nodes = []
+        current = self
+        while(current.parent != None):
+            nodes.insert(0,current)
+            current = current.parent
+        actions = []
+        for n in nodes:
+            actions.extend(PushAgent.getWalk(n.parent.state, n.start))
+            actions.append(n.direction)
+        return actions
+
+    def __str__(self):
+        return str(self.cost) + "," + str(self.state.getHeuristic()) + "\n" + str(self.state)
+
+class PushAgent(Agent):
+    @staticmethod
+    def getReachable(state):
+        board = state.board
+        blocked = list(board.walls)
+        for c in state.getCrates():
+            blocked[c] = True
+        dist = [-1] * board.size
+        dist[state.position] = 0
+        queue = [state.position]
+        for p in queue:
+            nextDist = dist[p] + 1
+            for n in board.neighbors[p]:
+                if dist[n] < 0 and not blocked[n]:
+                    dist[n] = nextDist
+                    queue.append(n)
+        return dist, queue
+
+    @staticmethod
+    def getWalk(state, target):
+        board = state.board
+        previous = {state.position: None}
+        queue = [state.position]
+        for p in queue:
+            if p == target:
+                break
+            for d in directions:
+                n = board.moves[(d["x"], d["y"])][p]
+                if n >= 0 and n not in previous and not board.walls[n] and not (state.crates >> n) & 1:
+                    previous[n] = (p, d)
+                    queue.append(n)
+        walk = []
+        current = target
+        while previous[current] is not None:
+            current, d = previous[current]
+            walk.insert(0, d)
+        return walk
+
+    def getSolution(self, state, maxIterations=-1):
+        if not isinstance(state, BitState):
+            bitState = BitState()
+            bitState.stateInitialize(state)
+            state = bitState
+        board = state.board
+        pushes = [(d, board.moves[(d["x"], d["y"])], board.moves[(-d["x"], -d["y"])]) for d in directions]
+        iterations = 0
+        bestNode = None
+        queue = create_frontier("heap")
+        queue.push(0, PushNode(state.clone(), None, None, None, 0))
+        visisted = set()
+        # the cheapest cost found so far for every state so a cheaper path to a state is pushed again
+        costs = {state.getKey(): 0}
+        while (iterations < maxIterations or maxIterations <= 0) and len(queue) > 0:
+            current = queue.pop()
+            # the player step cost depends on its exact tile so the states are only merged on it
+            key = current.state.getKey()
+            if key in visisted or current.cost > costs[key]:
+                continue
+            if current.checkWin():
+                return current.getActions(), current, iterations
+            # the dynamic deadlocks are only checked for the popped nodes as most generated nodes are never popped
+            if current.parent != None:
+                moved = board.moves[(current.direction["x"], current.direction["y"])][current.state.position]
+                if checkDynamicDeadlock(board, current.state.crates, moved):
+                    continue
+            dist, reachable = PushAgent.getReachable(current.state)
+            iterations += 1
+            if bestNode == None or current.getHeuristic() < bestNode.getHeuristic():
+                bestNode = current
+            elif current.getHeuristic() == bestNode.getHeuristic() and current.getCost() < bestNode.getCost():
+                bestNode = current
+            visisted.add(key)
+            crates = current.state.crates
+            for crate in current.state.getCrates():
+                for d, forward, backward in pushes:
+                    start, target = backward[crate], forward[crate]
+                    if start < 0 or target < 0 or dist[start] < 0:
+                        continue
+                    if board.walls[target] or (crates >> target) & 1 or (board.deadlockMask >> target) & 1:
+                        continue
+                    child = BitState(board, crate, crates ^ (1 << crate) ^ (1 << target))
+                    cost = current.cost + dist[start] + 1
+                    childKey = child.getKey()
+                    if childKey in costs and costs[childKey] <= cost:
+                        continue
+                    costs[childKey] = cost
+                    queue.push(cost, PushNode(child, current, start, d, cost))
         return bestNode.getActions(), bestNode, iterations
 
 class State:
@@ -201,49 +380,16 @@ class State:
         return clone
 
     def intializeDeadlocks(self):
-        sign = lambda x: int(x/max(1,abs(x)))
-
-        self.deadlocks = []
+        walls, targets = [], []
         for y in range(self.height):
-            self.deadlocks.append([])
             for x in range(self.width):
-                self.deadlocks[y].append(False)
-
-        corners = []
+                walls.append(self.solid[y][x])
+        for t in self.targets:
+            targets.append(t["y"] * self.width + t["x"])
+        dead = getDeadSquares(self.width, self.height, walls, targets)
+        self.deadlocks = []
         for y in range(self.height):
-            for x in range(self.width):
-                if x == 0 or y == 0 or x == self.width - 1 or y == self.height - 1 or self.solid[y][x]:
-                    continue
-                if (self.solid[y-1][x] and self.solid[y][x-1]) or (self.solid[y-1][x] and self.solid[y][x+1]) or (self.solid[y+1][x] and self.solid[y][x-1]) or (self.solid[y+1][x] and self.solid[y][x+1]):
-                    if not self.checkTargetLocation(x, y):
-                        corners.append({"x":x, "y":y})
-                        self.deadlocks[y][x] = True
-
-        for c1 in corners:
-            for c2 in corners:
-                dx,dy = sign(c1["x"] - c2["x"]), sign(c1["y"] - c2["y"])
-                if (dx == 0 and dy == 0) or (dx != 0 and dy != 0):
-                    continue
-                walls = []
-                x,y=c2["x"],c2["y"]
-                if dx != 0:
-                    x += dx
-                    while x != c1["x"]:
-                        if self.checkTargetLocation(x,y) or self.solid[y][x] or (not self.solid[y-1][x] and not self.solid[y+1][x]):
-                            walls = []
-                            break
-                        walls.append({"x":x, "y":y})
-                        x += dx
-                if dy != 0:
-                    y += dy
-                    while y != c1["y"]:
-                        if self.checkTargetLocation(x,y) or self.solid[y][x] or (not self.solid[y][x-1] and not self.solid[y][x+1]):
-                            walls = []
-                            break
-                        walls.append({"x":x, "y":y})
-                        y += dy
-                for w in walls:
-                    self.deadlocks[w["y"]][w["x"]] = True
+            self.deadlocks.append(dead[y * self.width:(y + 1) * self.width])
 
     def checkDeadlock(self):
         for c in self.crates:
@@ -279,6 +425,9 @@ class State:
 
         return True
 
+    def getPlayerIndex(self):
+        return self.player["y"] * self.width + self.player["x"]
+
     def getHeuristic(self):
         targets=[]
         for t in self.targets:
@@ -361,3 +510,248 @@ class State:
                             result += " "
             result += "\n"
         return result[:-1]
+
+class Board:
+    def __init__(self, state, pushHeuristic=False):
+        self.pushHeuristic = pushHeuristic
+        self.width = state.width
+        self.height = state.height
+        self.size = self.width * self.height
+        self.solid = state.solid
+        self.xs = [i % self.width for i in range(self.size)]
+        self.ys = [i // self.width for i in range(self.size)]
+        self.walls = [state.solid[self.ys[i]][self.xs[i]] for i in range(self.size)]
+        self.targets = []
+        self.targetMask = 0
+        for t in state.targets:
+            self.targets.append(t["y"] * self.width + t["x"])
+            self.targetMask |= 1 << self.targets[-1]
+        # the tiles that a crate can never leave to reach a target
+        self.dead = getDeadSquares(self.width, self.height, self.walls, self.targets)
+        self.deadlockMask = 0
+        for i in range(self.size):
+            if self.dead[i]:
+                self.deadlockMask |= 1 << i
+        # the index of the next tile in every direction, -1 if it is outside the board
+        self.moves = {}
+        for d in directions:
+            self.moves[(d["x"], d["y"])] = [self._getIndex(self.xs[i] + d["x"], self.ys[i] + d["y"]) for i in range(self.size)]
+        self.neighbors = [[m[i] for m in self.moves.values() if m[i] >= 0] for i in range(self.size)]
+        self.wallMask = 0
+        for i in range(self.size):
+            if self.walls[i]:
+                self.wallMask |= 1 << i
+        self.around = [sum(1 << n for n in self.neighbors[i]) for i in range(self.size)]
+        self.squares = getBlockSquares(self)
+        # the distance from every tile to every target, either the manhattan distance or the
+        # number of pushes ignoring the other crates (the board size if it can't be pushed there)
+        if self.pushHeuristic:
+            self.targetDistances = [list(row) for row in zip(*[self._getPushDistances(t) for t in self.targets])]
+            if len(self.targets) == 0:
+                self.targetDistances = [[] for i in range(self.size)]
+        else:
+            self.targetDistances = [[abs(self.xs[i] - self.xs[t]) + abs(self.ys[i] - self.ys[t]) for t in self.targets] for i in range(self.size)]
+
+    def _getPushDistances(self, target):
+        # going backward from the target where every crate is pulled by a player behind it
+        dist = [-1] * self.size
+        dist[target] = 0
+        queue = [target]
+        for n in queue:
+            for back in self.moves.values():
+                crate = back[n]
+                if crate < 0 or self.walls[crate] or dist[crate] >= 0:
+                    continue
+                player = back[crate]
+                if player < 0 or self.walls[player]:
+                    continue
+                dist[crate] = dist[n] + 1
+                queue.append(crate)
+        return [d if d >= 0 else self.size for d in dist]
+
+    def _getIndex(self, x, y):
+        if x < 0 or y < 0 or x >= self.width or y >= self.height:
+            return -1
+        return y * self.width + x
+
+class BitState:
+    def __init__(self, board=None, position=-1, crates=0, heuristic=None):
+        self.board = board
+        self.position = position
+        self.crates = crates
+        self._heuristic = heuristic
+        # the crate moved by the last update, -1 if no crate moved
+        self._moved = -1
+
+    def stringInitialize(self, lines, pushHeuristic=False):
+        state = State()
+        state.stringInitialize(lines)
+        self.stateInitialize(state, pushHeuristic)
+
+    def stateInitialize(self, state, pushHeuristic=False):
+        self.board = Board(state, pushHeuristic)
+        self.position = -1
+        if state.player is not None:
+            self.position = state.player["y"] * self.board.width + state.player["x"]
+        self.crates = 0
+        self._heuristic = None
+        for c in state.crates:
+            self.crates |= 1 << (c["y"] * self.board.width + c["x"])
+
+    @property
+    def width(self):
+        return self.board.width
+
+    @property
+    def height(self):
+        return self.board.height
+
+    @property
+    def solid(self):
+        return self.board.solid
+
+    @property
+    def player(self):
+        return {"x":self.board.xs[self.position], "y":self.board.ys[self.position]}
+
+    @property
+    def targets(self):
+        return [{"x":self.board.xs[t], "y":self.board.ys[t]} for t in self.board.targets]
+
+    def getCrates(self):
+        crates = []
+        bits = self.crates
+        while bits:
+            low = bits & -bits
+            crates.append(low.bit_length() - 1)
+            bits ^= low
+        return crates
+
+    def clone(self):
+        return BitState(self.board, self.position, self.crates, self._heuristic)
+
+    def checkDeadlock(self):
+        if self.crates & self.board.deadlockMask != 0:
+            return True
+        return self._moved >= 0 and checkDynamicDeadlock(self.board, self.crates, self._moved)
+
+    def checkOutside(self, x, y):
+        return x < 0 or y < 0 or x > self.board.width - 1 or y > self.board.height - 1
+
+    def checkTargetLocation(self, x, y):
+        if self.checkOutside(x, y) or not (self.board.targetMask >> (y * self.board.width + x)) & 1:
+            return None
+        return {"x":x, "y":y}
+
+    def checkCrateLocation(self, x, y):
+        if self.checkOutside(x, y) or not (self.crates >> (y * self.board.width + x)) & 1:
+            return None
+        return {"x":x, "y":y}
+
+    def checkMovableLocation(self, x, y):
+        return not self.checkOutside(x, y) and not self._isBlocked(y * self.board.width + x)
+
+    def _isBlocked(self, index):
+        return index < 0 or self.board.walls[index] or (self.crates >> index) & 1
+
+    def checkWin(self):
+        return self.board.targetMask != 0 and self.crates == self.board.targetMask
+
+    def getPlayerIndex(self):
+        return self.position
+
+    def getHeuristic(self):
+        if self._heuristic is not None:
+            return self._heuristic
+        if self.board.pushHeuristic:
+            self._heuristic = self._getMatching()
+            return self._heuristic
+        targetDistances = self.board.targetDistances
+        targets = list(range(len(self.board.targets)))
+        distance = 0
+        for c in self.getCrates():
+            dists = targetDistances[c]
+            bestDist = self.board.width + self.board.height
+            bestMatch = 0
+            for i,t in enumerate(targets):
+                if bestDist > dists[t]:
+                    bestMatch = i
+                    bestDist = dists[t]
+            distance += dists[targets[bestMatch]]
+            del targets[bestMatch]
+        self._heuristic = distance
+        return distance
+
+    def _getMatching(self):
+        # the smallest total distance where every crate goes to a different target
+        targetDistances = self.board.targetDistances
+        crates = self.getCrates()
+        number = len(self.board.targets)
+        if len(crates) != number:
+            return sum(min(targetDistances[c], default=0) for c in crates)
+        costs = {0: 0}
+        for c in crates:
+            dists = targetDistances[c]
+            newCosts = {}
+            for mask, cost in costs.items():
+                for t in range(number):
+                    if (mask >> t) & 1:
+                        continue
+                    newMask = mask | (1 << t)
+                    if newMask not in newCosts or newCosts[newMask] > cost + dists[t]:
+                        newCosts[newMask] = cost + dists[t]
+            costs = newCosts
+        return costs[(1 << number) - 1]
+
+    def update(self, dirX, dirY):
+        if abs(dirX) > 0 and abs(dirY) > 0:
+            return
+        if self.checkWin():
+            return
+        self._moved = -1
+        dirX, dirY = (dirX > 0) - (dirX < 0), (dirY > 0) - (dirY < 0)
+        moves = self.board.moves[(dirX, dirY)]
+        newIndex = moves[self.position]
+        if not self._isBlocked(newIndex):
+            self.position = newIndex
+        elif newIndex >= 0 and (self.crates >> newIndex) & 1:
+            crateIndex = moves[newIndex]
+            if not self._isBlocked(crateIndex):
+                self.position = newIndex
+                self.crates ^= (1 << newIndex) | (1 << crateIndex)
+                self._heuristic = None
+                self._moved = crateIndex
+                return True
+        return False
+
+    def getKey(self):
+        return self.crates * self.board.size + self.position
+
+    def __str__(self):
+        result = ""
+        for y in range(self.board.height):
+            for x in range(self.board.width):
+                index = y * self.board.width + x
+                if self.board.walls[index]:
+                    result += "#"
+                else:
+                    crate=(self.crates >> index) & 1
+                    target=(self.board.targetMask >> index) & 1
+                    player=self.position==index
+                    if crate:
+                        if target:
+                            result += "*"
+                        else:
+                            result += "$"
+                    elif player:
+                        if target:
+                            result += "+"
+                        else:
+                            result += "@"
+                    else:
+                        if target:
+                            result += "."
+                        else:
+                            result += " "
+            result += "\n"
+        return result[:-1]
@@ -1,9 +1,12 @@
 import os
+import weakref
+import multiprocessing
 from PIL import Image
 import numpy as np
 from gym_tsxoa.envs.probs.problem import Problem
-from gym_tsxoa.envs.helper import get_range_reward, get_tile_locations, calc_certain_tile, calc_num_regions
-from gym_tsxoa.envs.probs.sokoban.engine import State,BFSAgent,AStarAgent
+from gym_tsxoa.envs.helper import get_tile_locations, calc_certain_tile, calc_certain_tile_delta, calc_certain_tile_batch, calc_num_regions, calc_num_regions_delta, calc_num_regions_batch, get_regions_cache
+from gym_tsxoa.envs.probs.sokoban.engine import State,BitState,PushAgent,SolverPortfolio
+from gym_tsxoa.envs.probs.sokoban.cache import get_solver_cache, encode_solution, decode_solution
 
 """
 Generate a fully connected Sokoban(https://en.wikipedia.org/wiki/Sokoban) level that can be solved
@@ -20,6 +23,24 @@ class SokobanProblem(Problem):
         self._border_tile = 1
 
         self._solver_power = 5000
+        # use the compact sokoban state with the shared board and integer keys in the solver
+        self._bit_state = True
+        # search over crate pushes instead of player steps using a single solver pass
+        self._push_solver = False
+        # the compact state heuristic matches crates to targets using push distances that respect the walls,
+        # a crate that can't be pushed to any target adds the board size so unsolved levels get larger dist-win
+        self._push_heuristic = True
+        # the total iterations of every solver strategy since the problem was created
+        self._solver_iterations = {}
+        # the solver results are remembered for the most recent levels and optionally in a sqlite file
+        self._cache_size = 100000
+        self._cache_path = None
+        # the number of processes that solve the new levels of get_stats_batch, 1 solves them in this process
+        self._solver_workers = 1
+        # the solver workers are only created the first time they are needed and are kept until close
+        self._solver_pool = None
+        self._solver_pool_settings = None
+        self._solver_pool_finalizer = None
 
         self._max_crates = 3
 
@@ -45,16 +66,160 @@ class SokobanProblem(Problem):
         return [0, 1, 2, 3, 4]
 
     """
-    Private function that runs the game on the input level
+    Private function that runs the game on the input level or gets its result from the solver
+    cache if the same level was solved before with the same solver settings
 
     Parameters:
         map (string[][]): the input level to run the game on
 
     Returns:
         float: how close you are to winning (0 if you win)
-        int: the solution length if you win (0 otherwise)
+        dict(string,int)[]: the solution if you win (empty otherwise)
     """
     def _run_game(self, map):
+        cache = self.get_solver_cache()
+        key = self._get_solver_key(map)
+        value = cache.get(key)
+        if value is None:
+            dist_win, solution = self._solve_game(map)
+            value = (dist_win, encode_solution(solution))
+            cache.put(key, value)
+        return value[0], decode_solution(value[1])
+
+    """
+    Private function to get the key of a level in the solver cache
+
+    Parameters:
+        map (string[][]): the input level
+
+    Returns:
+        bytes: the key of the level with the solver settings
+    """
+    def _get_solver_key(self, map):
+        return "{},{},{},{},{}x{}|".format(self._solver_power, int(self._bit_state), int(self._push_solver), int(self._push_heuristic), self._width, self._height).encode() +\
+            np.asarray(map, dtype=np.uint8).tobytes()
+
+    """
+    Private function to get the settings that the solver needs, the solver workers build their own
+    problem from them so the whole problem is never sent to the workers
+
+    Returns:
+        dict(string,any): the problem attributes that are used by _solve_game
+    """
+    def _get_solver_settings(self):
+        return {
+            "_width": self._width,
+            "_height": self._height,
+            "_solver_power": self._solver_power,
+            "_bit_state": self._bit_state,
+            "_push_solver": self._push_solver,
+            "_push_heuristic": self._push_heuristic
+        }
+
+    """
+    Private function to get the pool of solver workers, it is created the first time it is needed
+    and again only if the solver settings or the number of workers change. Processes that are
+    daemons (like the workers of another pool) can't have workers so they solve the levels themselves.
+
+    Returns:
+        multiprocessing.Pool: the pool of solver workers or None if the levels are solved in this process
+    """
+    def _get_solver_pool(self):
+        if self._solver_workers <= 1 or multiprocessing.current_process().daemon:
+            return None
+        settings = (self._solver_workers, self._get_solver_settings())
+        if self._solver_pool is None or self._solver_pool_settings != settings:
+            self.close()
+            self._solver_pool = multiprocessing.Pool(self._solver_workers, _init_solver_worker, (settings[1],))
+            self._solver_pool_settings = settings
+            self._solver_pool_finalizer = weakref.finalize(self, self._solver_pool.terminate)
+        return self._solver_pool
+
+    """
+    Stop the solver workers if there are any, they are created again if they are needed later
+    """
+    def close(self):
+        if self._solver_pool_finalizer is not None:
+            self._solver_pool_finalizer()
+        self._solver_pool = None
+        self._solver_pool_settings = None
+        self._solver_pool_finalizer = None
+
+    """
+    The solver workers are not copied with the problem
+    """
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state["_solver_pool"] = None
+        state["_solver_pool_settings"] = None
+        state["_solver_pool_finalizer"] = None
+        return state
+
+    """
+    Private function that runs the game on a group of levels. Every level is only solved once
+    even if it appears many times, the levels in the solver cache are not solved again and the rest
+    are split between the solver workers when there is more than one.
+
+    Parameters:
+        maps (numpy.ndarray): the input levels
+
+    Returns:
+        float[]: how close every level is to winning (0 if you win)
+        dict(string,int)[][]: the solution of every level (empty if it doesn't win)
+    """
+    def _run_games(self, maps):
+        cache = self.get_solver_cache()
+        keys = [self._get_solver_key(map) for map in maps]
+        values = {}
+        levels = {}
+        for key, map in zip(keys, maps):
+            if key in values or key in levels:
+                continue
+            value = cache.get(key)
+            if value is None:
+                levels[key] = map
+            else:
+                values[key] = value
+        pool = self._get_solver_pool() if len(levels) > 1 else None
+        if pool is not None:
+            results = pool.map(_solve_level, list(levels.values()))
+        else:
+            results = []
+            for map in levels.values():
+                dist_win, solution = self._solve_game(map)
+                results.append((dist_win, solution, {}))
+        for key, (dist_win, solution, iterations) in zip(levels.keys(), results):
+            # the workers have their own problem so their iterations are added here
+            for name, value in iterations.items():
+                self._solver_iterations[name] = self._solver_iterations.get(name, 0) + value
+            values[key] = (dist_win, encode_solution(solution))
+            cache.put(key, values[key])
+        dist_wins = [values[key][0] for key in keys]
+        solutions = [decode_solution(values[key][1]) for key in keys]
+        return dist_wins, solutions
+
+    """
+    Get the solver cache that is used by this problem
+
+    Returns:
+        SolverCache: the solver cache that has the "hits", "misses" counters
+    """
+    def get_solver_cache(self):
+        return get_solver_cache(self._cache_size, self._cache_path)
+
+    """
+    Private function that runs the solvers on the input level. The first solution found within the solver
+    power is returned, so it is not always the shortest one and the solver options can change its length.
+
+    Parameters:
+        map (string[][]): the input level to run the game on
+
+    Returns:
+        float: how close you are to winning (0 if you win), the heuristic of the best state the solvers
+        found which uses push distances with _push_heuristic
+        dict(string,int)[]: the solution if you win (empty otherwise)
+    """
+    def _solve_game(self, map):
         gameCharacters=" #@$."
         string_to_char = dict((s, gameCharacters[i]) for i, s in enumerate(self.get_tile_types()))
         lvlString = ""
@@ -73,22 +238,23 @@ class SokobanProblem(Problem):
             lvlString += "#"
         lvlString += "\n"
 
-        state = State()
-        state.stringInitialize(lvlString.split("\n"))
+        if self._bit_state:
+            state = BitState()
+            state.stringInitialize(lvlString.split("\n"), self._push_heuristic)
+        else:
+            state = State()
+            state.stringInitialize(lvlString.split("\n"))
 
-        aStarAgent = AStarAgent()
-        bfsAgent = BFSAgent()
+        if self._push_solver:
+            sol,solState,iters = PushAgent().getSolution(state, self._solver_power)
+            if solState.checkWin():
+                return 0, sol
+            return solState.getHeuristic(), []
 
-        sol,solState,iters = bfsAgent.getSolution(state, self._solver_power)
-        if solState.checkWin():
-            return 0, sol
-        sol,solState,iters = aStarAgent.getSolution(state, 1, self._solver_power)
-        if solState.checkWin():
-            return 0, sol
-        sol,solState,iters = aStarAgent.getSolution(state, 0.5, self._solver_power)
-        if solState.checkWin():
-            return 0, sol
-        sol,solState,iters = aStarAgent.getSolution(state, 0, self._solver_power)
+        portfolio = SolverPortfolio()
+        sol,solState,iters = portfolio.getSolution(state, self._solver_power)
+        for name, iterations in portfolio.getIterations().items():
+            self._solver_iterations[name] = self._solver_iterations.get(name, 0) + iterations
         if solState.checkWin():
             return 0, sol
         return solState.getHeuristic(), []
@@ -110,41 +276,112 @@ class SokobanProblem(Problem):
             "target": calc_certain_tile(map_locations, [4]),
             "regions": calc_num_regions(map, map_locations, [0,2,3,4]),
             "dist-win": self._width * self._height * (self._width + self._height),
-            "solution": []
+            "solution": [],
+            "sol-length": 0
         }
         if map_stats["player"] == 1 and map_stats["crate"] == map_stats["target"] and map_stats["crate"] > 0 and map_stats["regions"] == 1:
                 map_stats["dist-win"], map_stats["solution"] = self._run_game(map)
+                map_stats["sol-length"] = len(map_stats["solution"])
         return map_stats
 
     """
-    Get the current game reward between two stats
+    Get the stats of a group of same sized maps together. The tile counts and the regions are
+    calculated for all the maps at once and only the playable levels go to the solver.
 
     Parameters:
-        new_stats (dict(string,any)): the new stats after taking an action
-        start_stats (dict(string,any)): the old stats before taking an action
+        maps (any[][][]): the maps that are evaluated
+
+    Returns:
+        dict(string,numpy.ndarray): the stats of every map with the same names as get_stats
+        where "solution" is an object array
+    """
+    def get_stats_batch(self, maps):
+        maps = np.asarray(maps)
+        map_stats = {
+            "player": calc_certain_tile_batch(maps, [2]),
+            "crate": calc_certain_tile_batch(maps, [3]),
+            "target": calc_certain_tile_batch(maps, [4]),
+            "regions": calc_num_regions_batch(maps, [0,2,3,4]),
+            "dist-win": np.full(len(maps), self._width * self._height * (self._width + self._height), dtype=np.float64),
+            "solution": np.empty(len(maps), dtype=object),
+            "sol-length": np.zeros(len(maps), dtype=np.int64)
+        }
+        for i in range(len(maps)):
+            map_stats["solution"][i] = []
+        playable = np.flatnonzero((map_stats["player"] == 1) & (map_stats["crate"] == map_stats["target"]) & (map_stats["crate"] > 0) & (map_stats["regions"] == 1))
+        if len(playable) > 0:
+            dist_wins, solutions = self._run_games(maps[playable])
+            map_stats["dist-win"][playable] = dist_wins
+            for i, solution in zip(playable, solutions):
+                map_stats["solution"][i] = solution
+                map_stats["sol-length"][i] = len(solution)
+        return map_stats
+
+    """
+    Get the regions cache of a map that is shared between all single tile changes of that map
+
+    Parameters:
+        map (any[][]): the current game map before any change
+
+    Returns:
+        dict(string,any): the regions cache of the map
+    """
+    def get_stats_cache(self, map):
+        return get_regions_cache(map, [0,2,3,4])
+
+    """
+    Get the current stats of the map after changing a single tile. The tile counts and
+    the number of regions are updated locally (or using the regions cache) while the solver only runs
+    when the level is playable.
+
+    Parameters:
+        map (any[][]): the current game map after the change
+        old_stats (dict(string,any)): the stats of the map before the change
+        x (int): the x position of the changed tile
+        y (int): the y position of the changed tile
+        old (any): the tile value before the change
+        new (any): the tile value after the change
+        cache (dict(string,any)): the regions cache from get_stats_cache of the map before the change
 
     Returns:
-        float: the current reward due to the change between the old map stats and the new map stats
+        dict(string,any): stats of the current map similar to get_stats
     """
-    def get_heuristic(self, new_stats, start_stats):
-        #longer path is rewarded and less number of regions is rewarded
-        rewards = {
-            "player": get_range_reward(new_stats["player"], start_stats["player"], 1, 1),
-            "crate": get_range_reward(new_stats["crate"], start_stats["crate"], 1, self._max_crates),
-            "target": get_range_reward(new_stats["target"], start_stats["target"], 1, self._max_crates),
-            "regions": get_range_reward(new_stats["regions"], start_stats["regions"], 1, 1),
-            "ratio": get_range_reward(abs(new_stats["crate"]-new_stats["target"]), abs(start_stats["crate"]-start_stats["target"]), -np.inf, -np.inf),
-            "dist-win": get_range_reward(new_stats["dist-win"], start_stats["dist-win"], -np.inf, -np.inf),
-            "sol-length": get_range_reward(len(new_stats["solution"]), len(start_stats["solution"]), np.inf, np.inf)
+    def get_stats_delta(self, map, old_stats, x, y, old, new, cache=None):
+        regions = calc_num_regions_delta(map, old_stats["regions"], x, y, old, new, [0,2,3,4], cache)
+        if regions is None:
+            return self.get_stats(map)
+        map_stats = {
+            "player": calc_certain_tile_delta(old_stats["player"], [2], old, new),
+            "crate": calc_certain_tile_delta(old_stats["crate"], [3], old, new),
+            "target": calc_certain_tile_delta(old_stats["target"], [4], old, new),
+            "regions": regions,
+            "dist-win": self._width * self._height * (self._width + self._height),
+            "solution": [],
+            "sol-length": 0
         }
-        #calculate the total reward
-        return rewards["player"] * self._rewards["player"] +\
-            rewards["crate"] * self._rewards["crate"] +\
-            rewards["target"] * self._rewards["target"] +\
-            rewards["regions"] * self._rewards["regions"] +\
-            rewards["ratio"] * self._rewards["ratio"] +\
-            rewards["dist-win"] * self._rewards["dist-win"] +\
-            rewards["sol-length"] * self._rewards["sol-length"]
+        if map_stats["player"] == 1 and map_stats["crate"] == map_stats["target"] and map_stats["crate"] > 0 and map_stats["regions"] == 1:
+                map_stats["dist-win"], map_stats["solution"] = self._run_game(map)
+                map_stats["sol-length"] = len(map_stats["solution"])
+        return map_stats
+
+    """
+    Get the terms of the heuristic where one player, a few crates with the same number of targets,
+    one region, being closer to the win and a longer solution are rewarded
+
+    Returns:
+        (string or function,float,float,float)[]: the stat name (or a function of the stats),
+        the optimal range and the weight of every term
+    """
+    def get_heuristic_terms(self):
+        return [
+            ("player", 1, 1, self._rewards["player"]),
+            ("crate", 1, self._max_crates, self._rewards["crate"]),
+            ("target", 1, self._max_crates, self._rewards["target"]),
+            ("regions", 1, 1, self._rewards["regions"]),
+            (_get_ratio, -np.inf, -np.inf, self._rewards["ratio"]),
+            ("dist-win", -np.inf, -np.inf, self._rewards["dist-win"]),
+            ("sol-length", np.inf, np.inf, self._rewards["sol-length"])
+        ]
 
     """
     Uses the stats to check if the problem ended (episode_over) which means reached
@@ -158,7 +395,20 @@ class SokobanProblem(Problem):
         boolean: True if the level reached satisfying quality based on the stats and False otherwise
     """
     def get_episode_over(self, new_stats, start_stats):
-        return len(new_stats["solution"]) >= self._target_solution
+        return new_stats["sol-length"] >= self._target_solution
+
+    """
+    Check if the problem ended for many maps from their stats similar to get_episode_over
+
+    Parameters:
+        stats (dict(string,numpy.ndarray)): the stats of all the maps from get_stats_batch
+        start_stats (dict(string,any)): the stats of the start map
+
+    Returns:
+        boolean[]: True for the maps that reached satisfying quality and False otherwise
+    """
+    def get_episode_over_batch(self, stats, start_stats):
+        return stats["sol-length"] >= self._target_solution
 
     """
     Get any debug information need to be printed
@@ -178,7 +428,7 @@ class SokobanProblem(Problem):
             "target": new_stats["target"],
             "regions": new_stats["regions"],
             "dist-win": new_stats["dist-win"],
-            "sol-length": len(new_stats["solution"])
+            "sol-length": new_stats["sol-length"]
         }
 
     """
@@ -200,3 +450,48 @@ class SokobanProblem(Problem):
                 4: Image.open(os.path.dirname(__file__) + "/sokoban/target.png").convert('RGBA')
             }
         return super().render(map)
+
+"""
+Private function to get the difference between the number of crates and targets for the heuristic
+
+Parameters:
+    stats (dict(string,any)): the stats of one map or the stats of many maps from get_stats_batch
+
+Returns:
+    int: the absolute difference between the crates and the targets
+"""
+def _get_ratio(stats):
+    return abs(stats["crate"] - stats["target"])
+
+# the problem of a solver worker that is built once from the solver settings
+_worker_problem = None
+
+"""
+Private function that builds the problem of a solver worker when the worker starts
+
+Parameters:
+    settings (dict(string,any)): the solver settings from SokobanProblem._get_solver_settings
+"""
+def _init_solver_worker(settings):
+    global _worker_problem
+    _worker_problem = SokobanProblem()
+    for name, value in settings.items():
+        setattr(_worker_problem, name, value)
+
+"""
+Private function that solves a single level for SokobanProblem._run_games, it runs inside the
+solver workers so it also returns the solver iterations that were spent on the level
+
+Parameters:
+    map (string[][]): the input level
+
+Returns:
+    float: how close the level is to winning (0 if you win)
+    dict(string,int)[]: the solution if you win (empty otherwise)
+    dict(string,int): the iterations of every solver strategy on that level
+"""
+def _solve_level(map):
+    before = dict(_worker_problem._solver_iterations)
+    dist_win, solution = _worker_problem._solve_game(map)
+    iterations = dict((name, value - before.get(name, 0)) for name, value in _worker_problem._solver_iterations.items())
+    return dist_win, solution, iterations
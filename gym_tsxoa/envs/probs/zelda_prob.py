@@ -2,7 +2,7 @@ import os
 import numpy as np
 from PIL import Image
 from gym_tsxoa.envs.probs.problem import Problem
-from gym_tsxoa.envs.helper import get_range_reward, get_tile_locations, calc_num_regions, calc_certain_tile, run_dikjstra
+from gym_tsxoa.envs.helper import get_tile_locations, calc_num_regions, calc_num_regions_delta, calc_num_regions_batch, get_regions_cache, calc_certain_tile, calc_certain_tile_delta, calc_certain_tile_batch, run_dikjstra, run_dikjstra_batch
 
 """
 Generate a fully connected GVGAI zelda level where the player can reach key then the door.
@@ -64,57 +64,173 @@ class ZeldaProblem(Problem):
             "path-length": 0
         }
         if map_stats["player"] == 1 and map_stats["regions"] == 1:
-            p_x,p_y = map_locations[2][0]
-            enemies = []
-            enemies.extend(map_locations[5])
-            enemies.extend(map_locations[6])
-            enemies.extend(map_locations[7])
-            if len(enemies) > 0:
-                dikjstra,_ = run_dikjstra(p_x, p_y, map, [0, 2, 5, 6, 7])
-                min_dist = self._width * self._height
-                for e_x,e_y in enemies:
-                    if dikjstra[e_y][e_x] > 0 and dikjstra[e_y][e_x] < min_dist:
-                        min_dist = dikjstra[e_y][e_x]
-                map_stats["nearest-enemy"] = min_dist
-            if map_stats["key"] == 1 and map_stats["door"] == 1:
-                k_x,k_y = map_locations[3][0]
-                d_x,d_y = map_locations[4][0]
-                dikjstra,_ = run_dikjstra(p_x, p_y, map, [0, 3, 2, 5, 6, 7])
-                map_stats["path-length"] += dikjstra[k_y][k_x]
-                dikjstra,_ = run_dikjstra(k_x, k_y, map, [0, 2, 3, 4, 5, 6, 7])
-                map_stats["path-length"] += dikjstra[d_y][d_x]
+            self._calc_path_stats(map, map_locations, map_stats)
+        return map_stats
+
+    """
+    Get the stats of a group of same sized maps together. The tile counts and the regions are
+    calculated for all the maps at once and the paths only for the maps with one player and one region.
 
+    Parameters:
+        maps (any[][][]): the maps that are evaluated
+
+    Returns:
+        dict(string,numpy.ndarray): the stats of every map with the same names as get_stats
+    """
+    def get_stats_batch(self, maps):
+        maps = np.asarray(maps)
+        map_stats = {
+            "player": calc_certain_tile_batch(maps, [2]),
+            "key": calc_certain_tile_batch(maps, [3]),
+            "door": calc_certain_tile_batch(maps, [4]),
+            "enemies": calc_certain_tile_batch(maps, [5, 6, 7]),
+            "regions": calc_num_regions_batch(maps, [0, 2, 3, 5, 6, 7]),
+            "nearest-enemy": np.zeros(len(maps), dtype=np.int64),
+            "path-length": np.zeros(len(maps), dtype=np.int64)
+        }
+        indices = np.flatnonzero((map_stats["player"] == 1) & (map_stats["regions"] == 1))
+        if len(indices) > 0:
+            self._calc_path_stats_batch(maps, indices, map_stats)
         return map_stats
 
     """
-    Get the current game reward between two stats
+    Private function to get the position of the first tile with a certain value in every map
 
     Parameters:
-        new_stats (dict(string,any)): the new stats after taking an action
-        start_stats (dict(string,any)): the old stats before taking an action
+        maps (numpy.ndarray): the maps that have that tile
+        value (any): the tile value
 
     Returns:
-        float: the current reward due to the change between the old map stats and the new map stats
-    """
-    def get_heuristic(self, new_stats, start_stats):
-        #longer path is rewarded and less number of regions is rewarded
-        rewards = {
-            "player": get_range_reward(new_stats["player"], start_stats["player"], 1, 1),
-            "key": get_range_reward(new_stats["key"], start_stats["key"], 1, 1),
-            "door": get_range_reward(new_stats["door"], start_stats["door"], 1, 1),
-            "enemies": get_range_reward(new_stats["enemies"], start_stats["enemies"], 2, self._max_enemies),
-            "regions": get_range_reward(new_stats["regions"], start_stats["regions"], 1, 1),
-            "nearest-enemy": get_range_reward(new_stats["nearest-enemy"], start_stats["nearest-enemy"], self._target_enemy_dist, np.inf),
-            "path-length": get_range_reward(new_stats["path-length"],start_stats["path-length"], np.inf, np.inf)
+        int[]: the x position in every map
+        int[]: the y position in every map
+    """
+    def _get_first_tile_batch(self, maps, value):
+        ys, xs = np.divmod((maps == value).reshape(len(maps), -1).argmax(axis=1), maps.shape[2])
+        return xs, ys
+
+    """
+    Private function that calculates the path stats of _calc_path_stats for a group of maps
+    that all have exactly one player and one region
+
+    Parameters:
+        maps (numpy.ndarray): all the maps that are evaluated
+        indices (int[]): the indices of the maps that need the path stats
+        map_stats (dict(string,numpy.ndarray)): the stats that are being updated with the path values
+    """
+    def _calc_path_stats_batch(self, maps, indices, map_stats):
+        enemies = indices[map_stats["enemies"][indices] > 0]
+        if len(enemies) > 0:
+            p_xs,p_ys = self._get_first_tile_batch(maps[enemies], 2)
+            dikjstra,_ = run_dikjstra_batch(p_xs, p_ys, maps[enemies], [0, 2, 5, 6, 7])
+            reached = np.isin(maps[enemies], [5, 6, 7]) & (dikjstra > 0)
+            min_dist = np.where(reached, dikjstra, self._width * self._height).reshape(len(enemies), -1).min(axis=1)
+            map_stats["nearest-enemy"][enemies] = np.minimum(min_dist, self._width * self._height)
+        paths = indices[(map_stats["key"][indices] == 1) & (map_stats["door"][indices] == 1)]
+        if len(paths) > 0:
+            rows = np.arange(len(paths))
+            p_xs,p_ys = self._get_first_tile_batch(maps[paths], 2)
+            k_xs,k_ys = self._get_first_tile_batch(maps[paths], 3)
+            d_xs,d_ys = self._get_first_tile_batch(maps[paths], 4)
+            dikjstra,_ = run_dikjstra_batch(p_xs, p_ys, maps[paths], [0, 3, 2, 5, 6, 7])
+            map_stats["path-length"][paths] += dikjstra[rows, k_ys, k_xs]
+            dikjstra,_ = run_dikjstra_batch(k_xs, k_ys, maps[paths], [0, 2, 3, 4, 5, 6, 7])
+            map_stats["path-length"][paths] += dikjstra[rows, d_ys, d_xs]
+
+    """
+    Get the regions cache of a map that is shared between all single tile changes of that map
+
+    Parameters:
+        map (any[][]): the current game map before any change
+
+    Returns:
+        dict(string,any): the regions cache of the map
+    """
+    def get_stats_cache(self, map):
+        return get_regions_cache(map, [0, 2, 3, 5, 6, 7])
+
+    """
+    Get the current stats of the map after changing a single tile. The tile counts and
+    the number of regions are updated locally (or using the regions cache) while the paths are only
+    recalculated when the level is fully connected with one player.
+
+    Parameters:
+        map (any[][]): the current game map after the change
+        old_stats (dict(string,any)): the stats of the map before the change
+        x (int): the x position of the changed tile
+        y (int): the y position of the changed tile
+        old (any): the tile value before the change
+        new (any): the tile value after the change
+        cache (dict(string,any)): the regions cache from get_stats_cache of the map before the change
+
+    Returns:
+        dict(string,any): stats of the current map similar to get_stats
+    """
+    def get_stats_delta(self, map, old_stats, x, y, old, new, cache=None):
+        regions = calc_num_regions_delta(map, old_stats["regions"], x, y, old, new, [0, 2, 3, 5, 6, 7], cache)
+        if regions is None:
+            return self.get_stats(map)
+        map_stats = {
+            "player": calc_certain_tile_delta(old_stats["player"], [2], old, new),
+            "key": calc_certain_tile_delta(old_stats["key"], [3], old, new),
+            "door": calc_certain_tile_delta(old_stats["door"], [4], old, new),
+            "enemies": calc_certain_tile_delta(old_stats["enemies"], [5, 6, 7], old, new),
+            "regions": regions,
+            "nearest-enemy": 0,
+            "path-length": 0
         }
-        #calculate the total reward
-        return rewards["player"] * self._rewards["player"] +\
-            rewards["key"] * self._rewards["key"] +\
-            rewards["door"] * self._rewards["door"] +\
-            rewards["enemies"] * self._rewards["enemies"] +\
-            rewards["regions"] * self._rewards["regions"] +\
-            rewards["nearest-enemy"] * self._rewards["nearest-enemy"] +\
-            rewards["path-length"] * self._rewards["path-length"]
+        if map_stats["player"] == 1 and map_stats["regions"] == 1:
+            map_locations = get_tile_locations(map, self.get_tile_types())
+            self._calc_path_stats(map, map_locations, map_stats)
+        return map_stats
+
+    """
+    Private function that calculates the distance to the nearest enemy and the path
+    length from the player to the key then the door. It should only be called when
+    there is exactly one player and one region.
+
+    Parameters:
+        map (any[][]): the current game map
+        map_locations (Dict(string,(int,int)[])): the histogram of locations of the current map
+        map_stats (dict(string,any)): the stats that is being updated with the path values
+    """
+    def _calc_path_stats(self, map, map_locations, map_stats):
+        p_x,p_y = map_locations[2][0]
+        enemies = []
+        enemies.extend(map_locations[5])
+        enemies.extend(map_locations[6])
+        enemies.extend(map_locations[7])
+        if len(enemies) > 0:
+            dikjstra,_ = run_dikjstra(p_x, p_y, map, [0, 2, 5, 6, 7])
+            min_dist = self._width * self._height
+            for e_x,e_y in enemies:
+                if dikjstra[e_y][e_x] > 0 and dikjstra[e_y][e_x] < min_dist:
+                    min_dist = dikjstra[e_y][e_x]
+            map_stats["nearest-enemy"] = min_dist
+        if map_stats["key"] == 1 and map_stats["door"] == 1:
+            k_x,k_y = map_locations[3][0]
+            d_x,d_y = map_locations[4][0]
+            dikjstra,_ = run_dikjstra(p_x, p_y, map, [0, 3, 2, 5, 6, 7])
+            map_stats["path-length"] += dikjstra[k_y][k_x]
+            dikjstra,_ = run_dikjstra(k_x, k_y, map, [0, 2, 3, 4, 5, 6, 7])
+            map_stats["path-length"] += dikjstra[d_y][d_x]
+
+    """
+    Get the terms of the heuristic where one player, key and door, a few far enemies, one region
+    and a longer path to the key then the door are rewarded
+
+    Returns:
+        (string,float,float,float)[]: the stat name, the optimal range and the weight of every term
+    """
+    def get_heuristic_terms(self):
+        return [
+            ("player", 1, 1, self._rewards["player"]),
+            ("key", 1, 1, self._rewards["key"]),
+            ("door", 1, 1, self._rewards["door"]),
+            ("enemies", 2, self._max_enemies, self._rewards["enemies"]),
+            ("regions", 1, 1, self._rewards["regions"]),
+            ("nearest-enemy", self._target_enemy_dist, np.inf, self._rewards["nearest-enemy"]),
+            ("path-length", np.inf, np.inf, self._rewards["path-length"])
+        ]
 
     """
     Uses the stats to check if the problem ended (episode_over) which means reached
@@ -130,6 +246,19 @@ class ZeldaProblem(Problem):
     def get_episode_over(self, new_stats, start_stats):
         return new_stats["nearest-enemy"] >= self._target_enemy_dist and new_stats["path-length"] >= self._target_path
 
+    """
+    Check if the problem ended for many maps from their stats similar to get_episode_over
+
+    Parameters:
+        stats (dict(string,numpy.ndarray)): the stats of all the maps from get_stats_batch
+        start_stats (dict(string,any)): the stats of the start map
+
+    Returns:
+        boolean[]: True for the maps that reached satisfying quality and False otherwise
+    """
+    def get_episode_over_batch(self, stats, start_stats):
+        return (stats["nearest-enemy"] >= self._target_enemy_dist) & (stats["path-length"] >= self._target_path)
+
     """
     Get any debug information need to be printed
 
@@ -0,0 +1,191 @@
+"""
+A module that labels the connected regions of passable tiles in a map
+"""
+import numpy as np
+
+"""
+A region labeling engine that labels horizontal runs of passable tiles then
+connects the runs that touch vertically using union find. The engine keeps scratch
+buffers for every map shape so labeling the same sized maps doesn't allocate them again.
+"""
+class RegionLabeler:
+    """
+    Initialize the engine with empty scratch buffers
+    """
+    def __init__(self):
+        self._buffers = {}
+        self._tables = {}
+
+    """
+    Private function to get the scratch buffers for a certain map shape
+
+    Parameters:
+        shape ((int,int)): the height and width of the map
+
+    Returns:
+        dict(string,numpy.ndarray): the scratch buffers of that shape
+    """
+    def _get_buffers(self, shape):
+        if shape not in self._buffers:
+            self._buffers[shape] = {
+                "mask": np.zeros(shape, dtype=bool),
+                "starts": np.zeros(shape, dtype=bool),
+                "links": np.zeros((shape[0]-1, shape[1]), dtype=bool),
+                "first": np.zeros((shape[0]-1, shape[1]), dtype=bool),
+                "runs": np.zeros(shape, dtype=np.int32)
+            }
+        return self._buffers[shape]
+
+    """
+    Private function to get the passable mask of the map in the mask buffer
+
+    Parameters:
+        map (numpy.ndarray): the current map
+        passable_values (any[]): an array of all the passable tile values
+        mask (boolean[][]): the buffer that will hold the passable mask
+
+    Returns:
+        boolean[][]: the passable mask of the map
+    """
+    def _get_mask(self, map, passable_values, mask):
+        if map.dtype != np.uint8:
+            mask[:] = np.isin(map, passable_values)
+            return mask
+        key = tuple(passable_values)
+        if key not in self._tables:
+            table = np.zeros(256, dtype=bool)
+            table[list(passable_values)] = True
+            self._tables[key] = table
+        np.take(self._tables[key], map, out=mask)
+        return mask
+
+    """
+    Label all the connected regions of passable tiles in the map
+
+    Parameters:
+        map (any[][]): the current map
+        passable_values (any[]): an array of all the passable tile values
+
+    Returns:
+        int: number of regions in the map
+        int[][]: the region label of every tile, 0 for not passable tiles and 1 to
+        number of regions ordered by the first tile of every region row by row
+        int[]: the number of tiles in every region indexed by the label where index 0 is
+        the number of not passable tiles
+    """
+    def label(self, map, passable_values):
+        map = np.asarray(map)
+        buffers = self._get_buffers(map.shape)
+        mask = self._get_mask(map, passable_values, buffers["mask"])
+        # a run starts at every passable tile that has no passable tile on its left
+        starts = buffers["starts"]
+        starts[:,0] = mask[:,0]
+        np.greater(mask[:,1:], mask[:,:-1], out=starts[:,1:])
+        runs = buffers["runs"]
+        np.cumsum(starts, out=runs.reshape(-1))
+        np.multiply(runs, mask, out=runs)
+        num_runs = int(runs.max()) if runs.size > 0 else 0
+
+        # only the first column of every vertical contact between two runs is needed
+        links = buffers["links"]
+        np.logical_and(mask[1:], mask[:-1], out=links)
+        first = buffers["first"]
+        first[:,0] = links[:,0]
+        np.greater(links[:,1:], links[:,:-1], out=first[:,1:])
+        parents = list(range(num_runs + 1))
+        for a, b in zip(runs[:-1][first].tolist(), runs[1:][first].tolist()):
+            while parents[a] != a:
+                parents[a] = parents[parents[a]]
+                a = parents[a]
+            while parents[b] != b:
+                parents[b] = parents[parents[b]]
+                b = parents[b]
+            # the smallest run is the root so regions keep the order of their first tile
+            if a < b:
+                parents[b] = a
+            elif b < a:
+                parents[a] = b
+
+        lookup = [0] * (num_runs + 1)
+        num_regions = 0
+        for r in range(1, num_runs + 1):
+            if parents[r] == r:
+                num_regions += 1
+                lookup[r] = num_regions
+            else:
+                # parents always have smaller indices so they are already labeled
+                lookup[r] = lookup[parents[r]]
+        labels = np.array(lookup, dtype=np.int32)[runs]
+        sizes = np.bincount(labels.reshape(-1), minlength=num_regions + 1)
+        return num_regions, labels, sizes
+
+_labeler = RegionLabeler()
+
+"""
+Label all the connected regions of passable tiles in the map using a shared labeling engine
+
+Parameters:
+    map (any[][]): the current map
+    passable_values (any[]): an array of all the passable tile values
+
+Returns:
+    int: number of regions in the map
+    int[][]: the region label of every tile, 0 for not passable tiles
+    int[]: the number of tiles in every region indexed by the label
+"""
+def label_regions(map, passable_values):
+    return _labeler.label(map, passable_values)
+
+"""
+Stack a group of same sized maps into one tall map where every map is followed by a row of
+not passable tiles, so no region of the stacked map crosses from one map to the next
+
+Parameters:
+    maps (any[][][]): the maps that are stacked
+    passable_values (any[]): an array of all the passable tile values
+
+Returns:
+    numpy.ndarray: the stacked map with the shape (number * (height + 1), width)
+"""
+def stack_maps(maps, passable_values):
+    maps = np.asarray(maps)
+    number, height, width = maps.shape
+    stacked = np.full((number, height + 1, width), max(passable_values) + 1, dtype=maps.dtype)
+    stacked[:,:height] = maps
+    return stacked.reshape(number * (height + 1), width)
+
+"""
+Find the map that every region of a stacked map belongs to
+
+Parameters:
+    labels (int[][]): the region labels of the stacked map from stack_maps
+    num_regions (int): number of regions in the stacked map
+    number (int): the number of stacked maps
+
+Returns:
+    int[]: the map index of every region indexed by the label where index 0 is not used
+"""
+def get_region_owners(labels, num_regions, number):
+    owners = np.zeros(num_regions + 1, dtype=np.int64)
+    owners[labels.reshape(number, -1)] = np.arange(number)[:,None]
+    return owners
+
+"""
+Label all the connected regions of passable tiles in a group of same sized maps together
+using a single labeling pass over the stacked maps
+
+Parameters:
+    maps (any[][][]): the maps that are labeled
+    passable_values (any[]): an array of all the passable tile values
+
+Returns:
+    int[]: number of regions in every map
+    int[][][]: the region label of every tile where the labels are unique across all the maps
+"""
+def label_regions_batch(maps, passable_values):
+    maps = np.asarray(maps)
+    number, height, width = maps.shape
+    num_regions, labels, _ = label_regions(stack_maps(maps, passable_values), passable_values)
+    owners = get_region_owners(labels, num_regions, number)
+    counts = np.bincount(owners[1:], minlength=number)
+    return counts, labels.reshape(number, height + 1, width)[:,:height]
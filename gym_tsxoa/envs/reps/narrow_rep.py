@@ -36,12 +36,15 @@ class NarrowRepresentation(Representation):
 
     Returns:
         observation: the current observation at the current moment. "pos" Integer
-        x,y position for the current location. "map" 2D array of tile numbers
+        x,y position for the current location. "map" 2D array of tile numbers. "hash" the
+        zobrist hash of the map. "key" the state key of the current state
     """
     def get_observation(self):
         return {
             "index": self._index,
-            "map": self._map
+            "map": self._map,
+            "hash": self._hash,
+            "key": self.get_state_key()
         }
 
     def set_observation(self, obs, copy=True):
@@ -49,15 +52,23 @@ class NarrowRepresentation(Representation):
         if copy:
             self._map = obs['map'].copy()
         self._index = obs['index']
+        self._set_hash(obs)
 
     def get_number_action(self, width, height, num_tiles):
         return num_tiles
 
+    def get_action_tiles(self, width, height, num_tiles):
+        return np.arange(num_tiles)
+
+    def get_cursor(self):
+        return self._index
+
+    def set_cursor(self, cursor):
+        self._index = cursor
+
     def get_state_key(self):
-        map_size = self._map.shape[1] * self._map.shape[0]
-        key = np.array2string(self._map.reshape(map_size,),separator="", max_line_width=map_size+1)[1:-1]
         (x, y) = self._tiles[self._index % len(self._tiles)]
-        return '{}_{}_{}'.format(key, x, y)
+        return self._get_key(x, y)
 
     """
     Update the narrow representation with the input action
@@ -66,15 +77,18 @@ class NarrowRepresentation(Representation):
         action: an action that is used to advance the environment (same as action space)
 
     Returns:
-        boolean: True if the action change the map, False if nothing changed
+        int: 1 if the action change the map, 0 if nothing changed
+        int: the x position of the modified tile
+        int: the y position of the modified tile
+        int: the tile value before the action
+        int: the tile value after the action
     """
     def update(self, action):
-        change = 0
         (x, y) = self._tiles[self._index % len(self._tiles)]
-        change += [0,1][self._map[y][x] != action]
-        self._map[y][x] = action
+        value = int(action)
+        change, old = self._set_tile(x, y, value)
         self._index += 1
-        return change, x, y
+        return change, x, y, old, value
 
     """
     Modify the level image with a red rectangle around the tile that is
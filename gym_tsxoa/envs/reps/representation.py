@@ -1,6 +1,32 @@
 import numpy as np
 from gym_tsxoa.envs.helper import gen_random_map
 
+# the zobrist tables are shared between all the representations with the same map size
+_zobrist_tables = {}
+
+"""
+Get the zobrist tables for a certain map size. The tables are generated using a fixed seed
+so they are the same for every representation and they don't change the representation random.
+
+Parameters:
+    width (int): the map width
+    height (int): the map height
+    num_values (int): the number of possible tile values
+
+Returns:
+    numpy.uint64[][][]: a random 64 bit value for every tile value at every position
+    int[][][]: the same table as python integers for fast single tile updates
+    int[][]: a random 64 bit value for every position to be used for the representation cursor
+"""
+def get_zobrist_tables(width, height, num_values):
+    key = (width, height, num_values)
+    if key not in _zobrist_tables:
+        random = np.random.default_rng(width * 1000003 + height * 1009 + num_values)
+        tiles = random.integers(0, 2**64, size=(height, width, num_values), dtype=np.uint64)
+        positions = random.integers(0, 2**64, size=(height, width), dtype=np.uint64)
+        _zobrist_tables[key] = (tiles, tiles.tolist(), positions.tolist())
+    return _zobrist_tables[key]
+
 """
 The base class of all the representations
 """
@@ -10,6 +36,8 @@ class Representation:
     """
     def __init__(self):
         self._map = None
+        self._hash = 0
+        self._exact_keys = False
         self.seed()
 
     """
@@ -32,6 +60,71 @@ class Representation:
     """
     def reset(self, width, height, prob):
         self._map = gen_random_map(self._random, width, height, prob)
+        self._zobrist, self._zobrist_tiles, self._zobrist_pos = get_zobrist_tables(width, height, max(prob.keys()) + 1)
+        self._hash = self._calc_hash()
+
+    """
+    Private function to calculate the zobrist hash of the whole map
+
+    Returns:
+        int: the 64 bit zobrist hash of the current map
+    """
+    def _calc_hash(self):
+        rows, cols = np.indices(self._map.shape)
+        return int(np.bitwise_xor.reduce(self._zobrist[rows, cols, self._map], axis=None))
+
+    """
+    Private function to restore the zobrist hash from an observation or calculate it
+    if the observation doesn't have it
+
+    Parameters:
+        obs (dict(string,any)): the observation that is being set
+    """
+    def _set_hash(self, obs):
+        if 'hash' in obs:
+            self._hash = obs['hash']
+        else:
+            self._hash = self._calc_hash()
+
+    """
+    Private function to change a single tile and update the zobrist hash of the map
+
+    Parameters:
+        x (int): the x position of the tile
+        y (int): the y position of the tile
+        value (int): the new tile value
+
+    Returns:
+        int: 1 if the tile changed, 0 otherwise
+        int: the tile value before the change
+    """
+    def _set_tile(self, x, y, value):
+        old = int(self._map[y][x])
+        if old == value:
+            return 0, old
+        self._map[y][x] = value
+        self._hash ^= self._zobrist_tiles[y][x][old] ^ self._zobrist_tiles[y][x][value]
+        return 1, old
+
+    """
+    Private function to get the state key of the map combined with a cursor position.
+    The key is the zobrist hash unless the exact keys are used where the raw map bytes are
+    added to the key so two different maps never share a key.
+
+    Parameters:
+        x (int): the x position of the cursor or None if there is no cursor
+        y (int): the y position of the cursor or None if there is no cursor
+
+    Returns:
+        int or (int,bytes): the state key of the current state
+    """
+    def _get_key(self, x=None, y=None):
+        key = self._hash
+        if x is not None:
+            key ^= self._zobrist_pos[y][x]
+        if self._exact_keys:
+            return key, self._map.tobytes()
+        return key
 
     def get_number_action(self, width, height, num_tiles):
         raise NotImplementedError('get_observation is not implemented')
@@ -48,6 +141,48 @@ class Representation:
     def set_observation(self, obs, copy=True):
         raise NotImplementedError('get_observation is not implemented')
 
+    """
+    Get the tile value that every action writes to the map
+
+    Parameters:
+        width (int): the width of the map
+        height (int): the height of the map
+        num_tiles (int): the number of different tiles
+
+    Returns:
+        numpy.int[]: the tile value for every action, -1 for the actions that only move the cursor
+    """
+    def get_action_tiles(self, width, height, num_tiles):
+        raise NotImplementedError('get_action_tiles is not implemented')
+
+    """
+    Get the position that the representation is going to modify next. The cursor with
+    the map is the full state of the representation.
+
+    Returns:
+        any: the current cursor, None if the representation doesn't have one
+    """
+    def get_cursor(self):
+        return None
+
+    """
+    Set the position that the representation is going to modify next
+
+    Parameters:
+        cursor (any): a cursor that was returned from get_cursor
+    """
+    def set_cursor(self, cursor):
+        pass
+
+    """
+    Get a key that identifies the current state of the representation
+
+    Returns:
+        int or (int,bytes): the state key of the current state
+    """
+    def get_state_key(self):
+        raise NotImplementedError('get_state_key is not implemented')
+
     """
     Update the representation with the current action
 
@@ -55,7 +190,11 @@ class Representation:
         action: an action that is used to advance the environment (same as action space)
 
     Returns:
-        boolean: True if the action change the map, False if nothing changed
+        int: 1 if the action change the map, 0 if nothing changed
+        int: the x position of the modified tile
+        int: the y position of the modified tile
+        int: the tile value before the action
+        int: the tile value after the action
     """
     def update(self, action):
         raise NotImplementedError('update is not implemented')
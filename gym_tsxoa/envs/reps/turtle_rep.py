@@ -34,13 +34,16 @@ class TurtleRepresentation(Representation):
 
     Returns:
         observation: the current observation at the current moment. "pos" Integer
-        x,y position for the current location. "map" 2D array of tile numbers
+        x,y position for the current location. "map" 2D array of tile numbers. "hash" the
+        zobrist hash of the map. "key" the state key of the current state
     """
     def get_observation(self):
         return {
             "x": self._x,
             "y": self._y,
-            "map": self._map
+            "map": self._map,
+            "hash": self._hash,
+            "key": self.get_state_key()
         }
 
     def set_observation(self, obs, copy=True):
@@ -49,14 +52,22 @@ class TurtleRepresentation(Representation):
             self._map = obs['map'].copy()
         self._x = obs['x']
         self._y = obs['y']
+        self._set_hash(obs)
 
     def get_number_action(self, width, height, num_tiles):
         return len(self._dirs) + num_tiles
 
+    def get_action_tiles(self, width, height, num_tiles):
+        return np.concatenate((np.full(len(self._dirs), -1), np.arange(num_tiles)))
+
+    def get_cursor(self):
+        return self._x, self._y
+
+    def set_cursor(self, cursor):
+        self._x, self._y = cursor
+
     def get_state_key(self):
-        map_size = self._map.shape[1] * self._map.shape[0]
-        key = np.array2string(self._map.reshape(map_size,),separator="", max_line_width=map_size+1)[1:-1]
-        return '{}_{}_{}'.format(key, self._x, self._y)
+        return self._get_key(self._x, self._y)
 
     """
     Update the turtle representation with the input action
@@ -65,7 +76,11 @@ class TurtleRepresentation(Representation):
         action: an action that is used to advance the environment (same as action space)
 
     Returns:
-        boolean: True if the action change the map, False if nothing changed
+        int: 1 if the action change the map, 0 if nothing changed
+        int: the x position of the turtle after the action
+        int: the y position of the turtle after the action
+        int: the tile value under the turtle before the action
+        int: the tile value under the turtle after the action
     """
     def update(self, action):
         change = 0
@@ -80,10 +95,11 @@ class TurtleRepresentation(Representation):
                 self._y = 0
             if self._y >= self._map.shape[0]:
                 self._y = self._map.shape[0] - 1
-        else:
-            change = [0,1][self._map[self._y][self._x] != action - len(self._dirs)]
-            self._map[self._y][self._x] = action - len(self._dirs)
-        return change, self._x, self._y
+            value = int(self._map[self._y][self._x])
+            return change, self._x, self._y, value, value
+        value = int(action) - len(self._dirs)
+        change, old = self._set_tile(self._x, self._y, value)
+        return change, self._x, self._y, old, value
 
     """
     Modify the level image with a red rectangle around the tile that the turtle is on
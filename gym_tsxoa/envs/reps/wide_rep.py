@@ -16,25 +16,30 @@ class WideRepresentation(Representation):
     Get the current representation observation object at the current moment
 
     Returns:
-        observation: the current observation at the current moment. A 2D array of tile numbers
+        observation: the current observation at the current moment. "map" 2D array of tile
+        numbers. "hash" the zobrist hash of the map. "key" the state key of the current state
     """
     def get_observation(self):
         return {
-            "map": self._map
+            "map": self._map,
+            "hash": self._hash,
+            "key": self.get_state_key()
         }
 
     def set_observation(self, obs, copy=True):
         self._map = obs['map']
         if copy:
             self._map = obs['map'].copy()
+        self._set_hash(obs)
 
     def get_number_action(self, width, height, num_tiles):
         return width * height * num_tiles
 
+    def get_action_tiles(self, width, height, num_tiles):
+        return np.arange(width * height * num_tiles) // (width * height)
+
     def get_state_key(self):
-        map_size = self._map.shape[1] * self._map.shape[0]
-        key = np.array2string(self._map.reshape(map_size,),separator="", max_line_width=map_size+1)[1:-1]
-        return key
+        return self._get_key()
 
     """
     Update the wide representation with the input action
@@ -43,7 +48,11 @@ class WideRepresentation(Representation):
         action: an action that is used to advance the environment (same as action space)
 
     Returns:
-        boolean: True if the action change the map, False if nothing changed
+        int: 1 if the action change the map, 0 if nothing changed
+        int: the x position of the modified tile
+        int: the y position of the modified tile
+        int: the tile value before the action
+        int: the tile value after the action
     """
     def update(self, action):
         x = action % self._map.shape[1]
@@ -52,6 +61,5 @@ class WideRepresentation(Representation):
         action = int(action / self._map.shape[0])
         value = action
 
-        change = [0,1][self._map[y][x] != value]
-        self._map[y][x] = value
-        return change, x, y
+        change, old = self._set_tile(x, y, value)
+        return change, x, y, old, value
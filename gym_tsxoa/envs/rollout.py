@@ -0,0 +1,190 @@
+"""
+A module that has the rollout policies used by MCTS to estimate the value of a state by playing
+actions from it until the rollout length or the end of the episode
+"""
+import numpy as np
+
+"""
+The base class of all the rollout policies
+"""
+class RolloutPolicy:
+    # the policies that don't need the stats after every action use quick steps
+    quick = True
+
+    """
+    Get the next action of the rollout from the current state of the environment
+
+    Parameters:
+        env (PcgrlEnv): the environment of the rollout
+
+    Returns:
+        int: the next action
+    """
+    def get_action(self, env):
+        raise NotImplementedError('get_action is not implemented')
+
+"""
+A policy that picks all the actions with the same probability
+"""
+class UniformPolicy(RolloutPolicy):
+    def get_action(self, env):
+        return env._rep._random.integers(env.get_number_action())
+
+"""
+A policy that picks a random action with a probability of epsilon, otherwise it picks the best of a
+few random actions using the heuristic after every one of them. The stats are updated locally after
+every action so the heuristic of the candidates only needs the parts of the map that they change.
+"""
+class EpsilonGreedyPolicy(RolloutPolicy):
+    quick = False
+
+    """
+    Initialize the policy
+
+    Parameters:
+        epsilon (float): the probability of picking a random action
+        candidates (int): the number of random actions that are compared
+    """
+    def __init__(self, epsilon=0.1, candidates=4):
+        self._epsilon = epsilon
+        self._candidates = candidates
+
+    def get_action(self, env):
+        random = env._rep._random
+        if random.random() < self._epsilon:
+            return random.integers(env.get_number_action())
+        actions = random.integers(env.get_number_action(), size=self._candidates)
+        heuristics, wins, dones, obs_list = env.evaluate_all_actions(True, False, actions)
+        return actions[np.argmax(heuristics)]
+
+"""
+A policy that picks the actions based on the tile they write using a prior over the tiles (such as the
+tile frequencies of good levels), the actions that only move the cursor get the average probability
+"""
+class TilePriorPolicy(RolloutPolicy):
+    """
+    Initialize the policy
+
+    Parameters:
+        prior (float[]): the weight of every tile value, None to use the tile probabilities of the problem
+    """
+    def __init__(self, prior=None):
+        self._prior = prior
+        self._cumulative = None
+
+    """
+    Private function to calculate the cumulative probabilities of the actions of an environment
+
+    Parameters:
+        env (PcgrlEnv): the environment of the rollout
+
+    Returns:
+        float[]: the cumulative probability of every action
+    """
+    def _get_cumulative(self, env):
+        prior = self._prior
+        if prior is None:
+            prior = np.zeros(len(env._prob.get_tile_types()))
+            for tile, value in env._prob._prob.items():
+                prior[tile] = value
+        prior = np.asarray(prior, dtype=np.float64)
+        tiles = env.get_action_tiles()
+        weights = np.where(tiles >= 0, prior[np.maximum(tiles, 0)], prior.mean())
+        cumulative = np.cumsum(weights)
+        return cumulative / cumulative[-1]
+
+    def get_action(self, env):
+        if self._cumulative is None:
+            self._cumulative = self._get_cumulative(env)
+        action = np.searchsorted(self._cumulative, env._rep._random.random(), side='right')
+        return min(action, len(self._cumulative) - 1)
+
+"""
+Learn a tile prior for TilePriorPolicy from the tile frequencies of a group of levels
+
+Parameters:
+    maps (numpy.int[][][]): the levels to learn from (such as the levels that solved the problem)
+    num_tiles (int): the number of different tiles
+    smoothing (float): a count added to every tile so no tile has a zero probability
+
+Returns:
+    float[]: the probability of every tile value
+"""
+def learn_tile_prior(maps, num_tiles, smoothing=1):
+    counts = np.full(num_tiles, smoothing, dtype=np.float64)
+    for map in maps:
+        counts += np.bincount(np.asarray(map).ravel(), minlength=num_tiles)[:num_tiles]
+    return counts / counts.sum()
+
+POLICIES = {
+    "uniform": UniformPolicy,
+    "greedy": EpsilonGreedyPolicy,
+    "prior": TilePriorPolicy
+}
+
+"""
+Create a new rollout policy
+
+Parameters:
+    policy (string or RolloutPolicy): the name of the policy ("uniform", "greedy" or "prior") or a policy object
+    **kwargs: the parameters of the policy constructor
+
+Returns:
+    RolloutPolicy: the rollout policy
+"""
+def create_policy(policy="uniform", **kwargs):
+    if isinstance(policy, RolloutPolicy):
+        return policy
+    return POLICIES[policy](**kwargs)
+
+"""
+Play a rollout from the current state of the environment, the state is not restored afterward
+
+Parameters:
+    env (PcgrlEnv): the environment of the rollout
+    length (int): the maximum number of actions
+    policy (RolloutPolicy): the policy that picks the actions, None for uniform actions
+
+Returns:
+    float: the heuristic at the end of the rollout
+"""
+def simulate(env, length, policy=None):
+    if policy is None:
+        policy = UniformPolicy()
+    heuristic = 0
+    for i in range(length):
+        quick = policy.quick and i < length - 1
+        obs, heuristic, game_done, done, info = env.step(policy.get_action(env), True, quick)
+        if done:
+            break
+    return heuristic
+
+"""
+Play a group of rollouts from the current state of the environment. Every rollout is undone when it
+ends so they all start from the same map and the final maps are evaluated together at the end.
+
+Parameters:
+    env (PcgrlEnv): the environment of the rollout
+    length (int): the maximum number of actions of every rollout
+    policy (RolloutPolicy): the policy that picks the actions, None for uniform actions
+    size (int): the number of rollouts
+
+Returns:
+    float: the average heuristic at the end of the rollouts
+"""
+def simulate_batch(env, length, policy=None, size=1):
+    if policy is None:
+        policy = UniformPolicy()
+    maps = []
+    for k in range(size):
+        steps = 0
+        for i in range(length):
+            obs, heuristic, game_done, done, info = env.apply(policy.get_action(env), True, policy.quick)
+            steps += 1
+            if done:
+                break
+        maps.append(env._rep._map.copy())
+        for i in range(steps):
+            env.revert()
+    heuristics, wins, stats = env.evaluate_maps(maps)
+    return heuristics.mean()
@@ -0,0 +1,94 @@
+"""
+Tests that check the batched stats and heuristics of every problem against calculating them for
+one map at a time on seeded random maps
+"""
+import pickle
+import numpy as np
+import pytest
+from gym_tsxoa.envs.probs import PROBLEMS
+from gym_tsxoa.envs.probs import sokoban_prob
+
+# the number of every tile that the playable maps of a problem have
+_PLAYABLE_TILES = {
+    "binary": {},
+    "zelda": {2: 1, 3: 1, 4: 1, 5: 1},
+    "sokoban": {2: 1, 3: 2, 4: 2}
+}
+
+"""
+Seeded random maps of a problem where half of the maps have the tile counts of a playable map,
+some maps are repeated so the batch has to solve the same level more than once
+"""
+def _random_maps(prob, seed, number=40):
+    rng = np.random.default_rng(seed)
+    tiles = len(prob.get_tile_types())
+    values = np.array(list(prob._prob.values()))
+    maps = rng.choice(tiles, size=(number, prob._height, prob._width), p=values / values.sum())
+    playable_tiles = _PLAYABLE_TILES[prob.__class__.__name__.replace("Problem", "").lower()]
+    for i in range(0, number, 2):
+        if len(playable_tiles) == 0:
+            break
+        maps[i] = rng.choice(2, size=(prob._height, prob._width), p=[0.85, 0.15])
+        locations = rng.permutation(maps[i].size)
+        for t, count in playable_tiles.items():
+            maps[i].flat[locations[:count]] = t
+            locations = locations[count:]
+    maps[-4:] = maps[:4]
+    return maps
+
+def _check_batch(prob, batch_prob, maps):
+    start_stats = prob.get_stats(maps[0])
+    stats = batch_prob.get_stats_batch(maps)
+    heuristics = batch_prob.get_heuristic_batch(stats, start_stats)
+    wins = batch_prob.get_episode_over_batch(stats, start_stats)
+    for i, map_stats in enumerate(batch_prob.get_stats_list(stats)):
+        expected = prob.get_stats(maps[i])
+        assert map_stats == expected
+        assert heuristics[i] == pytest.approx(prob.get_heuristic(expected, start_stats))
+        assert wins[i] == prob.get_episode_over(expected, start_stats)
+
+@pytest.mark.parametrize("name", ["binary", "zelda", "sokoban"])
+@pytest.mark.parametrize("seed", range(2))
+def test_get_stats_batch(name, seed):
+    prob = PROBLEMS[name]()
+    batch_prob = PROBLEMS[name]()
+    # a solver cache of its own so the batch solves the levels instead of reading the scalar results
+    batch_prob._cache_size = 1000 + seed
+    _check_batch(prob, batch_prob, _random_maps(prob, seed))
+
+def test_solver_pool():
+    prob = PROBLEMS["sokoban"]()
+    batch_prob = PROBLEMS["sokoban"]()
+    batch_prob._cache_size = 2000
+    batch_prob._solver_workers = 2
+    try:
+        _check_batch(prob, batch_prob, _random_maps(prob, 0))
+        pool = batch_prob._solver_pool
+        assert pool is not None
+        assert sum(batch_prob._solver_iterations.values()) > 0
+        # the same pool solves the next batch and a copy of the problem doesn't take it
+        batch_prob._cache_size = 2001
+        _check_batch(prob, batch_prob, _random_maps(prob, 1))
+        assert batch_prob._solver_pool is pool
+        assert pickle.loads(pickle.dumps(batch_prob))._solver_pool is None
+        # changing the solver settings starts new workers
+        batch_prob._solver_power = 1000
+        batch_prob._cache_size = 2002
+        batch_prob.get_stats_batch(_random_maps(prob, 2))
+        assert batch_prob._solver_pool is not pool
+    finally:
+        batch_prob.close()
+    assert batch_prob._solver_pool is None
+
+class _DaemonProcess:
+    daemon = True
+
+def test_solver_pool_in_daemon(monkeypatch):
+    prob = PROBLEMS["sokoban"]()
+    batch_prob = PROBLEMS["sokoban"]()
+    batch_prob._cache_size = 3000
+    batch_prob._solver_workers = 2
+    # a daemon process can't start workers so it solves the levels itself
+    monkeypatch.setattr(sokoban_prob.multiprocessing, "current_process", lambda: _DaemonProcess())
+    _check_batch(prob, batch_prob, _random_maps(prob, 0))
+    assert batch_prob._solver_pool is None
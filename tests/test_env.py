@@ -0,0 +1,121 @@
+"""
+Tests that check the stepping shortcuts of the environment against plain steps on seeded
+random levels of every problem and representation
+"""
+import numpy as np
+import pytest
+from gym_tsxoa.envs.pcgrl_env import PcgrlEnv
+
+_ENVS = [(prob, rep) for prob in ["binary", "zelda", "sokoban"] for rep in ["narrow", "turtle", "wide"]]
+
+def _create_env(prob, rep, seed, exact_keys=False):
+    env = PcgrlEnv(prob, rep, exact_keys=exact_keys)
+    env.seed(seed)
+    env.reset()
+    return env
+
+@pytest.mark.parametrize("prob,rep", _ENVS)
+def test_zobrist_keys(prob, rep):
+    env = _create_env(prob, rep, 0)
+    # the same seed so the narrow representations visit the tiles in the same order
+    other = _create_env(prob, rep, 0, True)
+    rng = np.random.default_rng(0)
+    for _ in range(100):
+        env.step(rng.integers(env.get_number_action()), True, bool(rng.integers(2)))
+        assert env._rep._hash == env._rep._calc_hash()
+        # an observation without the hash recalculates it from the map
+        obs = env.get_observation(True)
+        del obs['hash']
+        other.set_observation(obs)
+        key, map_bytes = other.get_state_key()
+        assert key == env.get_state_key()
+        assert map_bytes == env._rep._map.tobytes()
+
+def _get_state(env):
+    return env._rep._map.copy(), env.get_state_key(), env._rep.get_cursor(), env._changes, env._iteration
+
+@pytest.mark.parametrize("prob,rep", _ENVS)
+def test_apply_revert(prob, rep):
+    env = _create_env(prob, rep, 0)
+    rng = np.random.default_rng(0)
+    for _ in range(20):
+        states = []
+        for _ in range(rng.integers(1, 8)):
+            states.append(_get_state(env))
+            env.apply(rng.integers(env.get_number_action()), True, bool(rng.integers(2)))
+        for map, key, cursor, changes, iteration in reversed(states):
+            env.revert()
+            assert np.array_equal(env._rep._map, map)
+            assert env.get_state_key() == key
+            assert env._rep._hash == env._rep._calc_hash()
+            assert env._rep.get_cursor() == cursor
+            assert (env._changes, env._iteration) == (changes, iteration)
+            # quick steps leave the stats stale so they are only compared after they are updated
+            assert env.get_observation()['rep_stats'] == env._prob.get_stats(map)
+        env.step(rng.integers(env.get_number_action()))
+
+"""
+Step a copy of the state with every action and return the results in the same order as evaluate_all_actions
+"""
+def _step_all(env, obs, actions):
+    heuristics, wins, dones, maps = [], [], [], []
+    for a in actions:
+        env.set_observation(obs)
+        new_obs, heuristic, win, done, _ = env.step(a)
+        heuristics.append(heuristic)
+        wins.append(win)
+        dones.append(done)
+        maps.append(new_obs['map'].copy())
+    env.set_observation(obs)
+    return heuristics, wins, dones, maps
+
+@pytest.mark.parametrize("prob,rep", _ENVS)
+def test_evaluate_all_actions(prob, rep):
+    env = _create_env(prob, rep, 0)
+    rng = np.random.default_rng(0)
+    for _ in range(5):
+        obs = env.get_observation(True)
+        actions = list(range(env.get_number_action()))
+        expected = _step_all(env, obs, actions)
+        heuristics, wins, dones, observations = env.evaluate_all_actions(True, True)
+        assert np.allclose(heuristics, expected[0])
+        assert np.array_equal(wins, expected[1])
+        assert np.array_equal(dones, expected[2])
+        for o, map in zip(observations, expected[3]):
+            assert np.array_equal(o['map'], map)
+        # the state is the same after evaluating all the actions
+        assert np.array_equal(env._rep._map, obs['map'])
+        assert env.get_state_key() == obs['key']
+        subset = rng.choice(actions, size=min(5, len(actions)), replace=False).tolist()
+        heuristics, _, _, _ = env.evaluate_all_actions(True, False, subset)
+        assert np.allclose(heuristics, [expected[0][a] for a in subset])
+        for _ in range(3):
+            env.step(rng.integers(env.get_number_action()))
+
+@pytest.mark.parametrize("prob,rep", _ENVS)
+def test_prune_actions(prob, rep):
+    env = _create_env(prob, rep, 0)
+    rng = np.random.default_rng(0)
+    visited = set()
+    for _ in range(5):
+        obs = env.get_observation(True)
+        # an action is kept when it is the first one to reach a new state that is not visited
+        expected_actions, expected_keys = [], []
+        seen = set([obs['key']])
+        for a in range(env.get_number_action()):
+            env.set_observation(obs)
+            env.step(a, True, True)
+            key = env.get_state_key()
+            if key not in seen and key not in visited:
+                seen.add(key)
+                expected_actions.append(a)
+                expected_keys.append(key)
+        env.set_observation(obs)
+        actions, keys = env.prune_actions(visited)
+        assert actions == expected_actions
+        assert keys == expected_keys
+        assert np.array_equal(env._rep._map, obs['map'])
+        assert env.get_state_key() == obs['key']
+        visited.update(keys[::2])
+        for _ in range(3):
+            env.step(rng.integers(env.get_number_action()))
@@ -0,0 +1,59 @@
+"""
+Tests that check the frontiers against a sorted list that removes the smallest priority first
+and the equal priorities in the order they were added
+"""
+import random
+import pytest
+from gym_tsxoa.envs.frontier import create_frontier
+
+"""
+A sorted list frontier that keeps at most size items, the slow version of all the frontiers
+"""
+class _ListFrontier:
+    def __init__(self, size=None):
+        self._size = size
+        self._entries = []
+        self._counter = 0
+
+    def push(self, priority, item):
+        self._entries.append((priority, self._counter, item))
+        self._entries.sort()
+        self._counter += 1
+        if self._size is not None and len(self._entries) > self._size:
+            # the worst entry is the largest priority and the last added among the equal ones
+            worst = max(self._entries, key=lambda e: (e[0], e[1]))
+            self._entries.remove(worst)
+
+    def pop(self):
+        return self._entries.pop(0)[2]
+
+    def __len__(self):
+        return len(self._entries)
+
+def _run(frontier, expected, seed, number=3000):
+    rng = random.Random(seed)
+    for i in range(number):
+        if rng.random() < 0.6 or len(expected) == 0:
+            priority = rng.randint(0, 20)
+            frontier.push(priority, i)
+            expected.push(priority, i)
+        else:
+            assert frontier.pop() == expected.pop()
+        assert len(frontier) == len(expected)
+    while len(expected) > 0:
+        assert frontier.pop() == expected.pop()
+
+@pytest.mark.parametrize("name", ["heap", "bucket"])
+@pytest.mark.parametrize("seed", range(3))
+def test_frontier(name, seed):
+    _run(create_frontier(name), _ListFrontier(), seed)
+
+@pytest.mark.parametrize("size", [1, 2, 7, 50])
+@pytest.mark.parametrize("seed", range(3))
+def test_beam_frontier(size, seed):
+    _run(create_frontier("beam", size), _ListFrontier(size), seed)
+
+@pytest.mark.parametrize("size", [None, 0])
+def test_beam_frontier_needs_size(size):
+    with pytest.raises(ValueError):
+        create_frontier("beam", size)
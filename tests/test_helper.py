@@ -0,0 +1,135 @@
+"""
+Parity tests that check the vectorized map helper functions against the original loop versions
+on seeded random maps of different sizes, tile counts and relative neighborhoods
+"""
+import numpy as np
+import pytest
+from gym_tsxoa.envs import helper
+
+"""
+The original loop versions of the helper functions
+"""
+def _old_get_tile_locations(map, tile_values):
+    tiles = {}
+    for t in tile_values:
+        tiles[t] = []
+    for y in range(len(map)):
+        for x in range(len(map[y])):
+            tiles[map[y][x]].append((x,y))
+    return tiles
+
+def _old_calc_dist_floor(map, x, y, types):
+    for dy in range(len(map)):
+        if y+dy >= len(map):
+            break
+        if map[y+dy][x] in types:
+            return dy-1
+    return len(map) - 1
+
+def _old_get_floor_dist(map, fromTypes, floorTypes):
+    result = 0
+    for y in range(len(map)):
+        for x in range(len(map[y])):
+            if map[y][x] in fromTypes:
+                result += _old_calc_dist_floor(map, x, y, floorTypes)
+    return result
+
+def _old_calc_group_value(map, x, y, types, relLocs):
+    result = 0
+    for l in relLocs:
+        nx, ny = x+l[0], y+l[1]
+        if nx < 0 or ny < 0 or nx >= len(map[0]) or ny >= len(map):
+            continue
+        if map[ny][nx] in types:
+            result += 1
+    return result
+
+def _old_get_type_grouping(map, types, relLocs, min, max):
+    result = 0
+    for y in range(len(map)):
+        for x in range(len(map[y])):
+            if map[y][x] in types:
+                value = _old_calc_group_value(map, x, y, types, relLocs)
+                if value >= min and value <= max:
+                    result += 1
+    return result
+
+def _old_get_changes(map, vertical=False):
+    start_y = 0
+    start_x = 0
+    if vertical:
+        start_y = 1
+    else:
+        start_x = 1
+    value = 0
+    for y in range(start_y, len(map)):
+        for x in range(start_x, len(map[y])):
+            same = False
+            if vertical:
+                same = map[y][x] == map[y-1][x]
+            else:
+                same = map[y][x] == map[y][x-1]
+            if not same:
+                value += 1
+    return value
+
+def _old_calc_certain_tile(map_locations, tile_values):
+    tiles=[]
+    for v in tile_values:
+        tiles.extend(map_locations[v])
+    return len(tiles)
+
+RELATIVE_LOCATIONS = [
+    [(-1,0), (1,0), (0,-1), (0,1)],
+    [(-1,-1), (1,1), (0,2), (3,0), (0,-1)],
+    [(0,9), (-20,0), (1,0), (1,0)]
+]
+
+"""
+Generate seeded random maps with a random subset of their tile values
+
+Parameters:
+    seed (int): the seed of the random generator
+    number (int): the number of maps
+
+Returns:
+    (numpy.uint8[][],int[],any[],numpy.random.Generator)[]: the map, its tile values, a subset of the tile values and the generator
+"""
+def _random_maps(seed, number=300):
+    rng = np.random.default_rng(seed)
+    for _ in range(number):
+        height, width = rng.integers(1, 12, 2)
+        num_tiles = int(rng.integers(1, 6))
+        map = rng.integers(0, num_tiles, (height, width)).astype(np.uint8)
+        subset = [int(v) for v in rng.choice(num_tiles, rng.integers(0, num_tiles + 1), replace=False)]
+        yield map, list(range(num_tiles)), subset, rng
+
+@pytest.mark.parametrize("seed", range(5))
+def test_get_tile_locations(seed):
+    for map, tile_values, _, _ in _random_maps(seed):
+        assert helper.get_tile_locations(map, tile_values) == _old_get_tile_locations(map, tile_values)
+
+@pytest.mark.parametrize("seed", range(5))
+def test_get_floor_dist(seed):
+    for map, tile_values, subset, rng in _random_maps(seed):
+        floor = [int(v) for v in rng.choice(len(tile_values), rng.integers(0, len(tile_values) + 1), replace=False)]
+        assert helper.get_floor_dist(map, subset, floor) == _old_get_floor_dist(map, subset, floor)
+
+@pytest.mark.parametrize("seed", range(5))
+def test_get_type_grouping(seed):
+    for i, (map, tile_values, subset, rng) in enumerate(_random_maps(seed)):
+        relLocs = RELATIVE_LOCATIONS[i % len(RELATIVE_LOCATIONS)]
+        low, high = sorted(int(v) for v in rng.integers(0, 5, 2))
+        assert helper.get_type_grouping(map, subset, relLocs, low, high) == _old_get_type_grouping(map, subset, relLocs, low, high)
+
+@pytest.mark.parametrize("seed", range(5))
+def test_get_changes(seed):
+    for map, _, _, _ in _random_maps(seed):
+        for vertical in [False, True]:
+            assert helper.get_changes(map, vertical) == _old_get_changes(map, vertical)
+
+@pytest.mark.parametrize("seed", range(5))
+def test_calc_certain_tile(seed):
+    for map, tile_values, subset, _ in _random_maps(seed):
+        map_locations = _old_get_tile_locations(map, tile_values)
+        assert helper.calc_certain_tile(map_locations, subset) == _old_calc_certain_tile(map_locations, subset)
@@ -0,0 +1,42 @@
+"""
+Tests that check the population operators of the optimization algorithms against plain steps of
+the environment on seeded random levels of every representation
+"""
+import numpy as np
+import pytest
+import OA
+from gym_tsxoa.envs.pcgrl_env import PcgrlEnv
+
+def _create_env(prob, rep, seed):
+    env = PcgrlEnv(prob, rep, exact_keys=False)
+    env.seed(seed)
+    env.reset()
+    return env
+
+@pytest.mark.parametrize("rep", ["narrow", "turtle", "wide"])
+@pytest.mark.parametrize("prob", ["binary", "zelda"])
+def test_mutate(prob, rep):
+    env = _create_env(prob, rep, 0)
+    pop = OA.Population(env, 10)
+    state = env._rep._random.bit_generator.state
+    maps, cursors = pop.mutate(env, pop.maps.copy(), pop.cursors)
+    # the same random actions stepped from every individual give the same maps and cursors
+    env._rep._random.bit_generator.state = state
+    for i in range(len(pop)):
+        obs = pop.get_chromosome(env, i).obs
+        env.set_observation(obs)
+        new_obs, _, _, _, _ = env.step(env._rep._random.integers(env.get_number_action()), False)
+        assert np.array_equal(maps[i], new_obs['map'])
+        assert cursors[i] == env._rep.get_cursor()
+
+@pytest.mark.parametrize("rep", ["narrow", "turtle", "wide"])
+def test_replace(rep):
+    env = _create_env("binary", rep, 0)
+    for point_mutation in [False, True]:
+        for algorithm in [OA.ES(env, point_mutation), OA.GA(env, point_mutation)]:
+            for _ in range(5):
+                algorithm.advance(env)
+            best = algorithm.get_best()
+            env.set_observation(best.obs)
+            assert best.fitness == env._prob.get_heuristic(env._prob.get_stats(env._rep._map), env._start_stats)
+            assert env._rep.get_cursor() == algorithm._pop.cursors[algorithm._pop.get_best(1)[0]]
@@ -0,0 +1,85 @@
+"""
+Tests that check the path metrics against breadth first search from every tile on seeded random maps
+"""
+import numpy as np
+import pytest
+from gym_tsxoa.envs.paths import PathMetrics, calc_distances, calc_diameters, calc_distances_batch, calc_diameters_batch
+from gym_tsxoa.envs.regions import label_regions
+
+def _bfs(map, x, y, passable_values):
+    height, width = map.shape
+    dist = np.full(map.shape, -1, dtype=np.int64)
+    if map[y][x] not in passable_values:
+        return dist
+    dist[y][x] = 0
+    queue = [(x, y)]
+    for (cx, cy) in queue:
+        for (dx, dy) in [(-1, 0), (1, 0), (0, -1), (0, 1)]:
+            nx, ny = cx + dx, cy + dy
+            if nx < 0 or ny < 0 or nx >= width or ny >= height:
+                continue
+            if dist[ny][nx] < 0 and map[ny][nx] in passable_values:
+                dist[ny][nx] = dist[cy][cx] + 1
+                queue.append((nx, ny))
+    return dist
+
+"""
+The exact diameter of every region indexed by the label using breadth first search from all the tiles
+"""
+def _all_pairs_diameters(map, passable_values):
+    num_regions, labels, _ = label_regions(map, passable_values)
+    diameters = [0] * (num_regions + 1)
+    for y in range(map.shape[0]):
+        for x in range(map.shape[1]):
+            if labels[y][x] > 0:
+                diameters[labels[y][x]] = max(diameters[labels[y][x]], int(_bfs(map, x, y, passable_values).max()))
+    return diameters
+
+def _random_maps(seed, number=60):
+    rng = np.random.default_rng(seed)
+    maps = []
+    for _ in range(number):
+        height, width = rng.integers(1, 15, size=2)
+        maps.append(rng.choice(3, size=(height, width), p=[0.5, 0.2, 0.3]))
+    return maps
+
+@pytest.mark.parametrize("seed", range(3))
+def test_distances(seed):
+    metrics = PathMetrics()
+    for map in _random_maps(seed):
+        x, y = map.shape[1] // 2, map.shape[0] // 2
+        expected = _bfs(map, x, y, [0, 2])
+        assert np.array_equal(metrics.distances(map, x, y, [0, 2]), expected)
+        assert np.array_equal(calc_distances(map, x, y, [0, 2]), expected)
+
+@pytest.mark.parametrize("seed", range(3))
+def test_exact_diameters(seed):
+    # one engine for all the shapes so the reused tables and buffers are checked too
+    metrics = PathMetrics()
+    for map in _random_maps(seed):
+        expected = _all_pairs_diameters(map, [0, 2])
+        assert list(metrics.diameters(map, [0, 2], True)[2]) == expected
+        assert list(calc_diameters(map, [0, 2], True)[2]) == expected
+
+@pytest.mark.parametrize("seed", range(3))
+def test_approximate_diameters(seed):
+    for map in _random_maps(seed):
+        expected = _all_pairs_diameters(map, [0, 2])
+        approximate = calc_diameters(map, [0, 2])[2]
+        # the double sweep is a lower bound that is at least half of the exact diameter
+        for a, e in zip(approximate, expected):
+            assert (e + 1) // 2 <= a <= e
+
+@pytest.mark.parametrize("exact", [False, True])
+@pytest.mark.parametrize("seed", range(3))
+def test_batch(exact, seed):
+    rng = np.random.default_rng(seed)
+    maps = rng.choice(3, size=(30, 8, 11), p=[0.5, 0.2, 0.3])
+    xs, ys = rng.integers(11, size=30), rng.integers(8, size=30)
+    distances = calc_distances_batch(maps, xs, ys, [0, 2])
+    counts, longest = calc_diameters_batch(maps, [0, 2], exact)
+    for i, map in enumerate(maps):
+        assert np.array_equal(distances[i], _bfs(map, xs[i], ys[i], [0, 2]))
+        num_regions, _, diameters = calc_diameters(map, [0, 2], exact)
+        assert counts[i] == num_regions
+        assert longest[i] == max(diameters)
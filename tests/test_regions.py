@@ -0,0 +1,70 @@
+"""
+Tests that check the region labeling against a flood fill on seeded random maps
+"""
+import numpy as np
+import pytest
+from gym_tsxoa.envs.regions import RegionLabeler, label_regions, label_regions_batch
+
+"""
+Label the regions with a flood fill from every unlabeled passable tile row by row, so the
+labels follow the order of the first tile of every region
+"""
+def _flood_fill(map, passable_values):
+    height, width = map.shape
+    labels = np.zeros(map.shape, dtype=np.int64)
+    num_regions = 0
+    for y in range(height):
+        for x in range(width):
+            if labels[y][x] > 0 or map[y][x] not in passable_values:
+                continue
+            num_regions += 1
+            labels[y][x] = num_regions
+            stack = [(x, y)]
+            while len(stack) > 0:
+                cx, cy = stack.pop()
+                for (dx, dy) in [(-1, 0), (1, 0), (0, -1), (0, 1)]:
+                    nx, ny = cx + dx, cy + dy
+                    if nx < 0 or ny < 0 or nx >= width or ny >= height:
+                        continue
+                    if labels[ny][nx] == 0 and map[ny][nx] in passable_values:
+                        labels[ny][nx] = num_regions
+                        stack.append((nx, ny))
+    return num_regions, labels
+
+def _random_maps(seed, number=100):
+    rng = np.random.default_rng(seed)
+    maps = []
+    for _ in range(number):
+        height, width = rng.integers(1, 15, size=2)
+        tiles = int(rng.integers(2, 5))
+        maps.append(rng.choice(tiles, size=(height, width)))
+    return maps
+
+@pytest.mark.parametrize("seed", range(5))
+def test_label_regions(seed):
+    # one labeler for all the shapes so the reused buffers are checked too
+    labeler = RegionLabeler()
+    for map in _random_maps(seed):
+        passable_values = [0, 2]
+        num_regions, labels = _flood_fill(map, passable_values)
+        for result in [labeler.label(map, passable_values), label_regions(map, passable_values)]:
+            assert result[0] == num_regions
+            assert np.array_equal(result[1], labels)
+            assert np.array_equal(result[2], np.bincount(labels.reshape(-1), minlength=num_regions + 1))
+
+@pytest.mark.parametrize("seed", range(5))
+def test_label_regions_batch(seed):
+    rng = np.random.default_rng(seed)
+    maps = rng.choice(3, size=(40, 7, 9))
+    counts, labels = label_regions_batch(maps, [0, 1])
+    seen = set()
+    for i, map in enumerate(maps):
+        used = set(labels[i][labels[i] > 0].tolist())
+        assert len(used & seen) == 0
+        seen |= used
+        num_regions, expected = _flood_fill(map, [0, 1])
+        assert counts[i] == num_regions
+        # the labels are unique across the maps so only the grouping of the tiles is compared
+        assert np.array_equal(labels[i] > 0, expected > 0)
+        pairs = set(zip(labels[i].reshape(-1).tolist(), expected.reshape(-1).tolist()))
+        assert len(pairs) == len(set(l for l, _ in pairs)) == len(set(e for _, e in pairs))
@@ -0,0 +1,70 @@
+"""
+Tests that check the sokoban solvers on seeded random small levels
+"""
+import numpy as np
+import pytest
+from gym_tsxoa.envs.probs.sokoban.engine import State, BitState, BFSAgent, PushAgent, directions
+from gym_tsxoa.envs.probs.sokoban.cache import get_solver_cache, encode_solution, decode_solution
+from gym_tsxoa.envs.probs.sokoban import deadlock
+
+"""
+Random levels surrounded by walls with one player and the same number of crates and targets
+"""
+def _random_levels(seed, number=60, size=5):
+    rng = np.random.default_rng(seed)
+    levels = []
+    for _ in range(number):
+        level = rng.choice(np.array([" ", " ", " ", "#"]), size=(size, size))
+        tiles = rng.permutation(size * size)[:5]
+        crates = int(rng.integers(1, 3))
+        level.flat[tiles[0]] = "@"
+        level.flat[tiles[1:1+crates]] = "$"
+        level.flat[tiles[3:3+crates]] = "."
+        lines = ["#" * (size + 2)] + ["#" + "".join(row) + "#" for row in level] + ["#" * (size + 2)]
+        levels.append(lines)
+    return levels
+
+def _play(lines, solution):
+    state = State()
+    state.stringInitialize(lines)
+    for d in solution:
+        state.update(d["x"], d["y"])
+    return state.checkWin()
+
+@pytest.mark.parametrize("seed", range(3))
+def test_push_solution_length(seed):
+    for lines in _random_levels(seed):
+        state = State()
+        state.stringInitialize(lines)
+        sol, node, iterations = BFSAgent().getSolution(state)
+        bitState = BitState()
+        bitState.stringInitialize(lines)
+        pushSol, pushNode, pushIterations = PushAgent().getSolution(bitState)
+        assert node.checkWin() == pushNode.checkWin()
+        if node.checkWin():
+            assert len(pushSol) == len(sol)
+            assert _play(lines, pushSol)
+
+def test_decode_solution():
+    solution = [directions[i] for i in [0, 3, 3, 1, 2]]
+    decoded = decode_solution(encode_solution(solution))
+    assert decoded == solution
+    # the decoded directions are copies so changing them keeps the engine directions
+    decoded[0]["x"] = 5
+    assert directions[0] == {"x": -1, "y": 0}
+
+def test_get_solver_cache():
+    assert get_solver_cache(10) is get_solver_cache(10)
+    assert get_solver_cache(10) is not get_solver_cache(20)
+    assert get_solver_cache(20)._size == 20
+
+def test_frozen_crates_are_dropped_when_a_check_fails():
+    # the right crate is frozen while the left one stands as a wall, but the left one can move up
+    lines = ["######", "#..###", "# $$ #", "#@  ##", "######"]
+    state = BitState()
+    state.stringInitialize(lines)
+    left, right = sorted(state.getCrates())
+    frozen = []
+    assert not deadlock._isFrozen(state.board, state.crates, left, 0, frozen)
+    assert frozen == []
+    assert not deadlock.checkFreezeDeadlock(state.board, state.crates, left)
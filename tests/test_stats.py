@@ -0,0 +1,68 @@
+"""
+Tests that check the stats after single tile changes against calculating the stats of the
+changed map from scratch on seeded random maps of every problem
+"""
+import numpy as np
+import pytest
+from gym_tsxoa.envs import helper
+from gym_tsxoa.envs.probs import PROBLEMS
+
+# the number of every tile that the playable maps of a problem have
+_PLAYABLE_TILES = {
+    "binary": {},
+    "zelda": {2: 1, 3: 1, 4: 1, 5: 1},
+    "sokoban": {2: 1, 3: 2, 4: 2}
+}
+
+"""
+Random single tile changes of seeded random maps, every change is the map before the change,
+the map after the change and the (x, y, old, new) change. Half of the maps have the tile counts
+of a playable map so the path and solver stats are calculated too.
+"""
+def _random_changes(prob, seed, number=100, playable_tiles={}):
+    rng = np.random.default_rng(seed)
+    tiles = len(prob.get_tile_types())
+    values = np.array(list(prob._prob.values()))
+    changes = []
+    for i in range(number):
+        map = rng.choice(tiles, size=(prob._height, prob._width), p=values / values.sum())
+        if i % 2 == 0 and len(playable_tiles) > 0:
+            # a few solid tiles so most of these maps are a single region
+            map = rng.choice(2, size=(prob._height, prob._width), p=[0.85, 0.15])
+            locations = rng.permutation(map.size)
+            for t, count in playable_tiles.items():
+                map.flat[locations[:count]] = t
+                locations = locations[count:]
+        x, y = int(rng.integers(prob._width)), int(rng.integers(prob._height))
+        old, new = int(map[y][x]), int(rng.integers(tiles))
+        changed = map.copy()
+        changed[y][x] = new
+        changes.append((map, changed, (x, y, old, new)))
+    return changes
+
+@pytest.mark.parametrize("seed", range(3))
+def test_calc_num_regions_delta(seed):
+    for map, changed, (x, y, old, new) in _random_changes(PROBLEMS["binary"](), seed, 300):
+        before = helper.calc_num_regions(map, None, [0])
+        after = helper.calc_num_regions(changed, None, [0])
+        cache = helper.get_regions_cache(map, [0])
+        assert helper.calc_num_regions_delta(changed, before, x, y, old, new, [0], cache) == after
+        # without the cache the local check either gets the right value or gives up
+        assert helper.calc_num_regions_delta(changed, before, x, y, old, new, [0]) in [after, None]
+
+@pytest.mark.parametrize("seed", range(3))
+def test_calc_longest_path_delta(seed):
+    for map, changed, (x, y, old, new) in _random_changes(PROBLEMS["binary"](), seed, 300):
+        before = helper.calc_longest_path(map, None, [0])
+        cache = helper.get_regions_cache(map, [0], True)
+        assert helper.calc_longest_path_delta(changed, before, x, y, old, new, [0], cache) == helper.calc_longest_path(changed, None, [0])
+
+@pytest.mark.parametrize("name", ["binary", "zelda", "sokoban"])
+@pytest.mark.parametrize("seed", range(2))
+def test_get_stats_delta(name, seed):
+    prob = PROBLEMS[name]()
+    for map, changed, (x, y, old, new) in _random_changes(prob, seed, 100, _PLAYABLE_TILES[name]):
+        old_stats = prob.get_stats(map)
+        expected = prob.get_stats(changed)
+        for cache in [None, prob.get_stats_cache(map)]:
+            assert prob.get_stats_delta(changed, old_stats, x, y, old, new, cache) == expected